@@ -0,0 +1,54 @@
+"""
+memory used per Node for the slotted models in osm_util against the former __dict__ based ones
+
+python benchmarks/bench_models.py [count]
+"""
+import os
+import sys
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pyosmapi.osm_util import Node  # noqa: E402
+
+
+class DictElement:
+    def __init__(self, eid, version, changeset, user, uid, created, visible, tags):
+        self._id = eid
+        self.tags = tags or {}
+        self.version = version
+        self.changeset = changeset
+        self.user = user
+        self.uid = uid
+        self.created = created
+        self.visible = visible
+        self.e_type = 'element'
+
+
+class DictNode(DictElement):
+    def __init__(self, eid, lat, lon, version, changeset, user, uid, created, visible, tags):
+        super().__init__(eid, version, changeset, user, uid, created, visible, tags)
+        self.lat = lat
+        self.lon = lon
+        self.e_type = 'node'
+
+
+def measure(cls, count: int) -> float:
+    created = datetime(2020, 1, 1)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    elems = [cls(str(i), '52.5', '13.4', 1, '5', 'user', '7', created, True, {}) for i in range(count)]
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del elems
+    return used / count
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    old = measure(DictNode, count)
+    new = measure(Node, count)
+    print(f'{count} nodes')
+    print(f'__dict__ models: {old:8.1f} bytes/element')
+    print(f'__slots__ models: {new:7.1f} bytes/element')
+    print(f'reduction: {old - new:.1f} bytes/element ({100 * (old - new) / old:.0f}%)')
@@ -0,0 +1,58 @@
+"""
+element parser throughput with strptime (former parser) against the shared timestamp decoder and lazy elements
+
+python benchmarks/bench_parser.py [count]
+"""
+import os
+import sys
+import time
+import xml.etree.ElementTree as ElemTree
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pyosmapi import osm_parser  # noqa: E402
+
+NODE = '<node id="{0}" visible="true" version="3" changeset="5" timestamp="2020-01-{1:02d}T10:11:{2:02d}Z" ' \
+       'user="user" uid="7" lat="52.5" lon="13.4"><tag k="amenity" v="bench"/></node>'
+
+
+def strptime_timestamp(value, timestamps='datetime'):
+    if value is None:
+        return value
+    if value.endswith('UTC'):
+        return datetime.strptime(value, "%Y-%m-%d %H:%M:%S UTC")
+    return datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ")
+
+
+def run(tree, timestamps: str, lazy: bool = False) -> float:
+    start = time.perf_counter()
+    for sub in tree:
+        osm_parser.parse_elem(sub, timestamps, lazy)
+    return time.perf_counter() - start
+
+
+def run_lazy_ids(tree) -> float:
+    start = time.perf_counter()
+    for sub in tree:
+        osm_parser.parse_elem(sub, lazy=True).id
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    xml = '<osm>' + ''.join(NODE.format(i, i % 28 + 1, i % 60) for i in range(count)) + '</osm>'
+    tree = ElemTree.fromstring(xml)
+    print(f'{count} nodes')
+
+    decoder = osm_parser.convert_timestamp
+    osm_parser.convert_timestamp = strptime_timestamp
+    before = run(tree, 'datetime')
+    osm_parser.convert_timestamp = decoder
+    print(f'{"before (strptime)":<20}{count / before:10.0f} elements/s')
+    for mode in ('datetime', 'epoch', 'raw'):
+        after = run(tree, mode)
+        print(f'{"after (" + mode + ")":<20}{count / after:10.0f} elements/s  x{before / after:.2f}')
+    lazy = run(tree, 'datetime', True)
+    print(f'{"lazy":<20}{count / lazy:10.0f} elements/s  x{before / lazy:.2f}')
+    lazy = run_lazy_ids(tree)
+    print(f'{"lazy (id only)":<20}{count / lazy:10.0f} elements/s  x{before / lazy:.2f}')
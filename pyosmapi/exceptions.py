@@ -24,3 +24,14 @@ class NoneFoundError(ValueError):
 class NotAuthorizedError(Exception):
     def __init__(self, message):
         self.message = message
+
+
+class LimitExceededError(ValueError):
+    def __init__(self, message):
+        self.message = message
+
+
+class RateLimitError(Exception):
+    def __init__(self, message, retry_after=None):
+        self.message = message
+        self.retry_after = retry_after
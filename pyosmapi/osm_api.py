@@ -1,8 +1,21 @@
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
 from http import HTTPStatus
 import logging
+import os
+import time
+from urllib.parse import urlsplit
 import xml.etree.ElementTree as ElemTree
 from pyosmapi.osm_util import *
+from pyosmapi.osm_parser import *
+from pyosmapi.osm_cache import VersionCache, ConditionalCache
+from pyosmapi.osm_ratelimit import RateLimiter, THROTTLE_STATUS, parse_retry_after, replayable
+from pyosmapi.osm_retry import RetryPolicy
+from pyosmapi.osm_bulk import BulkUpload, ChangesetSession
+from pyosmapi.osm_tiles import TileSweep, bbox_refused, check_bbox
+from pyosmapi.osm_graph import RelationResolver
+from pyosmapi.osm_gpx import TrackPoints, MultipartStream, harvest_pages
 from pyosmapi.exceptions import *
 
 logger = logging.getLogger(__name__)
@@ -17,10 +30,43 @@ class OsmApi:
             self.base_url = 'https://api.openstreetmap.org/api/0.6'
     :param instance: keywords dev and main are mapped to the official osm.org  or set a custom url
     :param url_extension: path to the api defaults to '/api/6.0'
+    :param session: requests.Session to send all calls through, share one session between several instances
+        to share its connection pool. If omitted a new session with keep-alive connections is created.
+    :param pool_size: max. connections kept alive per host, only used when no session is provided
+    :param timestamps: 'datetime' decodes timestamps while parsing, 'raw' keeps the strings and
+        'epoch' int seconds until the attribute is first accessed
+    :param lazy: elements keep the parsed xml and decode each attribute on first access
+    :param version_cache: VersionCache consulted by history_version_element before the network,
+        filled by history_version_element and history_element
+    :param conditional_cache: ConditionalCache revalidating get_element, get_changeset, get_note and get_user
+        with ETag / If-Modified-Since, a 304 returns the previously parsed object
+    :param capabilities_ttl: seconds get_api_capabilities answers from its cache
+    :param preflight: check requests against the server limits from the capabilities before sending them
+    :param rate_limiter: RateLimiter every request waits for, share one between instances to share the allowance.
+        Throttled requests (429 / 509) are sent again after Retry-After, except bodies that can only be read once
+        (OsmChange of generators, GPX from a pipe) which raise RateLimitError with retry_after instead.
+    :param retry_policy: RetryPolicy for transient failures, writes are only resent if they never reached the server
     """
 
-    def __init__(self, instance: str = "dev", url_extension: str = "/api/0.6"):
+    def __init__(self, instance: str = "dev", url_extension: str = "/api/0.6",
+                 session: requests.Session = None, pool_size: int = 10, timestamps: str = 'datetime',
+                 lazy: bool = False, version_cache: VersionCache = None,
+                 conditional_cache: ConditionalCache = None, capabilities_ttl: float = 3600,
+                 preflight: bool = True, rate_limiter: RateLimiter = None, retry_policy: RetryPolicy = None):
         self.url_extension = url_extension
+        self.timestamps = timestamps
+        self.lazy = lazy
+        self.version_cache = version_cache
+        self.conditional_cache = conditional_cache
+        self.capabilities_ttl = capabilities_ttl
+        self.preflight = preflight
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy
+        self.__capabilities = None
+        self.__capabilities_time = 0.0
+        self.__preflight_paused = 0.0
+        self._own_session = session is None
+        self.session = session or self.create_session(pool_size)
         if instance.lower() == "main":
             self.base_url = DEFAULT_OSM_URL
             logger.info('Using osm main api')
@@ -31,33 +77,59 @@ class OsmApi:
             self.base_url = instance
             logger. info(f'Using custom instance: {instance}{url_extension}')
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @staticmethod
+    def create_session(pool_size: int = 10) -> requests.Session:
+        """
+        creates a session keeping up to pool_size connections per host alive
+
+        :param pool_size: max. connections kept alive per host
+        :returns: session to be passed to one or more OsmApi instances
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def close(self):
+        """
+        closes all pooled connections, a session passed in by the caller is left open
+        """
+        if self._own_session:
+            self.session.close()
+
     def get_api_versions(self):
         """
         :returns: supported API versions
         """
-        data = requests.get(self.base_url + '/api/versions')
+        data = self.__request('GET', self.base_url + '/api/versions')
         if data.ok:
             return ElemTree.fromstring(data.text).find('api/version').text
         self.__more_error(data)
 
-    def get_api_capabilities(self) -> dict:
+    def get_api_capabilities(self, refresh: bool = False) -> dict:
         """
         Max / Min values
         image blacklisting
+        fetched once and kept for capabilities_ttl seconds
+        :param refresh: fetch even if the cached capabilities are still valid
         :returns:
         """
+        if not refresh and self.__capabilities is not None and \
+                time.monotonic() - self.__capabilities_time < self.capabilities_ttl:
+            return self.__capabilities
         # allowed by convenience with version
-        data = requests.get(self.base_url + self.url_extension + '/capabilities')
+        data = self.__request('GET', self.base_url + self.url_extension + '/capabilities')
         if data.ok:
-            tree = ElemTree.fromstring(data.text)
-            capability = {}
-            for item in tree.find('api').iter():
-                capability[item.tag] = item.attrib
-            blacklist = []
-            for item in tree.findall('policy/imagery/blacklist'):
-                blacklist.append(item.get('regex'))
-            capability['image_blacklist'] = blacklist
-            return capability
+            self.__capabilities = parse_capabilities(data.text)
+            self.__capabilities_time = time.monotonic()
+            return self.__capabilities
         self.__more_error(data)
 
     def get_permissions(self, auth) -> set:
@@ -67,13 +139,9 @@ class OsmApi:
         :param auth: either OAuth1 object or tuple (username, password)
         :returns: set of all current permissions
         """
-        data = requests.get(self.base_url + self.url_extension + '/permissions', auth=auth)
+        data = self.__request('GET', self.base_url + self.url_extension + '/permissions', auth=auth)
         if data.ok:
-            tree = ElemTree.fromstring(data.text)
-            permissions = set()
-            for item in tree.findall('permissions/permission'):
-                permissions.add(item.get('name'))
-            return permissions if len(permissions) else None
+            return parse_permissions(data.text)
         self.__more_error(data)
 
     ############################################### CHANGESET #######################################################
@@ -87,16 +155,10 @@ class OsmApi:
         :param auth: either OAuth1 object or tuple (username, password)
         :returns: changeset ID
         """
-        root = ElemTree.Element('osm')
-        cs = ElemTree.SubElement(root, 'changeset')
-        try:
-            self.__kv_serial(tags, cs)
-        except AttributeError:
-            pass
-        xml = ElemTree.tostring(root)
+        xml = serial_changeset(tags)
 
         logger.debug(xml)
-        data = requests.put(self.base_url + self.url_extension + '/changeset/create', data=xml, auth=auth)
+        data = self.__request('PUT', self.base_url + self.url_extension + '/changeset/create', data=xml, auth=auth)
         if data.ok:
             return int(data.text)
         elif data.status_code == HTTPStatus.BAD_REQUEST:
@@ -116,11 +178,13 @@ class OsmApi:
         url = self.base_url + self.url_extension + '/changeset/{}'.format(cid)
         if discussion:
             url += '?include_discussion=True'
-        data = requests.get(url)
+        data, cached = self.__conditional_get(url)
+        if cached is not None:
+            return cached
         if data.ok:
             logger.debug(data.text)
             tree = ElemTree.fromstring(data.text).find('changeset')
-            return self.__changeset_parser(tree)
+            return self.__remember(url, data, changeset_parser(tree, self.timestamps))
         self.__more_error(data)
 
     def edit_changeset(self, changeset: ChangeSet, auth):
@@ -132,13 +196,10 @@ class OsmApi:
         :raises NoneFoundError: no changeset of that ID
         :raises ConflictError: other user than creator trying to use changeset / or changeset already closed.
         """
-        root = ElemTree.Element('osm')
-        cs = ElemTree.SubElement(root, 'changeset')
-        self.__kv_serial(changeset.tags, cs)
-        xml = ElemTree.tostring(root)
+        xml = serial_changeset(changeset.tags)
 
-        data = requests.put(self.base_url + self.url_extension + '/changeset/{}'.format(changeset.id),
-                            data=xml, auth=auth)
+        data = self.__request('PUT', self.base_url + self.url_extension + '/changeset/{}'.format(changeset.id),
+                              data=xml, auth=auth)
         if data.ok:
             return None
         elif data.status_code == HTTPStatus.CONFLICT:
@@ -155,7 +216,7 @@ class OsmApi:
         :raises NoneFoundError: no changeset of that ID
         :raises ConflictError: other user than creator trying to use changeset / or changeset already closed.
         """
-        data = requests.get(self.base_url + self.url_extension + '/changeset/{}/close'.format(cid), auth=auth)
+        data = self.__request('PUT', self.base_url + self.url_extension + '/changeset/{}/close'.format(cid), auth=auth)
         if data.ok:
             return None
         elif data.status_code == HTTPStatus.CONFLICT:
@@ -169,11 +230,43 @@ class OsmApi:
         :param cid: changeset ID
         :raises NoneFoundError: no changeset of that ID
         """
-        data = requests.get(self.base_url + self.url_extension + '/changeset/{}/download'.format(cid))
+        data = self.__request('GET', self.base_url + self.url_extension + '/changeset/{}/download'.format(cid))
         if data.ok:
             return data.text
         self.__more_error(data)
 
+    def iter_changeset(self, cid: int, summary: ChangeSummary = None):
+        """
+        downloads a OsmChange document, streamed.
+        Elements are parsed while the response is read, memory stays flat no matter the size of the changeset.
+
+        :param cid: changeset ID
+        :param summary: ChangeSummary updated with every yielded element
+        :returns: generator of (action, Element) with action 'create', 'modify' or 'delete'
+        :raises NoneFoundError: no changeset of that ID
+        """
+        data = self.__request('GET', self.base_url + self.url_extension + '/changeset/{}/download'.format(cid),
+                              stream=True)
+        with data:
+            if not data.ok:
+                self.__more_error(data)
+            data.raw.decode_content = True
+            depth = 0
+            block = None
+            for event, elem in ElemTree.iterparse(data.raw, events=('start', 'end')):
+                if event == 'start':
+                    if depth == 1:
+                        block = elem
+                    depth += 1
+                    continue
+                depth -= 1
+                if depth == 2 and elem.tag in ('node', 'way', 'relation'):
+                    item = parse_elem(elem, self.timestamps, self.lazy)
+                    if summary is not None:
+                        summary.update(block.tag, item)
+                    yield block.tag, item
+                    block.remove(elem)
+
     def get_changesets(self, bbox: tuple = None, user: str = '', time: datetime = None,
                        is_open: bool = False, is_closed: bool = False, changesets: list = None) -> list:
         """
@@ -198,7 +291,7 @@ class OsmApi:
             else:
                 params['display_name'] = user
         if time:
-            params['time'] = ','.join(map(str, time.isoformat()))
+            params['time'] = time.isoformat()
         if is_open ^ is_closed:
             if is_open:
                 params['open'] = True
@@ -207,13 +300,13 @@ class OsmApi:
         if changesets:
             params['changesets'] = ','.join(map(str, changesets))
 
-        data = requests.get(self.base_url + self.url_extension + '/changesets', params=params)
+        data = self.__request('GET', self.base_url + self.url_extension + '/changesets', params=params)
         if data.ok:
             tree = ElemTree.fromstring(data.text)
             logger.debug(data.text)
             cs = []
             for sub in tree.findall('changeset'):
-                cs.append(self.__changeset_parser(sub))
+                cs.append(changeset_parser(sub, self.timestamps))
             return cs
         elif data.status_code == HTTPStatus.BAD_REQUEST:
             raise ValueError(data.text)
@@ -240,51 +333,59 @@ class OsmApi:
 
         :param cid: changeset id
         :type cid: int/str
-        :param xml: OsmChange document as a String
+        :param xml: OsmChange document as a String, or an OsmChange / iterable of bytes streamed with
+            chunked transfer encoding
         :param auth: either OAuth1 object or tuple (username, password)
         :returns: list with dict {type, old_id, new_id, new_version}
-        """
-        data = requests.post(self.base_url + self.url_extension + '/changeset/{}/upload'.format(cid),
-                             data=xml, auth=auth)
+        :raises LimitExceededError: more elements than a changeset takes, or a way / relation over its limit.
+            An OsmChange with generator blocks is checked while it is sent, the upload is then aborted.
+        """
+        if self.preflight and isinstance(xml, (str, bytes)):
+            self.__check_diff(xml)
+        elif self.preflight and isinstance(xml, OsmChange):
+            self.__check_change(xml)
+        # without a content type OAuth1 reads the body as form parameters before it is sent
+        headers = None if isinstance(xml, str) else {'Content-Type': 'text/xml'}
+        data = self.__request('POST', self.base_url + self.url_extension + '/changeset/{}/upload'.format(cid),
+                              data=xml, auth=auth, headers=headers)
         if data.ok:
-            changes = []
-            tree = ElemTree.fromstring(data.text)
-            for item in tree.iter():
-                item: ElemTree.Element
-                line = {'type': item.tag, 'old_id': item.get('old_id')}
-                if item.get('new_id'):
-                    line['new_id'] = item.get('new_id')
-                    line['new_version'] = item.get('new_version')
-                changes.append(line)
-            return changes
+            return parse_diff_result(data.text)
         elif data.status_code == HTTPStatus.BAD_REQUEST:
             raise ParseError(data.text)
         elif data.status_code == HTTPStatus.CONFLICT:
             raise ConflictError(data.text)
         self.__more_error(data)
 
-    def __changeset_parser(self, tree: ElemTree):
-        tags = self.__kv_parser(tree.findall('tag'))
-        cs_prop = {}
-        for key in tree.keys():
-            cs_prop[key] = tree.get(key)
+    def bulk_upload(self, tags: dict, auth, create=(), modify=(), delete=(), chunk_size: int = None) -> dict:
+        """
+        uploads any number of changes in dependency ordered diff uploads, opening and closing changesets
+        as their element limit requires. Placeholder ids referenced across chunks are replaced by the new ids.
+        To resume after a failed chunk use BulkUpload directly and call run() again.
+        Authorisation required
+
+        :param tags: tags of every opened changeset
+        :param auth: either OAuth1 object or tuple (username, password)
+        :param create: Elements with negative placeholder ids
+        :param modify: Elements carrying their current version
+        :param delete: Elements carrying their current version
+        :param chunk_size: elements per diff upload, defaults to the changeset limit
+        :returns: {(e_type, placeholder id): (new id, new version)}
+        """
+        return BulkUpload(self, tags, auth, create, modify, delete, chunk_size).run()
 
-        com_xml = tree.findall('discussion/comment')
-        comments = []
-        for com in com_xml:
-            comments.append(Comment(com.find('text').text, com.get('uid'), com.get('user'), com.get('date')))
-        try:
-            bbox = cs_prop['min_lon'], cs_prop['min_lat'], cs_prop['max_lon'], cs_prop['max_lat']
-        except KeyError:
-            bbox = (None, None, None, None)
-        created = datetime.strptime(cs_prop['created_at'], "%Y-%m-%dT%H:%M:%SZ")
-        if cs_prop['created_at'] is True:
-            closed = None
-        else:
-            closed = datetime.strptime(cs_prop['closed_at'], "%Y-%m-%dT%H:%M:%SZ")
-        ch_set = ChangeSet(cs_prop['id'], cs_prop['user'], cs_prop['uid'], created,
-                           cs_prop['open'], bbox, closed, tags, comments)
-        return ch_set
+    def changeset_session(self, tags: dict, auth, max_pending: int = 1000,
+                          max_delay: float = 60.0) -> ChangesetSession:
+        """
+        buffers create / edit / delete and uploads them in diff uploads, use as context manager
+        Authorisation required
+
+        :param tags: tags of the opened changeset
+        :param auth: either OAuth1 object or tuple (username, password)
+        :param max_pending: buffered changes that trigger an upload
+        :param max_delay: seconds after which buffered changes are uploaded
+        :returns: ChangesetSession
+        """
+        return ChangesetSession(self, tags, auth, max_pending, max_delay)
 
     def comm_changeset(self, cid: int, text: str, auth) -> ChangeSet:
         """
@@ -298,12 +399,12 @@ class OsmApi:
         :raises ValueError: no textfield present
         :raises ConflictError: deleted
         """
-        data = requests.post(self.base_url + self.url_extension + '/changeset/{}/comment'.format(str(cid)),
-                             data={'text': text}, auth=auth)
+        data = self.__request('POST', self.base_url + self.url_extension + '/changeset/{}/comment'.format(str(cid)),
+                              data={'text': text}, auth=auth)
         logger.debug(data.text)
         if data.ok:
             tree = ElemTree.fromstring(data.text).find('changeset')
-            return self.__changeset_parser(tree)
+            return changeset_parser(tree, self.timestamps)
         elif data.status_code == HTTPStatus.BAD_REQUEST:
             raise ValueError(data.text)
         elif data.status_code == HTTPStatus.CONFLICT:
@@ -320,10 +421,11 @@ class OsmApi:
         :returns: ChangeSet just subscribed
         :raises ConflictError: already subscribed
         """
-        data = requests.post(self.base_url + self.url_extension + '/changeset/{}/subscribe'.format(cid), auth=auth)
+        data = self.__request('POST', self.base_url + self.url_extension + '/changeset/{}/subscribe'.format(cid),
+                              auth=auth)
         if data.ok:
             tree = ElemTree.fromstring(data.text).find('changeset')
-            return self.__changeset_parser(tree)
+            return changeset_parser(tree, self.timestamps)
         elif data.status_code == HTTPStatus.CONFLICT:
             raise ConflictError(data.text)
         self.__more_error(data)
@@ -337,10 +439,11 @@ class OsmApi:
         :param auth: either OAuth1 object or tuple (username, password)
         :raises NoneFoundError: is not subscribed
         """
-        data = requests.post(self.base_url + self.url_extension + '/changeset/{}/unsubscribe'.format(cid), auth=auth)
+        data = self.__request('POST', self.base_url + self.url_extension + '/changeset/{}/unsubscribe'.format(cid),
+                              auth=auth)
         if data.ok:
             tree = ElemTree.fromstring(data.text).find('changeset')
-            return self.__changeset_parser(tree)
+            return changeset_parser(tree, self.timestamps)
         self.__more_error(data)
 
     ############################################## ELEMENT #########################################################
@@ -362,10 +465,13 @@ class OsmApi:
             - When changeset already closed
             - When changeset creator and element creator different
         :raises ParseError: When a way/relation has nodes that do not exist or are not visible
+        :raises LimitExceededError: a way / relation over the limits of the capabilities, nothing is sent
         """
+        self.__check_elem(elem)
         elem.changeset = cid
-        xml = self.__serial_elem(elem, True)
-        data = requests.get(self.base_url + self.url_extension + '/{}/create'.format(elem.e_type), data=xml, auth=auth)
+        xml = serial_elem(elem, True)
+        data = self.__request('PUT', self.base_url + self.url_extension + '/{}/create'.format(elem.e_type),
+                              data=xml, auth=auth)
         if data.ok:
             return int(data.text)
         elif data.status_code == HTTPStatus.BAD_REQUEST:
@@ -386,73 +492,18 @@ class OsmApi:
         :raises NoneFoundError: No Element with such id
         :raises LockupError: Deleted Element
         """
-        data = requests.get(self.base_url + self.url_extension + '/{}/{}'.format(e_type, eid))
+        url = self.base_url + self.url_extension + '/{}/{}'.format(e_type, eid)
+        data, cached = self.__conditional_get(url)
+        if cached is not None:
+            return cached
         if data.ok:
             tree = ElemTree.fromstring(data.text)
             logger.debug(data.text)
-            return self.__parse_elem(tree[0])
+            return self.__remember(url, data, parse_elem(tree[0], self.timestamps, self.lazy))
         elif data.status_code == HTTPStatus.GONE:
             raise LookupError(data.text)
         self.__more_error(data)
 
-    def __parse_elem(self, elem: ElemTree.Element):
-        eid = elem.get('id')
-        version = int(elem.get('version'))
-        changeset = elem.get('changeset')
-        cr_date = datetime.strptime(elem.get('timestamp'), "%Y-%m-%dT%H:%M:%SZ")
-        user = elem.get('user')
-        uid = elem.get('uid')
-        visible = bool(elem.get('visible'))
-        lat = elem.get('lat')  # lan & lon only type node
-        lon = elem.get('lon')
-
-        nodes = []
-        for node in elem.findall('nd'):
-            nodes.append(node.get('ref'))
-
-        members = []
-        for member in elem.findall('member'):
-            mem = {}
-            for item in member.keys():
-                mem[item] = member.get(item)
-            members.append(mem)
-
-        if elem.tag == 'node':
-            return Node(eid, lat, lon, version, changeset, user, uid, cr_date, visible,
-                        self.__kv_parser(elem.findall('tag')))
-        elif elem.tag == 'way':
-            return Way(eid, nodes, version, changeset, user, uid, cr_date, visible,
-                       self.__kv_parser(elem.findall('tag')))
-        elif elem.tag == 'relation':
-            return Relation(eid, members, version, changeset, user, uid, cr_date, visible,
-                            self.__kv_parser(elem.findall('tag')))
-        return elem
-
-    def __serial_elem(self, elem: Element, is_create: bool = False) -> str:
-        root = ElemTree.Element('osm')
-        doc = ElemTree.Element('None')
-        if not is_create:
-            params = {'id': elem.id, 'version': str(elem.version), 'changeset': str(elem.changeset),
-                      'user': elem.user, 'uid': str(elem.uid),
-                      'visible': str(elem.visible), 'timestamp': elem.created}
-        else:
-            params = {'changeset': str(elem.changeset)}
-        if isinstance(elem, Node):
-            params['lat'] = str(elem.lat)
-            params['lon'] = str(elem.lon)
-            doc = ElemTree.SubElement(root, "node", params)
-        elif isinstance(elem, Way):
-            doc = ElemTree.SubElement(root, "way", params)
-            for ref in elem.nodes:
-                ElemTree.SubElement(doc, 'nd', {'ref': ref})
-        elif isinstance(elem, Relation):
-            doc = ElemTree.SubElement(root, "relation", params)
-            for member in elem.members:
-                ElemTree.SubElement(doc, 'member', member)
-        self.__kv_serial(elem.tags, doc)
-
-        return ElemTree.tostring(root).decode()
-
     def edit_element(self, elem: Element, cid: int, auth) -> int:
         """
         change tags/position of element
@@ -472,10 +523,12 @@ class OsmApi:
             When changeset already closed
             When changeset creator and element creator different
         :raises ParseError: When a way/relation has nodes that do not exist or are not visible
+        :raises LimitExceededError: a way / relation over the limits of the capabilities, nothing is sent
         """
+        self.__check_elem(elem)
         elem.changeset = cid
-        data = requests.put(self.base_url + self.url_extension + '/{}/{}'.format(elem.e_type, elem.id),
-                            data=self.__serial_elem(elem), auth=auth)
+        data = self.__request('PUT', self.base_url + self.url_extension + '/{}/{}'.format(elem.e_type, elem.id),
+                              data=serial_elem(elem), auth=auth)
         if data.ok:
             return int(data.text)
         elif data.status_code == HTTPStatus.BAD_REQUEST:
@@ -511,8 +564,8 @@ class OsmApi:
             When relation is still part of another relation
         """
         elem.changeset = cid
-        data = requests.delete(self.base_url + self.url_extension + '/{}/{}'.format(elem.e_type, elem.id),
-                               data=self.__serial_elem(elem), auth=auth)
+        data = self.__request('DELETE', self.base_url + self.url_extension + '/{}/{}'.format(elem.e_type, elem.id),
+                              data=serial_elem(elem), auth=auth)
         if data.ok:
             return int(data.text)
         elif data.status_code == HTTPStatus.BAD_REQUEST:
@@ -533,13 +586,16 @@ class OsmApi:
         :param eid: element id
         :returns: all versions of that element
         """
-        data = requests.get(self.base_url + self.url_extension + '/{}/{}/history'.format(e_type, eid))
+        data = self.__request('GET', self.base_url + self.url_extension + '/{}/{}/history'.format(e_type, eid))
         if data.ok:
             tree = ElemTree.fromstring(data.text)
             logger.debug(data.text)
             elems = []
             for sub in tree:
-                elems.append(self.__parse_elem(sub))
+                elems.append(parse_elem(sub, self.timestamps, self.lazy))
+            if self.version_cache is not None:
+                self.version_cache.put_many([(sub.tag, sub.get('id'), sub.get('version'), ElemTree.tostring(sub))
+                                             for sub in tree])
             return elems
         self.__more_error(data)
 
@@ -552,11 +608,17 @@ class OsmApi:
         :param version: defaults to 1
         :returns: all versions of that element
         """
-        data = requests.get(self.base_url + self.url_extension + '/{}/{}/{}'.format(e_type, eid, version))
+        if self.version_cache is not None:
+            cached = self.version_cache.get(e_type, eid, version)
+            if cached is not None:
+                return parse_elem(ElemTree.fromstring(cached), self.timestamps, self.lazy)
+        data = self.__request('GET', self.base_url + self.url_extension + '/{}/{}/{}'.format(e_type, eid, version))
         if data.ok:
             tree = ElemTree.fromstring(data.text)
             logger.debug(data.text)
-            return self.__parse_elem(tree[0])
+            if self.version_cache is not None:
+                self.version_cache.put(e_type, eid, version, ElemTree.tostring(tree[0]))
+            return parse_elem(tree[0], self.timestamps, self.lazy)
         self.__more_error(data)
 
     def get_elements(self, e_type: str, lst_eid: list) -> list:
@@ -570,14 +632,14 @@ class OsmApi:
         :raises NoneFoundError: requested object never existed
         :raises MethodError: you might never try ro request more than ~700 elements at once
         """
-        data = requests.get(self.base_url + self.url_extension + '/{}s?{}s={}'.format(e_type, e_type,
-                                                                                      ','.join(map(str, lst_eid))))
+        data = self.__request('GET', self.base_url + self.url_extension +
+                              '/{}s?{}s={}'.format(e_type, e_type, ','.join(map(str, lst_eid))))
         if data.ok:
             tree = ElemTree.fromstring(data.text)
             logger.debug(data.text)
             elems = []
             for sub in tree:
-                elems.append(self.__parse_elem(sub))
+                elems.append(parse_elem(sub, self.timestamps, self.lazy))
             return elems
 
         elif data.status_code == HTTPStatus.BAD_REQUEST:
@@ -586,6 +648,69 @@ class OsmApi:
             raise MethodError(data.text)
         self.__more_error(data)
 
+    def get_elements_bulk(self, e_type: str, lst_eid: list, max_url_length: int = 6000, workers: int = 4) -> tuple:
+        """
+        returns any number of elements of same e_type.
+        The ids are split into chunks fitting into one url, chunks are fetched concurrently.
+        A chunk containing an id that never existed is bisected until the missing ids are found,
+        so a single bad id does not fail the whole batch.
+
+        :param e_type: element type one of [node, way, relation]
+        :param lst_eid: list of eid, any length
+        :param max_url_length: max. length of a request url, chunks are sized to stay below
+        :param workers: max. chunks fetched at the same time
+        :returns: (elements, report) elements in order of lst_eid without missing or deleted ones,
+            report is a list with dict {ids, missing, deleted} for every chunk
+        :raises ParseError: missing or wrong parameter
+        """
+        unique = list(dict.fromkeys(str(eid) for eid in lst_eid))
+        chunks = self.__chunk_ids(unique, len(self.base_url + self.url_extension) + 2 * len(e_type) + 6,
+                                  max_url_length)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(lambda chunk: self.__fetch_chunk(e_type, chunk), chunks))
+
+        found = {}
+        report = []
+        for chunk, (elems, missing) in zip(chunks, results):
+            deleted = []
+            for elem in elems:
+                if elem.visible:
+                    found[str(elem.id)] = elem
+                else:
+                    deleted.append(str(elem.id))
+            report.append({'ids': chunk, 'missing': missing, 'deleted': deleted})
+        return [found[str(eid)] for eid in lst_eid if str(eid) in found], report
+
+    @staticmethod
+    def __chunk_ids(ids: list, prefix_length: int, max_url_length: int) -> list:
+        chunks = []
+        chunk = []
+        length = prefix_length
+        for eid in ids:
+            if chunk and length + len(eid) + 1 > max_url_length:
+                chunks.append(chunk)
+                chunk = []
+                length = prefix_length
+            chunk.append(eid)
+            length += len(eid) + 1
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    def __fetch_chunk(self, e_type: str, chunk: list) -> tuple:
+        """
+        :returns: (elements, missing ids)
+        """
+        try:
+            return self.get_elements(e_type, chunk), []
+        except (NoneFoundError, MethodError):
+            if len(chunk) == 1:
+                return [], chunk
+        half = len(chunk) // 2
+        left, left_missing = self.__fetch_chunk(e_type, chunk[:half])
+        right, right_missing = self.__fetch_chunk(e_type, chunk[half:])
+        return left + right, left_missing + right_missing
+
     def get_relation_of_element(self, e_type: str, eid: int) -> list:
         """
         returns all relations containing this element
@@ -595,13 +720,13 @@ class OsmApi:
         :returns: relations containing this element
         :raises NoneFoundError: no such element or no relations containing this element
         """
-        data = requests.get(self.base_url + self.url_extension + '/{}/{}/relations'.format(e_type, eid))
+        data = self.__request('GET', self.base_url + self.url_extension + '/{}/{}/relations'.format(e_type, eid))
         if data.ok:
             tree = ElemTree.fromstring(data.text)
             logger.debug(data.text)
             elems = []
             for sub in tree:
-                elems.append(self.__parse_elem(sub))
+                elems.append(parse_elem(sub, self.timestamps, self.lazy))
             if not elems:
                 raise NoneFoundError('no such element or no relations on this element')
             return elems
@@ -615,13 +740,13 @@ class OsmApi:
         :returns: ways directly using this node
         :raises NoneFoundError: no connected ways found
         """
-        data = requests.get(self.base_url + self.url_extension + '/node/{}/ways'.format(eid))
+        data = self.__request('GET', self.base_url + self.url_extension + '/node/{}/ways'.format(eid))
         if data.ok:
             tree = ElemTree.fromstring(data.text)
             logger.debug(data.text)
             elems = []
             for sub in tree:
-                elems.append(self.__parse_elem(sub))
+                elems.append(parse_elem(sub, self.timestamps, self.lazy))
             if not elems:
                 raise NoneFoundError('no such node or no ways on this element')
             return elems
@@ -634,19 +759,98 @@ class OsmApi:
         :param bbox: tuple (lon_min, lat_min, lon_max, lat_max)
         :returns: all Elements with minimum one Node within this BoundingBox
         :raise NoneFoundError: either none or over 50.000 elements are found
+        :raises LimitExceededError: bbox larger than the area maximum of the capabilities
         """
-        data = requests.get(self.base_url + self.url_extension + '/map?bbox={}'.format(','.join(map(str, bbox))))
+        self.__check_area(bbox, 'area')
+        data = self.__request('GET',
+                              self.base_url + self.url_extension + '/map?bbox={}'.format(','.join(map(str, bbox))))
         if data.ok:
             tree = ElemTree.fromstring(data.text)
             logger.debug(data.text)
             elems = []
             for sub in tree[1:]:
-                elems.append(self.__parse_elem(sub))
+                elems.append(parse_elem(sub, self.timestamps, self.lazy))
             if not len(tree) > 1:
                 raise NoneFoundError('no elements or over 50.000 elements')
             return elems
         self.__more_error(data)
 
+    def iter_element_bbox(self, bbox: tuple):
+        """
+        all elements within bbox, streamed.
+        Elements are parsed while the response is read and yielded one by one,
+        memory stays flat no matter how many elements are found.
+
+        :param bbox: tuple (lon_min, lat_min, lon_max, lat_max)
+        :returns: generator of all Elements with minimum one Node within this BoundingBox
+        :raise NoneFoundError: either none or over 50.000 elements are found
+        :raises LimitExceededError: bbox larger than the area maximum of the capabilities
+        """
+        self.__check_area(bbox, 'area')
+        data = self.__request('GET', self.base_url + self.url_extension + '/map',
+                              params={'bbox': ','.join(map(str, bbox))}, stream=True)
+        with data:
+            if not data.ok:
+                self.__more_error(data)
+            found = False
+            for elem in self.__iter_elems(data):
+                found = True
+                yield elem
+            if not found:
+                raise NoneFoundError('no elements or over 50.000 elements')
+
+    def get_element_region(self, bbox: tuple, workers: int = 4, max_depth: int = 8) -> tuple:
+        """
+        all elements within a bbox of any size.
+        The bbox is split into quadrants as long as the server refuses a tile (area or node limit),
+        tiles are fetched concurrently and elements found in several tiles are kept once by (type, id, version).
+
+        :param bbox: tuple (lon_min, lat_min, lon_max, lat_max)
+        :param workers: tiles fetched at once
+        :param max_depth: max. splits of the bbox, tiles still refused are listed in report['failed']
+        :returns: (Elements, report) with report of TileSweep: tiles, split, failed, retries, seconds, max_seconds
+        :raises ValueError: bbox out of range or minima not less than maxima
+        """
+        check_bbox(bbox)
+        sweep = TileSweep(self.__map_tile, bbox_refused, workers=workers, max_depth=max_depth)
+        seen = set()
+        elems = []
+        for tile, found in sweep.run([bbox]):
+            for elem in found:
+                key = (elem.e_type, elem.id, elem.version)
+                if key not in seen:
+                    seen.add(key)
+                    elems.append(elem)
+        return elems, sweep.report()
+
+    def __map_tile(self, bbox: tuple) -> list:
+        try:
+            return self.get_element_bbox(bbox)
+        except NoneFoundError:
+            return []
+
+    def __iter_elems(self, data: requests.Response):
+        """
+        incrementally parses a streamed <osm> document, every top level element is cleared after parsing
+
+        :param data: response opened with stream=True
+        :returns: generator of Node, Way and Relation
+        """
+        data.raw.decode_content = True
+        depth = 0
+        root = None
+        for event, elem in ElemTree.iterparse(data.raw, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = elem
+                depth += 1
+                continue
+            depth -= 1
+            if depth == 1:
+                if elem.tag in ('node', 'way', 'relation'):
+                    yield parse_elem(elem, self.timestamps, self.lazy)
+                root.clear()
+
     def get_full_element(self, e_type: str, eid: int) -> list:
         """
         returns all elements directly referenced or referenced by 2nd grade
@@ -656,18 +860,82 @@ class OsmApi:
         :returns: elements referenced up to 2nd grade with element
         :raises NoneFoundError: eid not found / element deleted
         """
-        data = requests.get(self.base_url + self.url_extension + '/{}/{}/full'.format(e_type, eid))
+        data = self.__request('GET', self.base_url + self.url_extension + '/{}/{}/full'.format(e_type, eid))
         if data.ok:
             tree = ElemTree.fromstring(data.text)
             logger.debug(data.text)
             elems = []
             for sub in tree:
-                elems.append(self.__parse_elem(sub))
+                elems.append(parse_elem(sub, self.timestamps, self.lazy))
             return elems
         elif data.status_code == HTTPStatus.GONE:
             raise NoneFoundError(data.text)
         self.__more_error(data)
 
+    def resolve_relation(self, rid: int, depth: int = None, way_nodes: bool = False, cache: dict = None) -> dict:
+        """
+        relation with its members, their members and so on, every element is fetched once.
+        Pass the same cache to resolve several relations sharing members, e.g. a boundary hierarchy.
+
+        :param rid: relation id
+        :param depth: member levels to resolve, None resolves all
+        :param way_nodes: resolve the nodes of member ways as well
+        :param cache: {(e_type, id): Element} of elements already fetched, filled with the new ones,
+            None for missing or deleted ids
+        :returns: {'elements': {(e_type, id): Element}, 'missing': [(e_type, id)], 'cycles': [[relation ids]],
+            'depth': levels resolved}
+        """
+        return RelationResolver(self, cache, way_nodes).resolve(rid, depth)
+
+    def get_element_bbox_columnar(self, bbox: tuple):
+        """
+        all elements within bbox as numpy arrays, requires numpy
+
+        :param bbox: tuple (lon_min, lat_min, lon_max, lat_max)
+        :returns: ElementStore
+        :raise NoneFoundError: either none or over 50.000 elements are found
+        :raises LimitExceededError: bbox larger than the area maximum of the capabilities
+        """
+        self.__check_area(bbox, 'area')
+        store = self.__get_columnar(self.base_url + self.url_extension + '/map',
+                                    params={'bbox': ','.join(map(str, bbox))})
+        if not len(store):
+            raise NoneFoundError('no elements or over 50.000 elements')
+        return store
+
+    def get_full_element_columnar(self, e_type: str, eid: int):
+        """
+        element with all elements directly referenced or referenced by 2nd grade as numpy arrays, requires numpy
+
+        :param e_type: type of element ('node'/'way'/'relation') referenced
+        :param eid: element id
+        :returns: ElementStore
+        :raises NoneFoundError: eid not found / element deleted
+        """
+        return self.__get_columnar(self.base_url + self.url_extension + '/{}/{}/full'.format(e_type, eid))
+
+    def history_element_columnar(self, e_type: str, eid: int):
+        """
+        complete history of an element as numpy arrays, one row per version, requires numpy
+
+        :param e_type: type of element ('node'/'way'/'relation')
+        :param eid: element id
+        :returns: ElementStore
+        """
+        return self.__get_columnar(self.base_url + self.url_extension + '/{}/{}/history'.format(e_type, eid))
+
+    def __get_columnar(self, url: str, params: dict = None):
+        from pyosmapi.osm_columnar import ElementStore
+
+        data = self.__request('GET', url, params=params, stream=True)
+        with data:
+            if data.ok:
+                data.raw.decode_content = True
+                return ElementStore.from_xml(data.raw)
+            elif data.status_code == HTTPStatus.GONE:
+                raise NoneFoundError(data.text)
+            self.__more_error(data)
+
     ################################################## GPX ########################################################
 
     def get_gpx_bbox(self, bbox: tuple, page: int = 0) -> str:
@@ -678,54 +946,119 @@ class OsmApi:
         :param page: 5000 trackpoints are returned each page
         :returns: format GPX Version 1.0 string
         """
-        data = requests.get(self.base_url + self.url_extension + '/trackpoints',
-                            params={'bbox': ','.join(map(str, bbox)), 'page': page})
+        data = self.__request('GET', self.base_url + self.url_extension + '/trackpoints',
+                              params={'bbox': ','.join(map(str, bbox)), 'page': page})
         if data.ok:
             return data.text
         self.__more_error(data)
 
-    def upload_gpx(self, trace: str, name: str, description: str, tags: set, auth,
-                   visibility: str = 'trackable') -> int:
+    def get_gpx_points(self, bbox: tuple, workers: int = 4, max_pages: int = None) -> TrackPoints:
+        """
+        all GPS trackpoints within bbox. Pages are fetched concurrently until the first page that is not full
+        and parsed straight into arrays.
+
+        :param bbox: (min_lon, min_lat, max_lon, max_lat)
+        :param workers: pages fetched at once
+        :param max_pages: max. pages fetched
+        :returns: TrackPoints with lat, lon, time arrays
+        :raises LimitExceededError: bbox larger than the area maximum of the capabilities
+        """
+        self.__check_area(bbox, 'area')
+        per_page = int(self.__limit('tracepoints', 'per_page') or 5000)
+        return harvest_pages(lambda page: self.__gpx_page(bbox, page), per_page, workers, max_pages)
+
+    def __gpx_page(self, bbox: tuple, page: int) -> TrackPoints:
+        data = self.__request('GET', self.base_url + self.url_extension + '/trackpoints',
+                              params={'bbox': ','.join(map(str, bbox)), 'page': page}, stream=True)
+        with data:
+            if data.ok:
+                data.raw.decode_content = True
+                return TrackPoints.from_xml(data.raw)
+            self.__more_error(data)
+
+    def upload_gpx(self, trace, name: str, description: str, tags: set, auth,
+                   visibility: str = 'trackable', compress: str = None) -> int:
         """
-        uploads gpx trace
+        uploads gpx trace, the file is streamed and never read into memory as a whole
         Authorisation required
 
-        :param trace: gpx trace file string
+        :param trace: gpx trace as string or bytes, file path or binary file object.
+            .gpx.gz / .gpx.bz2 files are sent compressed as they are
         :param description: gpx description
-        :param name: file name on osm
+        :param name: file name on osm, None takes the name of the file
         :param tags: additional tags: eg.: mappingtour, etc
         :param auth: either OAuth1 object or tuple (username, password)
         :param visibility: one of [private, public, trackable, identifiable]
             more https://wiki.openstreetmap.org/wiki/Visibility_of_GPS_traces
+        :param compress: 'gz' or 'bz2' compresses the trace while uploading
         :returns: gpx_id
         """
         content = {'description': description, 'tags': ','.join(tags), 'visibility': visibility}
-        req_file = {'file': (name, trace)}
-        data = requests.post(self.base_url + self.url_extension + '/gpx/create',
-                             auth=auth, files=req_file, data=content)
+        body = MultipartStream(content, trace, name, compress)
+        data = self.__request('POST', self.base_url + self.url_extension + '/gpx/create',
+                              auth=auth, data=body, headers={'Content-Type': body.content_type})
         if data.ok:
             return int(data.text)
         self.__more_error(data)
 
-    def update_gpx(self, tid: int, trace: str, description: str, tags: list, auth,
-                   public: bool = True, visibility: str = 'trackable'):
+    def upload_gpx_dir(self, directory: str, description: str, tags: set, auth, visibility: str = 'trackable',
+                       workers: int = 4, compress: str = None,
+                       suffixes: tuple = ('.gpx', '.gpx.gz', '.gpx.bz2')) -> tuple:
         """
-        updates gpx trace
+        uploads every trace file of a directory, at most workers uploads (and open files) at once
+        Authorisation required
+
+        :param directory: directory containing the traces, not searched recursively
+        :param description: gpx description of every trace
+        :param tags: additional tags of every trace
+        :param auth: either OAuth1 object or tuple (username, password)
+        :param visibility: one of [private, public, trackable, identifiable]
+        :param workers: uploads running at once
+        :param compress: 'gz' or 'bz2' compresses uncompressed traces while uploading
+        :param suffixes: file endings uploaded
+        :returns: ({path: gpx_id}, {path: exception}) failed uploads do not stop the others
+        """
+        paths = sorted(entry.path for entry in os.scandir(directory)
+                       if entry.is_file() and entry.name.lower().endswith(tuple(suffixes)))
+
+        def upload(path: str):
+            try:
+                return self.upload_gpx(path, None, description, tags, auth, visibility, compress), None
+            except Exception as e:
+                logger.warning(f'upload of {path} failed: {e!r}')
+                return None, e
+
+        uploaded = {}
+        failed = {}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for path, (tid, error) in zip(paths, executor.map(upload, paths)):
+                if error is None:
+                    uploaded[path] = tid
+                else:
+                    failed[path] = error
+        return uploaded, failed
+
+    def update_gpx(self, tid: int, trace, description: str, tags: list, auth,
+                   public: bool = True, visibility: str = 'trackable', compress: str = None):
+        """
+        updates gpx trace, the file is streamed and never read into memory as a whole
         Authorisation required
 
         :param tid: uploaded trace id
-        :param trace: gpx trace as string
+        :param trace: gpx trace as string or bytes, file path or binary file object.
+            .gpx.gz / .gpx.bz2 files are sent compressed as they are
         :param description: gpx description
         :param tags: additional tags mapping_tour, etc
         :param auth: either OAuth1 object or tuple (username, password)
         :param public: True for public tracks else False
         :param visibility: one of [private, public, trackable, identifiable]
             more https://wiki.openstreetmap.org/wiki/Visibility_of_GPS_traces
+        :param compress: 'gz' or 'bz2' compresses the trace while uploading
         """
         content = {'description': description, 'tags': ','.join(tags), 'public': public, 'visibility': visibility}
-        req_file = {'file': ('test-trace.gpx', trace)}
-        data = requests.put(self.base_url + self.url_extension + '/gpx/' + str(tid),
-                            auth=auth, files=req_file, data=content)
+        body = MultipartStream(content, trace, None, compress)
+        data = self.__request('PUT', self.base_url + self.url_extension + '/gpx/' + str(tid),
+                              auth=auth, data=body, headers={'Content-Type': body.content_type})
         if data.ok:
             logger.debug('updated')
         else:
@@ -740,7 +1073,7 @@ class OsmApi:
         :param tid: trace ID
         :param auth: either OAuth1 object or tuple (username, password)
         """
-        data = requests.delete(self.base_url + self.url_extension + '/gpx/' + str(tid), auth=auth)
+        data = self.__request('DELETE', self.base_url + self.url_extension + '/gpx/' + str(tid), auth=auth)
         if data.ok:
             logger.debug('deleted')
             return None
@@ -757,18 +1090,10 @@ class OsmApi:
         :param auth: either OAuth1 object or tuple (username, password)
         :returns: dict with metadata
         """
-        data = requests.get(self.base_url + self.url_extension + '/gpx/{}/details'.format(tid), auth=auth)
+        data = self.__request('GET', self.base_url + self.url_extension + '/gpx/{}/details'.format(tid), auth=auth)
         if data.ok:
             logger.debug(data.text)
-            tree = ElemTree.fromstring(data.text)
-            ret = tree.find('gpx_file').attrib
-            ret['timestamp'] = datetime.strptime(ret['timestamp'], "%Y-%m-%dT%H:%M:%SZ")
-            ret['description'] = tree.find('gpx_file/description').text
-            tags = []
-            for tag in tree.findall('gpx_file/tag'):
-                tags.append(tag.text)
-            ret['tags'] = tags
-            return ret
+            return parse_meta_gpx(data.text, self.timestamps)
         self.__more_error(data)
 
     def get_gpx(self, tid: int, auth) -> str:
@@ -780,7 +1105,7 @@ class OsmApi:
         :param auth: either OAuth1 object or tuple (username, password)
         :returns: the full gpx file as a string
         """
-        data = requests.get(self.base_url + self.url_extension + '/gpx/{}/data'.format(tid), auth=auth)
+        data = self.__request('GET', self.base_url + self.url_extension + '/gpx/{}/data'.format(tid), auth=auth)
         if data.ok:
             return data.text
         self.__more_error(data)
@@ -793,22 +1118,11 @@ class OsmApi:
         :param auth: either OAuth1 object or tuple (username, password)
         :returns: list of dictionary representing the metadata
         """
-        data = requests.get(self.base_url + self.url_extension + '/user/gpx_files', auth=auth)
+        data = self.__request('GET', self.base_url + self.url_extension + '/user/gpx_files', auth=auth)
         if data.ok:
-            return self.__parse_gpx_info(data.text)
+            return parse_gpx_info(data.text, self.timestamps)
         self.__more_error(data)
 
-    def __parse_gpx_info(self, xml):
-        tree = ElemTree.fromstring(xml)
-        lst = []
-        for item in tree.findall('gpx_file'):
-            attrib = item.attrib
-            attrib['timestamp'] = datetime.strptime(attrib['timestamp'], "%Y-%m-%dT%H:%M:%SZ")
-            for info in item:
-                attrib[info.tag] = info.text
-            lst.append(attrib)
-        return lst
-
     ################################################# USER ######################################################
 
     def get_user(self, uid: int) -> dict:
@@ -818,9 +1132,12 @@ class OsmApi:
         :param uid: user ID
         :returns: dictionary with user detail
         """
-        data = requests.get(self.base_url + self.url_extension + '/user/' + str(uid))
+        url = self.base_url + self.url_extension + '/user/' + str(uid)
+        data, cached = self.__conditional_get(url)
+        if cached is not None:
+            return cached
         if data.ok:
-            return self.__parse_user(data.text)[0]
+            return self.__remember(url, data, parse_user(data.text)[0])
         self.__more_error(data)
 
     def get_users(self, uids: list) -> list:
@@ -830,10 +1147,10 @@ class OsmApi:
         :param uids: uid in a list
         :returns: list of dictionary with user detail
         """
-        data = requests.get(self.base_url + self.url_extension + '/users?users=' + ','.join(map(str, uids)))
+        data = self.__request('GET', self.base_url + self.url_extension + '/users?users=' + ','.join(map(str, uids)))
         if data.ok:
             logger.debug(data.text)
-            return self.__parse_user(data.text)
+            return parse_user(data.text)
         self.__more_error(data)
 
     def get_current_user(self, auth) -> dict:
@@ -844,24 +1161,11 @@ class OsmApi:
         :param auth: either OAuth1 object or tuple (username, password)
         :returns: dictionary with user detail
         """
-        data = requests.get(self.base_url + self.url_extension + '/user/details', auth=auth)
+        data = self.__request('GET', self.base_url + self.url_extension + '/user/details', auth=auth)
         if data.ok:
-            return self.__parse_user(data.text)[0]
+            return parse_user(data.text)[0]
         self.__more_error(data)
 
-    def __parse_user(self, xml: str) -> list:
-        tree = ElemTree.fromstring(xml)
-        users = []
-        for user in tree.findall('user'):
-            users.append({'uid': user.get('id'),
-                          'name': user.get('display_name'),
-                          'cr_date': user.get('account_created'),
-                          'description': user.find('description').text,
-                          'terms': bool(user.find('contributor-terms').get('agreed')),
-                          'changeset_count': int(user.find('changesets').get('count')),
-                          'traces_count': int(user.find('traces').get('count'))})
-        return users
-
     def get_own_preferences(self, auth) -> dict:
         """
         returns all own user preferences
@@ -870,10 +1174,10 @@ class OsmApi:
         :param auth: either OAuth1 object or tuple (username, password)
         :returns: dictionary with preferences
         """
-        data = requests.get(self.base_url + self.url_extension + '/user/preferences', auth=auth)
+        data = self.__request('GET', self.base_url + self.url_extension + '/user/preferences', auth=auth)
         if data.ok:
             tree = ElemTree.fromstring(data.text)
-            return self.__kv_parser(tree.findall('preferences/preference'))
+            return kv_parser(tree.findall('preferences/preference'))
         self.__more_error(data)
 
     def update_own_preferences(self, pref: dict, auth):
@@ -884,13 +1188,9 @@ class OsmApi:
         :param auth: either OAuth1 object or tuple (username, password)
         :param pref: dictionary with preferences
         """
-        root = ElemTree.Element('osm')
-        prefs = ElemTree.SubElement(root, 'preferences')
-        for key, value in pref.items():
-            ElemTree.SubElement(prefs, 'preference', {'k': key, 'v': value})
-        data = ElemTree.tostring(root).decode()
+        data = serial_preferences(pref)
         print(data)
-        ret = requests.put(self.base_url + self.url_extension + '/user/preferences', data=data, auth=auth)
+        ret = self.__request('PUT', self.base_url + self.url_extension + '/user/preferences', data=data, auth=auth)
         if ret.ok:
             return None
         self.__more_error(ret)
@@ -906,7 +1206,7 @@ class OsmApi:
         :param key: key of preference
         :returns: value
         """
-        data = requests.get(self.base_url + self.url_extension + '/user/preferences/{}'.format(key), auth=auth)
+        data = self.__request('GET', self.base_url + self.url_extension + '/user/preferences/{}'.format(key), auth=auth)
         if data.ok:
             return data.text
         self.__more_error(data)
@@ -920,8 +1220,8 @@ class OsmApi:
         :param value: new value
         :param auth: either OAuth1 object or tuple (username, password)
         """
-        data = requests.put(self.base_url + self.url_extension + '/user/preferences/{}'.format(key),
-                            data=value, auth=auth)
+        data = self.__request('PUT', self.base_url + self.url_extension + '/user/preferences/{}'.format(key),
+                              data=value, auth=auth)
         if data.ok:
             return None
         self.__more_error(data)
@@ -934,58 +1234,72 @@ class OsmApi:
         :param key: key of preference
         :param auth: either OAuth1 object or tuple (username, password)
         """
-        data = requests.delete(self.base_url + self.url_extension + '/user/preferences/{}'.format(key), auth=auth)
+        data = self.__request('DELETE', self.base_url + self.url_extension + '/user/preferences/{}'.format(key),
+                              auth=auth)
         if data.ok:
             return None
         self.__more_error(data)
 
     ################################################# NOTE ######################################################
 
-    def __parse_notes(self, tree: ElemTree.Element):
-        lst = []
-        for item in tree.findall('note'):
-            lon = item.get('lon')
-            lat = item.get('lat')
-            nid = item.find('id').text
-            main_created = datetime.strptime(item.find('date_created').text, "%Y-%m-%d %H:%M:%S UTC")
-            is_open = item.find('status').text
-            if not is_open == 'closed':
-                is_open = True
-            else:
-                is_open = False
-                datetime.strptime(item.find('date_closed').text, "%Y-%m-%d %H:%M:%S UTC")
-
-            comments = []
-            for comment in item.findall('comments/comment'):
-                created = datetime.strptime(comment.find('date').text, "%Y-%m-%d %H:%M:%S UTC")
-                uid = comment.find('uid').text
-                user = comment.find('user').text
-                text = comment.find('text').text
-                action = comment.find('action').text
-                comments.append(Comment(text, uid, user, created, action))
-            lst.append(Note(nid, lat, lon, main_created, is_open, comments))
-        return lst
-
     def get_notes_bbox(self, bbox: tuple, limit: int = 100, closed: int = 7) -> list:
         """
         searches for all notes within the boundaries of bbox
 
         :param bbox: (lon_min, lat_min, lon_max, lat_max)
-        :param limit: 0-1000
+        :param limit: 1 up to the notes maximum_query_limit of the capabilities (10000 on osm.org)
         :param closed: max days closed -1=all, 0=only_open
         :returns: list of Notes
         :raises ValueError: When any of the limits are crossed
         """
-        data = requests.get(self.base_url + self.url_extension + '/notes',
-                            params={'bbox': ','.join(map(str, bbox)), 'limit': limit, 'closed': closed})
+        self.__check_area(bbox, 'note_area')
+        self.__check_limit(limit, 'notes', 'maximum_query_limit', 'note limit')
+        data = self.__request('GET', self.base_url + self.url_extension + '/notes',
+                              params={'bbox': ','.join(map(str, bbox)), 'limit': limit, 'closed': closed})
         logger.debug(data.text)
         if data.ok:
             tree = ElemTree.fromstring(data.text)
-            return self.__parse_notes(tree)
+            return parse_notes(tree, self.timestamps)
         elif data.status_code == HTTPStatus.BAD_REQUEST:
             raise ValueError(data.text)
         self.__more_error(data)
 
+    def iter_notes_region(self, bbox: tuple, closed: int = 7, limit: int = None, workers: int = 4,
+                          max_depth: int = 12, report: dict = None):
+        """
+        all notes within a bbox of any size.
+        The bbox is tiled under the note area limit, tiles are fetched concurrently and every tile returning
+        limit notes or refused as too large is split into quadrants. Notes found in several tiles are yielded once.
+        Any other error of a tile ends the sweep.
+
+        :param bbox: (lon_min, lat_min, lon_max, lat_max)
+        :param closed: max days closed -1=all, 0=only_open
+        :param limit: notes per request, defaults to the notes maximum_query_limit of the capabilities
+        :param workers: tiles fetched at once
+        :param max_depth: max. splits of a tile, tiles still full or refused are listed in report['failed']
+        :param report: dict updated with the report of TileSweep when the generator is exhausted
+        :returns: generator of Notes in order of arrival
+        :raises ValueError: bbox out of range or minima not less than maxima
+        """
+        check_bbox(bbox)
+        limit = limit or int(self.__limit('notes', 'maximum_query_limit') or 10000)
+        self.__check_limit(limit, 'notes', 'maximum_query_limit', 'note limit')
+        tiles = tile_bbox(bbox, self.__limit('note_area', 'maximum') or 25)
+        sweep = TileSweep(lambda tile: self.get_notes_bbox(tile, limit, closed), bbox_refused,
+                          lambda notes: len(notes) >= limit, workers, max_depth)
+        return self.__iter_sweep_notes(sweep, tiles, report)
+
+    @staticmethod
+    def __iter_sweep_notes(sweep: TileSweep, tiles: list, report: dict = None):
+        seen = set()
+        for tile, notes in sweep.run(tiles):
+            for note in notes:
+                if note.id not in seen:
+                    seen.add(note.id)
+                    yield note
+        if report is not None:
+            report.update(sweep.report(), notes=len(seen))
+
     def get_note(self, nid: int) -> Note:
         """
         a note with all comments
@@ -994,11 +1308,14 @@ class OsmApi:
         :return: the identified Note
         :raises NoneFoundError: note ID not found
         """
-        data = requests.get(self.base_url + self.url_extension + '/notes/{}'.format(str(nid)))
+        url = self.base_url + self.url_extension + '/notes/{}'.format(str(nid))
+        data, cached = self.__conditional_get(url)
+        if cached is not None:
+            return cached
         logger.debug(data.text)
         if data.ok:
             tree = ElemTree.fromstring(data.text)
-            return self.__parse_notes(tree)[0]
+            return self.__remember(url, data, parse_notes(tree, self.timestamps)[0])
         elif data.status_code == HTTPStatus.BAD_REQUEST:
             raise ValueError(data.text)
         self.__more_error(data)
@@ -1015,12 +1332,12 @@ class OsmApi:
         :returns: note ID
         :raises ValueError: No text field
         """
-        data = requests.post(self.base_url + self.url_extension + '/notes',
-                             params={'lat': lat, 'lon': lon, 'text': text}, auth=auth)
+        data = self.__request('POST', self.base_url + self.url_extension + '/notes',
+                              params={'lat': lat, 'lon': lon, 'text': text}, auth=auth)
         logger.debug(data.text)
         if data.ok:
             tree = ElemTree.fromstring(data.text)
-            return self.__parse_notes(tree)[0]
+            return parse_notes(tree, self.timestamps)[0]
         elif data.status_code == HTTPStatus.BAD_REQUEST:
             raise ValueError(data.text)
         self.__more_error(data)
@@ -1038,12 +1355,12 @@ class OsmApi:
         :raises NoneFoundError: note ID not found
         :raises ConflictError: already closed Note
         """
-        data = requests.post(self.base_url + self.url_extension + '/notes/{}/comment'.format(str(nid)),
-                             params={'text': text}, auth=auth)
+        data = self.__request('POST', self.base_url + self.url_extension + '/notes/{}/comment'.format(str(nid)),
+                              params={'text': text}, auth=auth)
         logger.debug(data.text)
         if data.ok:
             tree = ElemTree.fromstring(data.text)
-            return self.__parse_notes(tree)[0]
+            return parse_notes(tree, self.timestamps)[0]
         elif data.status_code == HTTPStatus.BAD_REQUEST:
             raise ValueError(data.text)
         elif data.status_code == HTTPStatus.CONFLICT:
@@ -1062,12 +1379,12 @@ class OsmApi:
         :raises NoneFoundError: note ID not found
         :raises ConflictError: already closed Note
         """
-        data = requests.post(self.base_url + self.url_extension + '/notes/{}/close'.format(str(nid)),
-                             params={'text': text}, auth=auth)
+        data = self.__request('POST', self.base_url + self.url_extension + '/notes/{}/close'.format(str(nid)),
+                              params={'text': text}, auth=auth)
         logger.debug(data.text)
         if data.ok:
             tree = ElemTree.fromstring(data.text)
-            return self.__parse_notes(tree)[0]
+            return parse_notes(tree, self.timestamps)[0]
         elif data.status_code == HTTPStatus.BAD_REQUEST:
             raise ValueError(data.text)
         elif data.status_code == HTTPStatus.CONFLICT:
@@ -1087,12 +1404,12 @@ class OsmApi:
         :raises ConflictError: already closed Note
         :raises LookupError: deleted Note
         """
-        data = requests.post(self.base_url + self.url_extension + '/notes/{}/close'.format(str(nid)),
-                             params={'text': text}, auth=auth)
+        data = self.__request('POST', self.base_url + self.url_extension + '/notes/{}/reopen'.format(str(nid)),
+                              params={'text': text}, auth=auth)
         logger.debug(data.text)
         if data.ok:
             tree = ElemTree.fromstring(data.text)
-            return self.__parse_notes(tree)[0]
+            return parse_notes(tree, self.timestamps)[0]
         elif data.status_code == HTTPStatus.CONFLICT:
             raise ConflictError(data.text)
         elif data.status_code == HTTPStatus.GONE:
@@ -1117,6 +1434,7 @@ class OsmApi:
         :returns: list of Notes
         :raises ValueError: When any of the limits are crossed
         """
+        self.__check_limit(limit, 'notes', 'maximum_query_limit', 'note limit')
         params = {'q': text, 'limit': limit, 'closed': closed, 'sort': sort, 'order': order}
         if user:
             if type(user) == int or (type(user) == str and user.isdigit()):
@@ -1128,10 +1446,10 @@ class OsmApi:
         if end:
             params['to'] = end.isoformat()
 
-        data = requests.get(self.base_url + self.url_extension + '/notes/search', params=params)
+        data = self.__request('GET', self.base_url + self.url_extension + '/notes/search', params=params)
         if data.ok:
             tree = ElemTree.fromstring(data.text)
-            return self.__parse_notes(tree)
+            return parse_notes(tree, self.timestamps)
         elif data.status_code == HTTPStatus.BAD_REQUEST:
             raise ValueError(data.text)
         self.__more_error(data)
@@ -1144,28 +1462,145 @@ class OsmApi:
         :return: xml RSS feed
         """
         params = {'bbox': ','.join(map(str, bbox))}
-        data = requests.get(self.base_url + self.url_extension + '/notes/feed', params=params)
+        data = self.__request('GET', self.base_url + self.url_extension + '/notes/feed', params=params)
         if data.ok:
             return data.text
         self.__more_error(data)
 
-    def __kv_parser(self, lst: list) -> dict:
-        """
-        :param lst: list of tags form <tag k="some" v="value"/>
-        :return: dictionary of key value pairs
-        """
-        tags = {}
-        for item in lst:
-            tags[item.get('k')] = item.get('v')
-        return tags
+    def __request(self, method: str, url: str, **kwargs) -> requests.Response:
+        policy = self.retry_policy
+        if policy is None:
+            return self.__send(method, url, **kwargs)
+        attempt = 0
+        while True:
+            try:
+                data = self.__send(method, url, **kwargs)
+            except requests.RequestException as e:
+                if not policy.retry_error(method, attempt, e):
+                    policy.record(method, url, attempt, attempt > 0)
+                    raise
+                retry_after = None
+                logger.info(f'{method} {url} failed with {e!r}, retry {attempt + 1}')
+            else:
+                if not policy.retry_status(method, attempt, data.status_code):
+                    policy.record(method, url, attempt, attempt > 0 and data.status_code in policy.status)
+                    return data
+                retry_after = parse_retry_after(data.headers.get('Retry-After'))
+                logger.info(f'{method} {url} answered {data.status_code}, retry {attempt + 1}')
+                data.close()
+            time.sleep(policy.delay(attempt, retry_after))
+            attempt += 1
+
+    def __send(self, method: str, url: str, **kwargs) -> requests.Response:
+        if self.rate_limiter is None:
+            return self.session.request(method, url, **kwargs)
+        host = urlsplit(url).netloc
+        for _ in range(self.rate_limiter.max_throttled):
+            self.rate_limiter.acquire(host)
+            data = self.session.request(method, url, **kwargs)
+            if data.status_code not in THROTTLE_STATUS:
+                self.rate_limiter.success(host)
+                return data
+            retry_after = parse_retry_after(data.headers.get('Retry-After'))
+            logger.info(f'{host} throttled with {data.status_code}, retry after {retry_after}')
+            self.rate_limiter.throttled(host, retry_after)
+            if not replayable(kwargs.get('data')):
+                # the body is consumed, the caller has to build it again
+                raise RateLimitError(data.text, retry_after)
+            data.close()
+        self.rate_limiter.acquire(host)
+        return self.session.request(method, url, **kwargs)
+
+    def __conditional_get(self, url: str) -> tuple:
+        """
+        GET sending the validators of a cached response
+
+        :returns: (response, cached object), the cached object is None unless the server answered 304
+        """
+        if self.conditional_cache is None:
+            return self.__request('GET', url), None
+        data = self.__request('GET', url, headers=self.conditional_cache.validators(url))
+        if data.status_code == HTTPStatus.NOT_MODIFIED:
+            cached = self.conditional_cache.hit(url)
+            if cached is not None:
+                return data, cached
+            data = self.__request('GET', url)
+        return data, None
+
+    def __remember(self, url: str, data: requests.Response, obj):
+        if self.conditional_cache is not None:
+            self.conditional_cache.put(url, data.headers.get('ETag'), data.headers.get('Last-Modified'),
+                                       obj, len(data.content))
+        return obj
+
+    def __limit(self, name: str, attr: str):
+        """
+        :returns: server limit from the cached capabilities, None if preflight is off or the limit is unknown
+        """
+        if not self.preflight or time.monotonic() < self.__preflight_paused:
+            return None
+        try:
+            value = self.get_api_capabilities().get(name, {}).get(attr)
+        except (requests.RequestException, ValueError, NotAuthorizedError, ElemTree.ParseError) as e:
+            logger.warning(f'capabilities unavailable, pre-flight checks paused: {e!r}')
+            self.__preflight_paused = time.monotonic() + self.capabilities_ttl
+            return None
+        return None if value is None else float(value)
+
+    def __check_limit(self, value: float, name: str, attr: str, what: str):
+        limit = self.__limit(name, attr)
+        if limit is not None and value > limit:
+            raise LimitExceededError(f'{what} {value} exceeds the server maximum of {limit:g}')
 
-    def __kv_serial(self, tags: dict, parent: ElemTree.Element):
-        for key, value in tags.items():
-            ElemTree.SubElement(parent, 'tag', {'k': key, 'v': value})
+    def __check_area(self, bbox: tuple, name: str):
+        min_lon, min_lat, max_lon, max_lat = map(float, bbox)
+        self.__check_limit((max_lon - min_lon) * (max_lat - min_lat), name, 'maximum', 'bbox area')
+
+    def __check_elem(self, elem: Element):
+        if isinstance(elem, Way):
+            self.__check_limit(len(elem.nodes), 'waynodes', 'maximum', f'way {elem.id} nodes')
+        elif isinstance(elem, Relation):
+            self.__check_limit(len(elem.members), 'relationmembers', 'maximum', f'relation {elem.id} members')
+
+    def __check_diff(self, xml):
+        tree = ElemTree.fromstring(xml)
+        self.__check_limit(sum(len(block) for block in tree), 'changesets', 'maximum_elements', 'changeset elements')
+        for way in tree.iterfind('*/way'):
+            self.__check_limit(len(way.findall('nd')), 'waynodes', 'maximum', f'way {way.get("id")} nodes')
+        for relation in tree.iterfind('*/relation'):
+            self.__check_limit(len(relation.findall('member')), 'relationmembers', 'maximum',
+                               f'relation {relation.get("id")} members')
+
+    def __check_change(self, change: OsmChange):
+        # limits are looked up before sending, generator blocks are checked while the body is streamed
+        limits = {name: self.__limit(name, attr) for name, attr in
+                  (('changesets', 'maximum_elements'), ('waynodes', 'maximum'), ('relationmembers', 'maximum'))}
+
+        def check(elem: Element, count: int):
+            sizes = [('changesets', count, 'changeset elements')]
+            if isinstance(elem, Way):
+                sizes.append(('waynodes', len(elem.nodes), f'way {elem.id} nodes'))
+            elif isinstance(elem, Relation):
+                sizes.append(('relationmembers', len(elem.members), f'relation {elem.id} members'))
+            for name, value, what in sizes:
+                if limits[name] is not None and value > limits[name]:
+                    raise LimitExceededError(f'{what} {value} exceeds the server maximum of {limits[name]:g}')
+
+        if change.replayable:
+            count = 0
+            for _, elems, _ in change.blocks:
+                for elem in elems:
+                    count += 1
+                    check(elem, count)
+            change.check = None
+        else:
+            change.check = check
 
     def __more_error(self, data):
         if data.status_code == HTTPStatus.NOT_FOUND:
             raise NoneFoundError(data.text)
         elif data.status_code == HTTPStatus.UNAUTHORIZED:
             raise NotAuthorizedError(data.text)
-        raise requests.HTTPError
+        elif data.status_code in THROTTLE_STATUS:
+            raise RateLimitError(data.text, parse_retry_after(data.headers.get('Retry-After')))
+        raise requests.HTTPError(data.text, response=data)
@@ -0,0 +1,993 @@
+import asyncio
+from collections import namedtuple
+from http import HTTPStatus
+import logging
+from urllib.parse import urlsplit
+import xml.etree.ElementTree as ElemTree
+import aiohttp
+import requests
+from pyosmapi.osm_util import *
+from pyosmapi.osm_parser import *
+from pyosmapi.osm_ratelimit import THROTTLE_STATUS
+from pyosmapi.exceptions import *
+
+logger = logging.getLogger(__name__)
+
+
+class _Response(namedtuple('_Response', ['status_code', 'text'])):
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+
+class AsyncOsmApi:
+    """
+    asyncio counterpart of OsmApi, every call is a coroutine with the same arguments and return values.
+
+    :param instance: keywords dev and main are mapped to the official osm.org  or set a custom url
+    :param url_extension: path to the api defaults to '/api/6.0'
+    :param session: aiohttp.ClientSession to send all calls through, if omitted one is created on first use
+    :param limit_per_host: max. requests in flight per host
+    :param timestamps: 'datetime' decodes timestamps while parsing, 'raw' keeps the strings and
+        'epoch' int seconds until the attribute is first accessed
+    :param lazy: elements keep the parsed xml and decode each attribute on first access
+    """
+
+    def __init__(self, instance: str = "dev", url_extension: str = "/api/0.6",
+                 session: aiohttp.ClientSession = None, limit_per_host: int = 100, timestamps: str = 'datetime',
+                 lazy: bool = False):
+        self.url_extension = url_extension
+        self.timestamps = timestamps
+        self.lazy = lazy
+        self.limit_per_host = limit_per_host
+        self._own_session = session is None
+        self.session = session
+        self.__host_slots = {}
+        if instance.lower() == "main":
+            self.base_url = DEFAULT_OSM_URL
+            logger.info('Using osm main api')
+        elif instance.lower() == "dev":
+            self.base_url = DEFAULT_OSM_DEV_URL
+            logger.info('Using osm dev api')
+        else:
+            self.base_url = instance
+            logger.info(f'Using custom instance: {instance}{url_extension}')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        """
+        closes all pooled connections, a session passed in by the caller is left open
+        """
+        if self._own_session and self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def get_api_versions(self):
+        """
+        :returns: supported API versions
+        """
+        data = await self.__request('GET', self.base_url + '/api/versions')
+        if data.ok:
+            return ElemTree.fromstring(data.text).find('api/version').text
+        self.__more_error(data)
+
+    async def get_api_capabilities(self) -> dict:
+        """
+        Max / Min values
+        image blacklisting
+        :returns:
+        """
+        data = await self.__request('GET', self.base_url + self.url_extension + '/capabilities')
+        if data.ok:
+            return parse_capabilities(data.text)
+        self.__more_error(data)
+
+    async def get_permissions(self, auth) -> set:
+        """
+        current permissions
+        Authorisation required else None
+        :param auth: either OAuth1 object or tuple (username, password)
+        :returns: set of all current permissions
+        """
+        data = await self.__request('GET', self.base_url + self.url_extension + '/permissions', auth=auth)
+        if data.ok:
+            return parse_permissions(data.text)
+        self.__more_error(data)
+
+    ############################################### CHANGESET #######################################################
+
+    async def open_changeset(self, tags: dict, auth) -> int:
+        """
+        opens a new changeset and returns its id
+        Authorisation required
+
+        :param tags: Dictionary containing additional tags
+        :param auth: either OAuth1 object or tuple (username, password)
+        :returns: changeset ID
+        """
+        data = await self.__request('PUT', self.base_url + self.url_extension + '/changeset/create',
+                                    data=serial_changeset(tags), auth=auth)
+        if data.ok:
+            return int(data.text)
+        elif data.status_code == HTTPStatus.BAD_REQUEST:
+            raise ParseError(data.text)
+        self.__more_error(data)
+
+    async def get_changeset(self, cid: int, discussion: bool = False) -> ChangeSet:
+        """
+        A Call to get a changeset optionally with discussion.
+        no elements included
+
+        :param cid: changeset ID
+        :param discussion: include changeset discussion?
+        :returns: dictionary representation of the changeset
+        :raises NoneFoundError: no changeset matching this ID
+        """
+        url = self.base_url + self.url_extension + '/changeset/{}'.format(cid)
+        if discussion:
+            url += '?include_discussion=True'
+        data = await self.__request('GET', url)
+        if data.ok:
+            tree = ElemTree.fromstring(data.text).find('changeset')
+            return changeset_parser(tree, self.timestamps)
+        self.__more_error(data)
+
+    async def edit_changeset(self, changeset: ChangeSet, auth):
+        """
+        edits only changeset tags, only tags in this update remain in changeset
+
+        :param changeset: ChangeSet object
+        :param auth: either OAuth1 object or tuple (username, password)
+        :raises NoneFoundError: no changeset of that ID
+        :raises ConflictError: other user than creator trying to use changeset / or changeset already closed.
+        """
+        data = await self.__request('PUT', self.base_url + self.url_extension + '/changeset/{}'.format(changeset.id),
+                                    data=serial_changeset(changeset.tags), auth=auth)
+        if data.ok:
+            return None
+        elif data.status_code == HTTPStatus.CONFLICT:
+            raise ConflictError(data.text)
+        self.__more_error(data)
+
+    async def close_changeset(self, cid: int, auth):
+        """
+        closes a changeset
+        Authorisation required
+
+        :param cid: changeset ID
+        :param auth: either OAuth1 object or tuple (username, password)
+        :raises NoneFoundError: no changeset of that ID
+        :raises ConflictError: other user than creator trying to use changeset / or changeset already closed.
+        """
+        data = await self.__request('PUT', self.base_url + self.url_extension + '/changeset/{}/close'.format(cid),
+                                    auth=auth)
+        if data.ok:
+            return None
+        elif data.status_code == HTTPStatus.CONFLICT:
+            raise ConflictError(data.text)
+        self.__more_error(data)
+
+    async def download_changeset(self, cid: int) -> str:
+        """
+        downloads a OsmChange document
+
+        :param cid: changeset ID
+        :raises NoneFoundError: no changeset of that ID
+        """
+        data = await self.__request('GET', self.base_url + self.url_extension + '/changeset/{}/download'.format(cid))
+        if data.ok:
+            return data.text
+        self.__more_error(data)
+
+    async def get_changesets(self, bbox: tuple = None, user: str = '', time: datetime = None,
+                             is_open: bool = False, is_closed: bool = False, changesets: list = None) -> list:
+        """
+        max 100 changesets matching all provided parameters
+
+        :param bbox:(min_lon, min_lat, max_lon, max_lat)
+        :param user: username or user_id
+        :param time: Time format: Anything that this_ Ruby function will parse.
+        :param is_open: xor is_closed
+        :param is_closed: xor is_open
+        :param changesets: changeset_ids as list
+        :returns: found changesets in a list
+
+        .. _this: https://ruby-doc.org/stdlib-2.7.2/libdoc/date/rdoc/DateTime.html#method-c-parse
+        """
+        params = {}
+        if bbox:
+            params['bbox'] = ','.join(map(str, bbox))
+        if user:
+            if user.isdigit():
+                params['user'] = int(user)
+            else:
+                params['display_name'] = user
+        if time:
+            params['time'] = time.isoformat()
+        if is_open ^ is_closed:
+            if is_open:
+                params['open'] = True
+            else:
+                params['closed'] = True
+        if changesets:
+            params['changesets'] = ','.join(map(str, changesets))
+
+        data = await self.__request('GET', self.base_url + self.url_extension + '/changesets', params=params)
+        if data.ok:
+            tree = ElemTree.fromstring(data.text)
+            cs = []
+            for sub in tree.findall('changeset'):
+                cs.append(changeset_parser(sub, self.timestamps))
+            return cs
+        elif data.status_code == HTTPStatus.BAD_REQUEST:
+            raise ValueError(data.text)
+        elif data.status_code == HTTPStatus.NOT_FOUND:
+            raise ValueError(data.text)
+        self.__more_error(data)
+
+    async def diff_upload(self, cid: int, xml: str, auth) -> list:
+        """
+        uploads all changes at once, an error rolls back all (All or Nothing)
+        see OsmApi.diff_upload
+        Authorisation required
+
+        :param cid: changeset id
+        :param xml: OsmChange document as a String
+        :param auth: either OAuth1 object or tuple (username, password)
+        :returns: list with dict {type, old_id, new_id, new_version}
+        """
+        data = await self.__request('POST', self.base_url + self.url_extension + '/changeset/{}/upload'.format(cid),
+                                    data=xml, auth=auth)
+        if data.ok:
+            return parse_diff_result(data.text)
+        elif data.status_code == HTTPStatus.BAD_REQUEST:
+            raise ParseError(data.text)
+        elif data.status_code == HTTPStatus.CONFLICT:
+            raise ConflictError(data.text)
+        self.__more_error(data)
+
+    async def comm_changeset(self, cid: int, text: str, auth) -> ChangeSet:
+        """
+        Add a comment to a changeset. The changeset must be closed.
+        Authorisation required
+
+        :param cid: changeset ID
+        :param text: text in new comment
+        :param auth: either OAuth1 object or tuple (username, password)
+        :returns: ChangeSet just commented, no comments
+        :raises ValueError: no textfield present
+        :raises ConflictError: deleted
+        """
+        data = await self.__request('POST', self.base_url + self.url_extension + '/changeset/{}/comment'.format(cid),
+                                    data={'text': text}, auth=auth)
+        if data.ok:
+            tree = ElemTree.fromstring(data.text).find('changeset')
+            return changeset_parser(tree, self.timestamps)
+        elif data.status_code == HTTPStatus.BAD_REQUEST:
+            raise ValueError(data.text)
+        elif data.status_code == HTTPStatus.CONFLICT:
+            raise ConflictError(data.text)
+        self.__more_error(data)
+
+    async def sub_changeset(self, cid: int, auth) -> ChangeSet:
+        """
+        Subscribes the current authenticated user to changeset discussion
+        Authorisation required
+
+        :param cid: changeset ID
+        :param auth: either OAuth1 object or tuple (username, password)
+        :returns: ChangeSet just subscribed
+        :raises ConflictError: already subscribed
+        """
+        data = await self.__request('POST', self.base_url + self.url_extension + '/changeset/{}/subscribe'.format(cid),
+                                    auth=auth)
+        if data.ok:
+            tree = ElemTree.fromstring(data.text).find('changeset')
+            return changeset_parser(tree, self.timestamps)
+        elif data.status_code == HTTPStatus.CONFLICT:
+            raise ConflictError(data.text)
+        self.__more_error(data)
+
+    async def unsub_changeset(self, cid: int, auth) -> ChangeSet:
+        """
+        Unsubscribe the current authenticated user from changeset discussion
+        Authorisation required
+
+        :param cid: changeset ID
+        :param auth: either OAuth1 object or tuple (username, password)
+        :raises NoneFoundError: is not subscribed
+        """
+        data = await self.__request('POST',
+                                    self.base_url + self.url_extension + '/changeset/{}/unsubscribe'.format(cid),
+                                    auth=auth)
+        if data.ok:
+            tree = ElemTree.fromstring(data.text).find('changeset')
+            return changeset_parser(tree, self.timestamps)
+        self.__more_error(data)
+
+    ############################################## ELEMENT #########################################################
+
+    async def create_element(self, elem: Element, cid: int, auth) -> int:
+        """
+        creates new element of specified type
+        Authorisation required
+
+        :param elem: element to get created
+        :param cid: open changeset ID
+        :param auth: either OAuth1 object or tuple (username, password)
+        :returns: Element ID
+        :raises NoneFoundError: missing changeset, node outside the world or too many nodes for a way
+        :raises ConflictError: changeset already closed or created by another user
+        :raises ParseError: When a way/relation has nodes that do not exist or are not visible
+        """
+        elem.changeset = cid
+        data = await self.__request('PUT', self.base_url + self.url_extension + '/{}/create'.format(elem.e_type),
+                                    data=serial_elem(elem, True), auth=auth)
+        if data.ok:
+            return int(data.text)
+        elif data.status_code == HTTPStatus.BAD_REQUEST:
+            raise NoneFoundError(data.text)
+        elif data.status_code == HTTPStatus.CONFLICT:
+            raise ConflictError(data.text)
+        elif data.status_code == HTTPStatus.PRECONDITION_FAILED:
+            raise ParseError(data.text)
+        self.__more_error(data)
+
+    async def get_element(self, e_type: str, eid: int) -> Element:
+        """
+        returns only this element
+
+        :param e_type: type of element ('node'/'way'/'relation')
+        :param eid: element id
+        :returns: requested Element of that Type
+        :raises NoneFoundError: No Element with such id
+        :raises LockupError: Deleted Element
+        """
+        data = await self.__request('GET', self.base_url + self.url_extension + '/{}/{}'.format(e_type, eid))
+        if data.ok:
+            tree = ElemTree.fromstring(data.text)
+            return parse_elem(tree[0], self.timestamps, self.lazy)
+        elif data.status_code == HTTPStatus.GONE:
+            raise LookupError(data.text)
+        self.__more_error(data)
+
+    async def edit_element(self, elem: Element, cid: int, auth) -> int:
+        """
+        change tags/position of element
+        Authorisation required
+
+        :param elem: changed element to get uploaded (Node/Way/Relation)
+        :param cid: open changeset id
+        :param auth: either OAuth1 object or tuple (username, password)
+        :returns: New version number
+        :raises ValueError: missing changeset, node outside the world, too many nodes or version mismatch
+        :raises NoneFoundError: Element ID not found
+        :raises ConflictError: changeset already closed or created by another user
+        :raises ParseError: When a way/relation has nodes that do not exist or are not visible
+        """
+        elem.changeset = cid
+        data = await self.__request('PUT', self.base_url + self.url_extension + '/{}/{}'.format(elem.e_type, elem.id),
+                                    data=serial_elem(elem), auth=auth)
+        if data.ok:
+            return int(data.text)
+        elif data.status_code == HTTPStatus.BAD_REQUEST:
+            raise ValueError(data.text)
+        elif data.status_code == HTTPStatus.CONFLICT:
+            raise ConflictError(data.text)
+        elif data.status_code == HTTPStatus.PRECONDITION_FAILED:
+            raise ParseError(data.text)
+        self.__more_error(data)
+
+    async def delete_element(self, elem: Element, cid: int, auth) -> int:
+        """
+        deletes element
+        Authorisation required
+
+        :param elem: changed element to get deleted (Node/Way/Relation)
+        :param cid: open changeset id
+        :param auth: either OAuth1 object or tuple (username, password)
+        :returns: new version number
+        :raises ValueError: missing changeset or version mismatch
+        :raises NonFoundError: Element ID not found
+        :raises ConflictError: changeset already closed or created by another user
+        :raises LookupError: deleted
+        :raises ParseError: element is still used by a way or relation
+        """
+        elem.changeset = cid
+        data = await self.__request('DELETE',
+                                    self.base_url + self.url_extension + '/{}/{}'.format(elem.e_type, elem.id),
+                                    data=serial_elem(elem), auth=auth)
+        if data.ok:
+            return int(data.text)
+        elif data.status_code == HTTPStatus.BAD_REQUEST:
+            raise ValueError(data.text)
+        elif data.status_code == HTTPStatus.CONFLICT:
+            raise ConflictError(data.text)
+        elif data.status_code == HTTPStatus.GONE:
+            raise LookupError(data.text)
+        elif data.status_code == HTTPStatus.PRECONDITION_FAILED:
+            raise ParseError(data.text)
+        self.__more_error(data)
+
+    async def history_element(self, e_type: str, eid: int) -> list:
+        """
+        complete history of an element
+
+        :param e_type: type of element ('node'/'way'/'relation')
+        :param eid: element id
+        :returns: all versions of that element
+        """
+        data = await self.__request('GET', self.base_url + self.url_extension + '/{}/{}/history'.format(e_type, eid))
+        if data.ok:
+            return self.__parse_elems(data.text)
+        self.__more_error(data)
+
+    async def history_version_element(self, e_type: str, eid: int, version: int = 1) -> Element:
+        """
+        a single version of an element
+
+        :param e_type: type of element ('node'/'way'/'relation')
+        :param eid: element id
+        :param version: defaults to 1
+        :returns: that version of the element
+        """
+        data = await self.__request('GET',
+                                    self.base_url + self.url_extension + '/{}/{}/{}'.format(e_type, eid, version))
+        if data.ok:
+            tree = ElemTree.fromstring(data.text)
+            return parse_elem(tree[0], self.timestamps, self.lazy)
+        self.__more_error(data)
+
+    async def get_elements(self, e_type: str, lst_eid: list) -> list:
+        """
+        returns multiple elements of same e_type
+
+        :returns: multiple elements as specified in the list of eid
+        :param e_type: element type one of [node, way, relation]
+        :param lst_eid: list of eid
+        :raises ParseError: missing or wrong parameter
+        :raises NoneFoundError: requested object never existed
+        :raises MethodError: you might never try ro request more than ~700 elements at once
+        """
+        data = await self.__request('GET', self.base_url + self.url_extension + '/{}s'.format(e_type),
+                                    params={e_type + 's': ','.join(map(str, lst_eid))})
+        if data.ok:
+            return self.__parse_elems(data.text)
+        elif data.status_code == HTTPStatus.BAD_REQUEST:
+            raise ParseError(data.text)
+        elif data.status_code == HTTPStatus.REQUEST_URI_TOO_LONG:
+            raise MethodError(data.text)
+        self.__more_error(data)
+
+    async def get_relation_of_element(self, e_type: str, eid: int) -> list:
+        """
+        returns all relations containing this element
+
+        :param e_type: type of element ('node'/'way'/'relation')
+        :param eid: element id
+        :returns: relations containing this element
+        :raises NoneFoundError: no such element or no relations containing this element
+        """
+        data = await self.__request('GET',
+                                    self.base_url + self.url_extension + '/{}/{}/relations'.format(e_type, eid))
+        if data.ok:
+            elems = self.__parse_elems(data.text)
+            if not elems:
+                raise NoneFoundError('no such element or no relations on this element')
+            return elems
+        self.__more_error(data)
+
+    async def get_ways_of_node(self, eid: int) -> list:
+        """
+        use only on node elements
+
+        :param eid: element ID
+        :returns: ways directly using this node
+        :raises NoneFoundError: no connected ways found
+        """
+        data = await self.__request('GET', self.base_url + self.url_extension + '/node/{}/ways'.format(eid))
+        if data.ok:
+            elems = self.__parse_elems(data.text)
+            if not elems:
+                raise NoneFoundError('no such node or no ways on this element')
+            return elems
+        self.__more_error(data)
+
+    async def get_element_bbox(self, bbox: tuple) -> list:
+        """
+        all elements within bbox
+
+        :param bbox: tuple (lon_min, lat_min, lon_max, lat_max)
+        :returns: all Elements with minimum one Node within this BoundingBox
+        :raise NoneFoundError: either none or over 50.000 elements are found
+        """
+        data = await self.__request('GET', self.base_url + self.url_extension + '/map',
+                                    params={'bbox': ','.join(map(str, bbox))})
+        if data.ok:
+            tree = ElemTree.fromstring(data.text)
+            if not len(tree) > 1:
+                raise NoneFoundError('no elements or over 50.000 elements')
+            elems = []
+            for sub in tree[1:]:
+                elems.append(parse_elem(sub, self.timestamps, self.lazy))
+            return elems
+        self.__more_error(data)
+
+    async def get_full_element(self, e_type: str, eid: int) -> list:
+        """
+        returns all elements directly referenced or referenced by 2nd grade
+
+        :param e_type: type of element ('node'/'way'/'relation') referenced
+        :param eid: element id
+        :returns: elements referenced up to 2nd grade with element
+        :raises NoneFoundError: eid not found / element deleted
+        """
+        data = await self.__request('GET', self.base_url + self.url_extension + '/{}/{}/full'.format(e_type, eid))
+        if data.ok:
+            return self.__parse_elems(data.text)
+        elif data.status_code == HTTPStatus.GONE:
+            raise NoneFoundError(data.text)
+        self.__more_error(data)
+
+    ################################################## GPX ########################################################
+
+    async def get_gpx_bbox(self, bbox: tuple, page: int = 0) -> str:
+        """
+        returns max 5000GPS trackpoints as gpx string, increase page for any additional 5000
+
+        :param bbox: (min_lon, min_lat, max_lon, max_lat)
+        :param page: 5000 trackpoints are returned each page
+        :returns: format GPX Version 1.0 string
+        """
+        data = await self.__request('GET', self.base_url + self.url_extension + '/trackpoints',
+                                    params={'bbox': ','.join(map(str, bbox)), 'page': page})
+        if data.ok:
+            return data.text
+        self.__more_error(data)
+
+    async def upload_gpx(self, trace: str, name: str, description: str, tags: set, auth,
+                         visibility: str = 'trackable') -> int:
+        """
+        uploads gpx trace
+        Authorisation required
+
+        :param trace: gpx trace file string
+        :param description: gpx description
+        :param name: file name on osm
+        :param tags: additional tags: eg.: mappingtour, etc
+        :param auth: either OAuth1 object or tuple (username, password)
+        :param visibility: one of [private, public, trackable, identifiable]
+            more https://wiki.openstreetmap.org/wiki/Visibility_of_GPS_traces
+        :returns: gpx_id
+        """
+        content = {'description': description, 'tags': ','.join(tags), 'visibility': visibility}
+        data = await self.__request('POST', self.base_url + self.url_extension + '/gpx/create',
+                                    auth=auth, data=self.__form(content, name, trace))
+        if data.ok:
+            return int(data.text)
+        self.__more_error(data)
+
+    async def update_gpx(self, tid: int, trace: str, description: str, tags: list, auth,
+                         public: bool = True, visibility: str = 'trackable'):
+        """
+        updates gpx trace
+        Authorisation required
+
+        :param tid: uploaded trace id
+        :param trace: gpx trace as string
+        :param description: gpx description
+        :param tags: additional tags mapping_tour, etc
+        :param auth: either OAuth1 object or tuple (username, password)
+        :param public: True for public tracks else False
+        :param visibility: one of [private, public, trackable, identifiable]
+            more https://wiki.openstreetmap.org/wiki/Visibility_of_GPS_traces
+        """
+        content = {'description': description, 'tags': ','.join(tags), 'public': public, 'visibility': visibility}
+        data = await self.__request('PUT', self.base_url + self.url_extension + '/gpx/' + str(tid),
+                                    auth=auth, data=self.__form(content, 'test-trace.gpx', trace))
+        if data.ok:
+            logger.debug('updated')
+        else:
+            logger.debug('not updated')
+            self.__more_error(data)
+
+    async def delete_gpx(self, tid: int, auth):
+        """
+        deletes own gpx indicated by ID
+        Authorisation required
+
+        :param tid: trace ID
+        :param auth: either OAuth1 object or tuple (username, password)
+        """
+        data = await self.__request('DELETE', self.base_url + self.url_extension + '/gpx/' + str(tid), auth=auth)
+        if data.ok:
+            logger.debug('deleted')
+            return None
+        else:
+            logger.debug('not deleted')
+            self.__more_error(data)
+
+    async def get_meta_gpx(self, tid: int, auth) -> dict:
+        """
+        returns meta data of identified gpx
+        Authentication required
+
+        :param tid: trace ID
+        :param auth: either OAuth1 object or tuple (username, password)
+        :returns: dict with metadata
+        """
+        data = await self.__request('GET', self.base_url + self.url_extension + '/gpx/{}/details'.format(tid),
+                                    auth=auth)
+        if data.ok:
+            return parse_meta_gpx(data.text, self.timestamps)
+        self.__more_error(data)
+
+    async def get_gpx(self, tid: int, auth) -> str:
+        """
+        downloads public or own private gpx file
+        Authentication required
+
+        :param tid: trace ID
+        :param auth: either OAuth1 object or tuple (username, password)
+        :returns: the full gpx file as a string
+        """
+        data = await self.__request('GET', self.base_url + self.url_extension + '/gpx/{}/data'.format(tid), auth=auth)
+        if data.ok:
+            return data.text
+        self.__more_error(data)
+
+    async def get_own_gpx(self, auth) -> list:
+        """
+        meta data of all own gpx files
+        Authorisation required
+
+        :param auth: either OAuth1 object or tuple (username, password)
+        :returns: list of dictionary representing the metadata
+        """
+        data = await self.__request('GET', self.base_url + self.url_extension + '/user/gpx_files', auth=auth)
+        if data.ok:
+            return parse_gpx_info(data.text, self.timestamps)
+        self.__more_error(data)
+
+    ################################################# USER ######################################################
+
+    async def get_user(self, uid: int) -> dict:
+        """
+        user data and  statistic
+
+        :param uid: user ID
+        :returns: dictionary with user detail
+        """
+        data = await self.__request('GET', self.base_url + self.url_extension + '/user/' + str(uid))
+        if data.ok:
+            return parse_user(data.text)[0]
+        self.__more_error(data)
+
+    async def get_users(self, uids: list) -> list:
+        """
+        user data an statistics for multiple users
+
+        :param uids: uid in a list
+        :returns: list of dictionary with user detail
+        """
+        data = await self.__request('GET', self.base_url + self.url_extension + '/users',
+                                    params={'users': ','.join(map(str, uids))})
+        if data.ok:
+            return parse_user(data.text)
+        self.__more_error(data)
+
+    async def get_current_user(self, auth) -> dict:
+        """
+        own user data and statistics
+        Authorisation required
+
+        :param auth: either OAuth1 object or tuple (username, password)
+        :returns: dictionary with user detail
+        """
+        data = await self.__request('GET', self.base_url + self.url_extension + '/user/details', auth=auth)
+        if data.ok:
+            return parse_user(data.text)[0]
+        self.__more_error(data)
+
+    async def get_own_preferences(self, auth) -> dict:
+        """
+        returns all own user preferences
+        Authorisation required
+
+        :param auth: either OAuth1 object or tuple (username, password)
+        :returns: dictionary with preferences
+        """
+        data = await self.__request('GET', self.base_url + self.url_extension + '/user/preferences', auth=auth)
+        if data.ok:
+            tree = ElemTree.fromstring(data.text)
+            return kv_parser(tree.findall('preferences/preference'))
+        self.__more_error(data)
+
+    async def update_own_preferences(self, pref: dict, auth):
+        """
+        updates all user preferences at once
+        Authorisation required
+
+        :param auth: either OAuth1 object or tuple (username, password)
+        :param pref: dictionary with preferences
+        """
+        data = await self.__request('PUT', self.base_url + self.url_extension + '/user/preferences',
+                                    data=serial_preferences(pref), auth=auth)
+        if data.ok:
+            return None
+        self.__more_error(data)
+
+    async def get_own_preference(self, key: str, auth) -> str:
+        """
+        returns the value of a single preference
+        Authorisation required
+
+        :param auth: either OAuth1 object or tuple (username, password)
+        :param key: key of preference
+        :returns: value
+        """
+        data = await self.__request('GET', self.base_url + self.url_extension + '/user/preferences/{}'.format(key),
+                                    auth=auth)
+        if data.ok:
+            return data.text
+        self.__more_error(data)
+
+    async def set_own_preference(self, key: str, value: str, auth):
+        """
+        updates the value of a single preference
+        Authorisation required
+
+        :param key: key of preference
+        :param value: new value
+        :param auth: either OAuth1 object or tuple (username, password)
+        """
+        data = await self.__request('PUT', self.base_url + self.url_extension + '/user/preferences/{}'.format(key),
+                                    data=value, auth=auth)
+        if data.ok:
+            return None
+        self.__more_error(data)
+
+    async def delete_own_preference(self, key: str, auth):
+        """
+        deletes a single preference
+        Authorisation required
+
+        :param key: key of preference
+        :param auth: either OAuth1 object or tuple (username, password)
+        """
+        data = await self.__request('DELETE', self.base_url + self.url_extension + '/user/preferences/{}'.format(key),
+                                    auth=auth)
+        if data.ok:
+            return None
+        self.__more_error(data)
+
+    ################################################# NOTE ######################################################
+
+    async def get_notes_bbox(self, bbox: tuple, limit: int = 100, closed: int = 7) -> list:
+        """
+        searches for all notes within the boundaries of bbox
+
+        :param bbox: (lon_min, lat_min, lon_max, lat_max)
+        :param limit: 0-1000
+        :param closed: max days closed -1=all, 0=only_open
+        :returns: list of Notes
+        :raises ValueError: When any of the limits are crossed
+        """
+        data = await self.__request('GET', self.base_url + self.url_extension + '/notes',
+                                    params={'bbox': ','.join(map(str, bbox)), 'limit': limit, 'closed': closed})
+        if data.ok:
+            return parse_notes(ElemTree.fromstring(data.text), self.timestamps)
+        elif data.status_code == HTTPStatus.BAD_REQUEST:
+            raise ValueError(data.text)
+        self.__more_error(data)
+
+    async def get_note(self, nid: int) -> Note:
+        """
+        a note with all comments
+
+        :param nid: note id
+        :return: the identified Note
+        :raises NoneFoundError: note ID not found
+        """
+        data = await self.__request('GET', self.base_url + self.url_extension + '/notes/{}'.format(nid))
+        if data.ok:
+            return parse_notes(ElemTree.fromstring(data.text), self.timestamps)[0]
+        elif data.status_code == HTTPStatus.BAD_REQUEST:
+            raise ValueError(data.text)
+        self.__more_error(data)
+
+    async def create_note(self, text: str, lat: float, lon: float, auth) -> Note:
+        """
+        creates anonymous or user made notes depending if auth is provided
+        Authorisation optional
+
+        :param text: Note Text
+        :param lat: latitude
+        :param lon: longitude
+        :param auth: either OAuth1 object or tuple (username, password)
+        :returns: note ID
+        :raises ValueError: No text field
+        """
+        data = await self.__request('POST', self.base_url + self.url_extension + '/notes',
+                                    params={'lat': lat, 'lon': lon, 'text': text}, auth=auth)
+        if data.ok:
+            return parse_notes(ElemTree.fromstring(data.text), self.timestamps)[0]
+        elif data.status_code == HTTPStatus.BAD_REQUEST:
+            raise ValueError(data.text)
+        self.__more_error(data)
+
+    async def comment_note(self, nid: int, text: str, auth) -> Note:
+        """
+        adds a comment to the note
+        Authorisation required
+
+        :param nid: note ID
+        :param text: Text
+        :param auth: either OAuth1 object or tuple (username, password)
+        :returns: the Note itself
+        :raises ValueError: no Textfield
+        :raises NoneFoundError: note ID not found
+        :raises ConflictError: already closed Note
+        """
+        data = await self.__request('POST', self.base_url + self.url_extension + '/notes/{}/comment'.format(nid),
+                                    params={'text': text}, auth=auth)
+        if data.ok:
+            return parse_notes(ElemTree.fromstring(data.text), self.timestamps)[0]
+        elif data.status_code == HTTPStatus.BAD_REQUEST:
+            raise ValueError(data.text)
+        elif data.status_code == HTTPStatus.CONFLICT:
+            raise ConflictError(data.text)
+        self.__more_error(data)
+
+    async def close_note(self, nid: int, text: str, auth) -> Note:
+        """
+        closes a note, no comments can be added to a closed note
+        Authorisation required
+
+        :param nid: note ID
+        :param text: Closing comment
+        :param auth: either OAuth1 object or tuple (username, password)
+        :returns: the Note itself
+        :raises NoneFoundError: note ID not found
+        :raises ConflictError: already closed Note
+        """
+        data = await self.__request('POST', self.base_url + self.url_extension + '/notes/{}/close'.format(nid),
+                                    params={'text': text}, auth=auth)
+        if data.ok:
+            return parse_notes(ElemTree.fromstring(data.text), self.timestamps)[0]
+        elif data.status_code == HTTPStatus.BAD_REQUEST:
+            raise ValueError(data.text)
+        elif data.status_code == HTTPStatus.CONFLICT:
+            raise ConflictError(data.text)
+        self.__more_error(data)
+
+    async def reopen_note(self, nid: int, text: str, auth):
+        """
+        reopens a note, open for more comments
+        Authorisation required
+
+        :param nid: Note ID
+        :param text: Text
+        :param auth: either OAuth1 object or tuple (username, password)
+        :returns: the Note itself
+        :raises NoneFoundError: note ID not found
+        :raises ConflictError: already open Note
+        :raises LookupError: deleted Note
+        """
+        data = await self.__request('POST', self.base_url + self.url_extension + '/notes/{}/reopen'.format(nid),
+                                    params={'text': text}, auth=auth)
+        if data.ok:
+            return parse_notes(ElemTree.fromstring(data.text), self.timestamps)[0]
+        elif data.status_code == HTTPStatus.CONFLICT:
+            raise ConflictError(data.text)
+        elif data.status_code == HTTPStatus.GONE:
+            raise LookupError(data.text)
+        self.__more_error(data)
+
+    async def search_note(self, text: str, limit: int = 100, closed: int = 7, user: str = None,
+                          start: datetime = None, end: datetime = None,
+                          sort: str = 'updated_at', order: str = 'newest') -> list:
+        """
+        searches for notes complying all parameters
+
+        :param text: <free text>
+        :param limit: 0-1000 max amount notes returned
+        :param closed: max days closed -1=all, 0=only_open
+        :param user: User ID or Username
+        :param start: from earliest date
+        :param end: to newer date default: today
+        :param sort: created_at or updated_at
+        :param order: oldest or newest
+        :returns: list of Notes
+        :raises ValueError: When any of the limits are crossed
+        """
+        params = {'q': text, 'limit': limit, 'closed': closed, 'sort': sort, 'order': order}
+        if user:
+            if type(user) == int or (type(user) == str and user.isdigit()):
+                params['user'] = int(user)
+            else:
+                params['username'] = user
+        if start:
+            params['from'] = start.isoformat()
+        if end:
+            params['to'] = end.isoformat()
+
+        data = await self.__request('GET', self.base_url + self.url_extension + '/notes/search', params=params)
+        if data.ok:
+            return parse_notes(ElemTree.fromstring(data.text), self.timestamps)
+        elif data.status_code == HTTPStatus.BAD_REQUEST:
+            raise ValueError(data.text)
+        self.__more_error(data)
+
+    async def rss_notes(self, bbox) -> str:
+        """
+        gets a notes RSS feed of the area
+
+        :param bbox: (lon_min, lat_min, lon_max, lat_max)
+        :return: xml RSS feed
+        """
+        data = await self.__request('GET', self.base_url + self.url_extension + '/notes/feed',
+                                    params={'bbox': ','.join(map(str, bbox))})
+        if data.ok:
+            return data.text
+        self.__more_error(data)
+
+    def __parse_elems(self, xml: str) -> list:
+        elems = []
+        for sub in ElemTree.fromstring(xml):
+            elems.append(parse_elem(sub, self.timestamps, self.lazy))
+        return elems
+
+    @staticmethod
+    def __form(content: dict, name: str, trace) -> aiohttp.FormData:
+        form = aiohttp.FormData()
+        for key, value in content.items():
+            form.add_field(key, str(value))
+        form.add_field('file', trace, filename=name)
+        return form
+
+    @staticmethod
+    def __auth(auth, method: str, url: str, params: dict, data) -> dict:
+        """
+        :returns: keyword arguments authorising an aiohttp request with a (username, password) tuple
+            or a requests auth object like OAuth1, which signs a prepared copy of the request
+        """
+        if auth is None:
+            return {}
+        if isinstance(auth, tuple):
+            return {'auth': aiohttp.BasicAuth(*auth)}
+        signed = requests.Request(method, url, params=params,
+                                  data=data if isinstance(data, (dict, str, bytes)) else None).prepare()
+        auth(signed)
+        return {'headers': {'Authorization': signed.headers['Authorization']}}
+
+    def __host_slot(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self.__host_slots:
+            self.__host_slots[host] = asyncio.Semaphore(self.limit_per_host)
+        return self.__host_slots[host]
+
+    async def __request(self, method: str, url: str, params: dict = None, data=None, auth=None) -> _Response:
+        if self.session is None:
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0,
+                                                                                limit_per_host=self.limit_per_host))
+        if params:
+            params = {key: str(value) for key, value in params.items()}
+        kwargs = self.__auth(auth, method, url, params, data)
+        async with self.__host_slot(url):
+            async with self.session.request(method, url, params=params, data=data, **kwargs) as resp:
+                return _Response(resp.status, await resp.text())
+
+    def __more_error(self, data: _Response):
+        if data.status_code == HTTPStatus.NOT_FOUND:
+            raise NoneFoundError(data.text)
+        elif data.status_code == HTTPStatus.UNAUTHORIZED:
+            raise NotAuthorizedError(data.text)
+        elif data.status_code in THROTTLE_STATUS:
+            raise RateLimitError(data.text)
+        raise requests.HTTPError(data.text)
@@ -0,0 +1,331 @@
+# Uploads of any size split into diff uploads over as many changesets as needed
+import copy
+import logging
+import threading
+import time
+from pyosmapi.osm_util import *
+from pyosmapi.osm_parser import OsmChange
+from pyosmapi.exceptions import ConflictError
+
+logger = logging.getLogger(__name__)
+
+ORDER = ('node', 'way', 'relation')
+
+
+class BulkUpload:
+    """
+    Splits creates, modifies and deletes into chunks uploaded with diff_upload one after another.
+
+    - chunks are dependency ordered: created nodes, ways, relations, then modifies, then deletes
+      of relations, ways, nodes
+    - a placeholder id is only valid within one diff upload, references to placeholders uploaded in an
+      earlier chunk are rewritten to the new ids returned by diff_upload. The elements passed in are not changed.
+    - modifies and deletes of an element already changed by this upload carry the version the server returned,
+      repeated modifies within one chunk count the version up
+    - a changeset is closed and the next one opened before it would exceed its element limit
+    - run() raises on the first failing chunk, calling it again resumes with that chunk.
+      A resumed run continues in a new changeset only if the server reports the old one as closed,
+      any other conflict is raised with cid kept open, fix the elements or close it.
+      state() / state=... carry the progress to another process, pass the same elements again.
+
+    :param api: OsmApi to upload through
+    :param tags: tags of every opened changeset
+    :param auth: either OAuth1 object or tuple (username, password)
+    :param create: Elements with negative placeholder ids
+    :param modify: Elements carrying their current version
+    :param delete: Elements carrying their current version
+    :param chunk_size: elements per diff upload, defaults to the changeset limit of the capabilities
+    :param state: progress returned by state() of an earlier run
+    """
+
+    def __init__(self, api, tags: dict, auth, create=(), modify=(), delete=(), chunk_size: int = None,
+                 state: dict = None):
+        self.api = api
+        self.tags = tags
+        self.auth = auth
+        self.limit = self.__changeset_limit()
+        self.chunk_size = min(chunk_size or self.limit, self.limit)
+        ops = [('create', elem) for elem in _dependency_order(create)]
+        ops += [('modify', elem) for elem in sorted(modify, key=lambda e: ORDER.index(e.e_type))]
+        ops += [('delete', elem) for elem in sorted(delete, key=lambda e: -ORDER.index(e.e_type))]
+        self.chunks = [ops[i:i + self.chunk_size] for i in range(0, len(ops), self.chunk_size)]
+        state = state or {}
+        self.done = state.get('done', 0)
+        self.cid = state.get('cid')
+        self.cid_count = state.get('cid_count', 0)
+        self.changesets = list(state.get('changesets', []))
+        self.id_map = {(e_type, old): tuple(new) for e_type, old, *new in state.get('id_map', [])}
+        self.versions = {(e_type, eid): version for e_type, eid, version in state.get('versions', [])}
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def state(self) -> dict:
+        """
+        :returns: json serializable progress, pass it as state to resume in another process
+        """
+        return {'done': self.done, 'cid': self.cid, 'cid_count': self.cid_count, 'changesets': self.changesets,
+                'id_map': [[e_type, old, new, version] for (e_type, old), (new, version) in self.id_map.items()],
+                'versions': [[e_type, eid, version] for (e_type, eid), version in self.versions.items()]}
+
+    def run(self, close: bool = True) -> dict:
+        """
+        uploads all chunks not uploaded yet
+
+        :param close: close the last changeset when done
+        :returns: {(e_type, placeholder id): (new id, new version)}
+        """
+        resumed = self.cid is not None
+        while self.done < len(self.chunks):
+            chunk = self.chunks[self.done]
+            if self.cid is None or self.cid_count + len(chunk) > self.limit:
+                self.__next_changeset()
+            try:
+                result = self.api.diff_upload(self.cid, self.__change(chunk), self.auth)
+            except ConflictError as error:
+                if not resumed or not _changeset_closed(error):
+                    raise
+                # changeset of the interrupted run was closed in the meantime
+                logger.info(f'changeset {self.cid} closed, continuing in a new one')
+                self.cid = None
+                resumed = False
+                continue
+            resumed = False
+            for line in result:
+                if not line.get('new_id'):
+                    continue
+                self.versions[(line['type'], line['new_id'])] = line['new_version']
+                if int(line['old_id']) < 0:
+                    self.id_map[(line['type'], line['old_id'])] = (line['new_id'], line['new_version'])
+            self.cid_count += len(chunk)
+            self.done += 1
+            logger.debug(f'chunk {self.done}/{len(self.chunks)} uploaded to changeset {self.cid}')
+        if close and self.cid is not None:
+            self.api.close_changeset(self.cid, self.auth)
+            self.cid = None
+        return self.id_map
+
+    def __next_changeset(self):
+        if self.cid is not None:
+            self.api.close_changeset(self.cid, self.auth)
+        self.cid = self.api.open_changeset(self.tags, self.auth)
+        self.cid_count = 0
+        self.changesets.append(self.cid)
+
+    def __change(self, chunk: list) -> OsmChange:
+        change = OsmChange(self.cid)
+        # version an element has after the actions added to this chunk so far
+        chained = {}
+        for action, elem in chunk:
+            elem = self.__remap(elem)
+            key = (elem.e_type, str(elem.id))
+            if action == 'create':
+                chained[key] = 1
+            else:
+                if key in self.id_map:
+                    elem = copy.copy(elem)
+                    elem._id, elem.version = self.id_map[key]
+                    key = (elem.e_type, str(elem.id))
+                # versions returned by earlier uploads are newer than the one the element was passed with
+                version = chained.get(key, self.versions.get(key))
+                if version is not None and str(version) != str(elem.version):
+                    elem = copy.copy(elem)
+                    elem.version = version
+                chained[key] = int(elem.version) + 1 if elem.version is not None else None
+            if action == 'create':
+                change.create(elem)
+            elif action == 'modify':
+                change.modify(elem)
+            else:
+                change.delete(elem)
+        return change
+
+    def __remap(self, elem: Element) -> Element:
+        if isinstance(elem, Way) and any(('node', str(ref)) in self.id_map for ref in elem.nodes):
+            elem = copy.copy(elem)
+            elem.nodes = [self.id_map.get(('node', str(ref)), (ref,))[0] for ref in elem.nodes]
+        elif isinstance(elem, Relation) and any((m['type'], str(m['ref'])) in self.id_map for m in elem.members):
+            elem = copy.copy(elem)
+            elem.members = [dict(m, ref=self.id_map.get((m['type'], str(m['ref'])), (m['ref'],))[0])
+                            for m in elem.members]
+        return elem
+
+    def __changeset_limit(self) -> int:
+        try:
+            return int(self.api.get_api_capabilities()['changesets']['maximum_elements'])
+        except (KeyError, TypeError, ValueError):
+            return 10000
+
+
+def _changeset_closed(error: ConflictError) -> bool:
+    """
+    :returns: True if the conflict is 'The changeset ... was closed at ...' and not about the elements
+    """
+    return 'was closed at' in str(error.message)
+
+
+def _dependency_order(elems) -> list:
+    """
+    nodes, ways, then relations, a new relation follows the new relations it has as members
+    """
+    elems = list(elems)
+    ordered = [elem for e_type in ('node', 'way') for elem in elems if elem.e_type == e_type]
+    relations = {str(elem.id): elem for elem in elems if elem.e_type == 'relation'}
+    placed = set()
+
+    def place(rid: str, path: set):
+        if rid in placed or rid in path:
+            return
+        path.add(rid)
+        for member in relations[rid].members:
+            if member['type'] == 'relation' and str(member['ref']) in relations:
+                place(str(member['ref']), path)
+        placed.add(rid)
+        ordered.append(relations[rid])
+
+    for rid in relations:
+        place(rid, set())
+    return ordered
+
+
+class ChangesetSession:
+    """
+    Write-behind changeset: create, edit and delete are buffered and sent as one diff upload once
+    max_pending changes are buffered or the oldest buffered change is max_delay seconds old.
+    The thresholds are checked on every call, flush() sends the buffer right away.
+    Leaving the with block flushes the buffer and closes the changeset, after an exception the buffer is dropped.
+    Elements passed in are not changed, ids of created elements are replaced in later flushes like in BulkUpload.
+    A flush failing on a network or server error is resumed by the next flush. A flush rejected with a conflict
+    is raised once and not sent again, its changes not uploaded are kept in rejected to be fixed and passed again.
+
+    :param api: OsmApi to upload through
+    :param tags: tags of the opened changeset(s)
+    :param auth: either OAuth1 object or tuple (username, password)
+    :param max_pending: buffered changes that trigger a flush
+    :param max_delay: seconds after which buffered changes are flushed
+    """
+
+    def __init__(self, api, tags: dict, auth, max_pending: int = 1000, max_delay: float = 60.0):
+        self.api = api
+        self.tags = tags
+        self.auth = auth
+        self.max_pending = max_pending
+        self.max_delay = max_delay
+        self.ids = {}
+        self.versions = {}
+        self.flushes = 0
+        self.rejected = []
+        self._pending = {'create': [], 'modify': [], 'delete': []}
+        self._count = 0
+        self._oldest = None
+        self._placeholder = 0
+        self._state = None
+        self._failed = None
+        self._lock = threading.RLock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.close(flush=False)
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def changesets(self) -> list:
+        return list(self._state['changesets']) if self._state else []
+
+    def create(self, elem: Element) -> str:
+        """
+        :param elem: new Element, an element without id gets the next free placeholder id
+        :returns: placeholder id, see ids for the new id after the flush
+        """
+        with self._lock:
+            if elem.id is None:
+                self._placeholder -= 1
+                elem = copy.copy(elem)
+                elem._id = str(self._placeholder)
+            else:
+                self._placeholder = min(self._placeholder, int(elem.id))
+            self.__add('create', elem)
+            return str(elem.id)
+
+    def edit(self, elem: Element):
+        """
+        :param elem: changed Element carrying its current version
+        """
+        with self._lock:
+            self.__add('modify', elem)
+
+    def delete(self, elem: Element):
+        """
+        :param elem: Element carrying its current version
+        """
+        with self._lock:
+            self.__add('delete', elem)
+
+    def flush(self) -> dict:
+        """
+        uploads all buffered changes
+
+        :returns: {(e_type, placeholder id): (new id, new version)} of the elements created by this flush
+        """
+        with self._lock:
+            known = set(self.ids)
+            if self._failed is not None:
+                self.__run(self._failed)
+            if self._count:
+                state = dict(self._state or {}, done=0)
+                upload = BulkUpload(self.api, self.tags, self.auth, state=state, **self._pending)
+                self._pending = {'create': [], 'modify': [], 'delete': []}
+                self._count = 0
+                self._oldest = None
+                self.__run(upload)
+            return {key: value for key, value in self.ids.items() if key not in known}
+
+    def close(self, flush: bool = True):
+        """
+        flushes the buffer and closes the open changeset, also if the flush raises
+
+        :param flush: False drops buffered changes
+        """
+        with self._lock:
+            try:
+                if flush:
+                    self.flush()
+                else:
+                    self._pending = {'create': [], 'modify': [], 'delete': []}
+                    self._count = 0
+                    self._failed = None
+            finally:
+                if self._state and self._state.get('cid') is not None:
+                    self.api.close_changeset(self._state['cid'], self.auth)
+                    self._state['cid'] = None
+
+    def __run(self, upload: BulkUpload):
+        # a failed upload is kept and resumed by the next flush, a rejected one would only fail again
+        self._failed = upload
+        try:
+            upload.run(close=False)
+        except ConflictError:
+            self._failed = None
+            self.rejected = [op for chunk in upload.chunks[upload.done:] for op in chunk]
+            raise
+        finally:
+            self._state = upload.state()
+            self.ids.update(upload.id_map)
+            self.versions.update(upload.versions)
+        self._failed = None
+        self.flushes += 1
+
+    def __add(self, action: str, elem: Element):
+        self._pending[action].append(elem)
+        self._count += 1
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+        if self._count >= self.max_pending or time.monotonic() - self._oldest >= self.max_delay:
+            self.flush()
@@ -0,0 +1,226 @@
+# Caches for element versions and conditional requests
+from collections import OrderedDict
+import copy
+import sqlite3
+import threading
+import time
+
+
+class VersionCache:
+    """
+    SQLite store of element versions keyed by (type, id, version).
+    A version of an element never changes once it exists, so entries never go stale.
+    The least recently used entries are evicted once the stored xml exceeds max_bytes.
+
+    :param path: database file, ':memory:' keeps the cache for the lifetime of the object only
+    :param max_bytes: upper bound for the stored xml, defaults to 256 MiB
+    """
+
+    def __init__(self, path: str = 'pyosmapi_versions.sqlite', max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS versions (e_type TEXT, eid INTEGER, version INTEGER, '
+                           'xml BLOB, size INTEGER, used REAL, PRIMARY KEY (e_type, eid, version))')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS versions_used ON versions (used)')
+        self._conn.commit()
+        self._size = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM versions').fetchone()[0]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM versions').fetchone()[0]
+
+    def __contains__(self, key: tuple):
+        e_type, eid, version = key
+        with self._lock:
+            return self._conn.execute('SELECT 1 FROM versions WHERE e_type = ? AND eid = ? AND version = ?',
+                                      (e_type, int(eid), int(version))).fetchone() is not None
+
+    @property
+    def size(self) -> int:
+        """
+        :returns: bytes of xml currently stored
+        """
+        return self._size
+
+    def stats(self) -> dict:
+        """
+        :returns: hits, misses, evictions, entries and stored bytes
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': len(self), 'bytes': self._size}
+
+    def get(self, e_type: str, eid: int, version: int) -> bytes:
+        """
+        :returns: xml of the element version or None if it is not cached
+        """
+        key = (e_type, int(eid), int(version))
+        with self._lock:
+            row = self._conn.execute('SELECT xml FROM versions WHERE e_type = ? AND eid = ? AND version = ?',
+                                     key).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute('UPDATE versions SET used = ? WHERE e_type = ? AND eid = ? AND version = ?',
+                               (time.time(),) + key)
+            self._conn.commit()
+            return row[0]
+
+    def put(self, e_type: str, eid: int, version: int, xml: bytes):
+        """
+        stores one element version, evicting least recently used versions if max_bytes is exceeded
+
+        :param xml: serialized <node>/<way>/<relation> element
+        """
+        self.put_many([(e_type, eid, version, xml)])
+
+    def put_many(self, entries: list):
+        """
+        :param entries: list of (e_type, eid, version, xml), stored in one transaction
+        """
+        now = time.time()
+        with self._lock:
+            for e_type, eid, version, xml in entries:
+                if len(xml) > self.max_bytes:
+                    continue
+                key = (e_type, int(eid), int(version))
+                old = self._conn.execute('SELECT size FROM versions WHERE e_type = ? AND eid = ? AND version = ?',
+                                         key).fetchone()
+                if old:
+                    self._size -= old[0]
+                self._conn.execute('INSERT OR REPLACE INTO versions VALUES (?, ?, ?, ?, ?, ?)',
+                                   key + (xml, len(xml), now))
+                self._size += len(xml)
+            self.__evict()
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM versions')
+            self._conn.commit()
+            self._size = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __evict(self):
+        while self._size > self.max_bytes:
+            rows = self._conn.execute('SELECT rowid, size FROM versions ORDER BY used LIMIT 64').fetchall()
+            if not rows:
+                self._size = 0
+                return
+            for rowid, size in rows:
+                if self._size <= self.max_bytes:
+                    break
+                self._conn.execute('DELETE FROM versions WHERE rowid = ?', (rowid,))
+                self._size -= size
+                self.evictions += 1
+
+
+class ConditionalCache:
+    """
+    In-memory LRU store of parsed responses with their ETag / Last-Modified validators.
+    A 304 Not Modified answer is served with the stored object without parsing anything.
+    By default every hit is a deep copy, changes callers make to returned objects never reach the cache.
+    Copying a large map or changeset costs about as much as parsing it again, with copies=False all hits
+    share the stored object, which callers must then treat as read-only.
+
+    :param max_bytes: upper bound for the summed body sizes of the cached responses, defaults to 32 MiB
+    :param copies: hand out a deep copy on every hit and store a copy on put
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, copies: bool = True):
+        self.max_bytes = max_bytes
+        self.copies = copies
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, url: str):
+        return url in self._entries
+
+    @property
+    def size(self) -> int:
+        """
+        :returns: summed body sizes of the cached responses
+        """
+        return self._size
+
+    def stats(self) -> dict:
+        """
+        :returns: hits (304 answers), misses, evictions, entries and cached bytes
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': len(self._entries), 'bytes': self._size}
+
+    def validators(self, url: str) -> dict:
+        """
+        :returns: If-None-Match / If-Modified-Since headers for a cached url, empty if the url is not cached
+        """
+        with self._lock:
+            entry = self._entries.get(url)
+        if entry is None:
+            return {}
+        etag, modified = entry[0], entry[1]
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if modified:
+            headers['If-Modified-Since'] = modified
+        return headers
+
+    def hit(self, url: str):
+        """
+        :returns: parsed object stored for url (a copy unless copies is off), None if it was evicted in the meantime.
+            The following fetch is counted as miss by put.
+        """
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return None
+            self._entries.move_to_end(url)
+            self.hits += 1
+            obj = entry[2]
+        # every caller gets its own copy, local changes must not show up in later hits
+        return copy.deepcopy(obj) if self.copies else obj
+
+    def put(self, url: str, etag: str, modified: str, obj, size: int):
+        """
+        stores obj (a copy unless copies is off) for url if the response carried a validator, least recently used entries are evicted
+
+        :param etag: ETag header of the response
+        :param modified: Last-Modified header of the response
+        :param obj: parsed response
+        :param size: body size in bytes
+        """
+        with self._lock:
+            self.misses += 1
+            old = self._entries.pop(url, None)
+            if old is not None:
+                self._size -= old[3]
+            if not (etag or modified) or size > self.max_bytes:
+                return
+            # the caller keeps obj, the cache holds its own snapshot
+            self._entries[url] = (etag, modified, copy.deepcopy(obj) if self.copies else obj, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, entry = self._entries.popitem(last=False)
+                self._size -= entry[3]
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
@@ -0,0 +1,214 @@
+# Columnar element container, requires numpy
+from array import array
+import xml.etree.ElementTree as ElemTree
+import numpy as np
+
+MEMBER_TYPES = ('node', 'way', 'relation')
+
+
+class TagTable:
+    """
+    dictionary encoded tags of one element type.
+    Tags of element i are keys[key_ids[offsets[i]:offsets[i + 1]]] and values[value_ids[...]]
+    """
+
+    def __init__(self, keys: list, values: list, key_ids: np.ndarray, value_ids: np.ndarray, offsets: np.ndarray):
+        self.keys = keys
+        self.values = values
+        self.key_ids = key_ids
+        self.value_ids = value_ids
+        self.offsets = offsets
+
+    def __getitem__(self, index: int) -> dict:
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return {self.keys[k]: self.values[v] for k, v in zip(self.key_ids[start:end], self.value_ids[start:end])}
+
+    def has(self, key: str, value: str = None) -> np.ndarray:
+        """
+        :returns: bool array, True for every element carrying the key (and value if given)
+        """
+        found = np.zeros(len(self.offsets) - 1, dtype=bool)
+        if key not in self.keys:
+            return found
+        match = self.key_ids == self.keys.index(key)
+        if value is not None:
+            if value not in self.values:
+                return found
+            match &= self.value_ids == self.values.index(value)
+        owner = np.searchsorted(self.offsets, np.nonzero(match)[0], side='right') - 1
+        found[owner] = True
+        return found
+
+
+class ElementStore:
+    """
+    Nodes, Ways and Relations of a /map, /full or /history response held in numpy arrays instead of objects.
+
+    - nodes: node_ids int64, node_versions int32, node_lat / node_lon float64
+    - ways: way_ids, way_versions, node refs of way i in way_refs[way_offsets[i]:way_offsets[i + 1]]
+    - relations: relation_ids, relation_versions, members in member_types (index of MEMBER_TYPES),
+      member_refs, member_roles (index of roles) sliced by member_offsets
+    - tags: node_tags, way_tags, relation_tags as TagTable
+    """
+
+    def __init__(self, arrays: dict, roles: list, tags: dict):
+        self.node_ids = arrays['node_ids']
+        self.node_versions = arrays['node_versions']
+        self.node_lat = arrays['node_lat']
+        self.node_lon = arrays['node_lon']
+        self.way_ids = arrays['way_ids']
+        self.way_versions = arrays['way_versions']
+        self.way_refs = arrays['way_refs']
+        self.way_offsets = arrays['way_offsets']
+        self.relation_ids = arrays['relation_ids']
+        self.relation_versions = arrays['relation_versions']
+        self.member_types = arrays['member_types']
+        self.member_refs = arrays['member_refs']
+        self.member_roles = arrays['member_roles']
+        self.member_offsets = arrays['member_offsets']
+        self.roles = roles
+        self.node_tags = tags['node']
+        self.way_tags = tags['way']
+        self.relation_tags = tags['relation']
+
+    def __len__(self):
+        return len(self.node_ids) + len(self.way_ids) + len(self.relation_ids)
+
+    def __repr__(self):
+        return f'ElementStore(nodes={len(self.node_ids)}, ways={len(self.way_ids)}, ' \
+               f'relations={len(self.relation_ids)})'
+
+    def bbox_mask(self, bbox: tuple) -> np.ndarray:
+        """
+        :param bbox: (min_lon, min_lat, max_lon, max_lat)
+        :returns: bool array over the nodes, True for nodes inside bbox
+        """
+        min_lon, min_lat, max_lon, max_lat = bbox
+        return (self.node_lon >= min_lon) & (self.node_lon <= max_lon) & \
+               (self.node_lat >= min_lat) & (self.node_lat <= max_lat)
+
+    def node_index(self, refs: np.ndarray) -> np.ndarray:
+        """
+        :param refs: node ids
+        :returns: position of every ref in node_ids, -1 where the node is not in this store
+        """
+        if not len(self.node_ids):
+            return np.full(len(refs), -1, dtype=np.int64)
+        order = np.argsort(self.node_ids, kind='stable')
+        sorted_ids = self.node_ids[order]
+        pos = np.minimum(np.searchsorted(sorted_ids, refs), len(sorted_ids) - 1)
+        return np.where(sorted_ids[pos] == refs, order[pos], -1)
+
+    def way_coords(self) -> tuple:
+        """
+        joins all way node refs to node coordinates at once
+
+        :returns: (lat, lon) float64 arrays aligned with way_refs, NaN for refs of nodes not in this store.
+            Slice with way_offsets to get the coordinates of a single way.
+        """
+        index = self.node_index(self.way_refs)
+        missing = index < 0
+        lat = self.node_lat[index]
+        lon = self.node_lon[index]
+        lat[missing] = np.nan
+        lon[missing] = np.nan
+        return lat, lon
+
+    @classmethod
+    def from_xml(cls, source) -> 'ElementStore':
+        """
+        builds the store straight from an <osm> document without creating Element objects
+
+        :param source: file name or binary file-like object, e.g. a streamed response.raw
+        """
+        builder = _StoreBuilder()
+        depth = 0
+        root = None
+        current = None
+        for event, elem in ElemTree.iterparse(source, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = elem
+                elif depth == 1 and elem.tag in MEMBER_TYPES:
+                    current = elem.tag
+                    builder.begin(elem)
+                elif depth == 2 and current:
+                    builder.child(current, elem)
+                depth += 1
+                continue
+            depth -= 1
+            if depth == 1:
+                if current:
+                    builder.end(current)
+                current = None
+                root.clear()
+        return builder.build()
+
+
+class _StoreBuilder:
+    def __init__(self):
+        self.ids = {t: array('q') for t in MEMBER_TYPES}
+        self.versions = {t: array('i') for t in MEMBER_TYPES}
+        self.node_lat = array('d')
+        self.node_lon = array('d')
+        self.way_refs = array('q')
+        self.way_offsets = array('q', [0])
+        self.member_types = array('b')
+        self.member_refs = array('q')
+        self.member_roles = array('i')
+        self.member_offsets = array('q', [0])
+        self.roles = {}
+        self.keys = {}
+        self.values = {}
+        self.key_ids = {t: array('i') for t in MEMBER_TYPES}
+        self.value_ids = {t: array('i') for t in MEMBER_TYPES}
+        self.tag_offsets = {t: array('q', [0]) for t in MEMBER_TYPES}
+
+    def begin(self, elem: ElemTree.Element):
+        self.ids[elem.tag].append(int(elem.get('id')))
+        self.versions[elem.tag].append(int(elem.get('version') or 0))
+        if elem.tag == 'node':
+            self.node_lat.append(float(elem.get('lat', 'nan')))
+            self.node_lon.append(float(elem.get('lon', 'nan')))
+
+    def child(self, e_type: str, elem: ElemTree.Element):
+        if elem.tag == 'tag':
+            self.key_ids[e_type].append(self.keys.setdefault(elem.get('k'), len(self.keys)))
+            self.value_ids[e_type].append(self.values.setdefault(elem.get('v'), len(self.values)))
+        elif elem.tag == 'nd':
+            self.way_refs.append(int(elem.get('ref')))
+        elif elem.tag == 'member':
+            self.member_types.append(MEMBER_TYPES.index(elem.get('type')))
+            self.member_refs.append(int(elem.get('ref')))
+            self.member_roles.append(self.roles.setdefault(elem.get('role', ''), len(self.roles)))
+
+    def end(self, e_type: str):
+        self.tag_offsets[e_type].append(len(self.key_ids[e_type]))
+        if e_type == 'way':
+            self.way_offsets.append(len(self.way_refs))
+        elif e_type == 'relation':
+            self.member_offsets.append(len(self.member_refs))
+
+    def build(self) -> ElementStore:
+        keys = list(self.keys)
+        values = list(self.values)
+        tags = {t: TagTable(keys, values, np.array(self.key_ids[t], dtype=np.int32),
+                            np.array(self.value_ids[t], dtype=np.int32), np.array(self.tag_offsets[t], dtype=np.int64))
+                for t in MEMBER_TYPES}
+        arrays = {
+            'node_ids': np.array(self.ids['node'], dtype=np.int64),
+            'node_versions': np.array(self.versions['node'], dtype=np.int32),
+            'node_lat': np.array(self.node_lat, dtype=np.float64),
+            'node_lon': np.array(self.node_lon, dtype=np.float64),
+            'way_ids': np.array(self.ids['way'], dtype=np.int64),
+            'way_versions': np.array(self.versions['way'], dtype=np.int32),
+            'way_refs': np.array(self.way_refs, dtype=np.int64),
+            'way_offsets': np.array(self.way_offsets, dtype=np.int64),
+            'relation_ids': np.array(self.ids['relation'], dtype=np.int64),
+            'relation_versions': np.array(self.versions['relation'], dtype=np.int32),
+            'member_types': np.array(self.member_types, dtype=np.int8),
+            'member_refs': np.array(self.member_refs, dtype=np.int64),
+            'member_roles': np.array(self.member_roles, dtype=np.int32),
+            'member_offsets': np.array(self.member_offsets, dtype=np.int64),
+        }
+        return ElementStore(arrays, list(self.roles), tags)
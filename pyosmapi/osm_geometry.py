@@ -0,0 +1,180 @@
+# Way and multipolygon geometries from a node id -> coordinate index
+from itertools import chain
+from pyosmapi.osm_util import *
+
+
+class GeometryResolver:
+    """
+    Resolves way node refs to coordinates, e.g. over the result of get_full_element or get_element_bbox.
+    Refs of nodes not given are reported as missing instead of raising.
+    way_arrays and way_lengths resolve all ways at once with numpy (optional dependency).
+
+    :param elems: Nodes, Ways and Relations
+    """
+
+    def __init__(self, elems=()):
+        self.coords = {}
+        self.ways = {}
+        self.relations = {}
+        self._sorted = None
+        self.add(elems)
+
+    def add(self, elems):
+        self._sorted = None
+        for elem in elems:
+            if isinstance(elem, Node):
+                if elem.lat is not None:
+                    self.coords[str(elem.id)] = (float(elem.lat), float(elem.lon))
+            elif isinstance(elem, Way):
+                self.ways[str(elem.id)] = elem
+            elif isinstance(elem, Relation):
+                self.relations[str(elem.id)] = elem
+
+    def way(self, way: Way) -> tuple:
+        """
+        :returns: ([(lat, lon)] of the known nodes, [refs of missing nodes])
+        """
+        return self.__resolve(way.nodes)
+
+    def __resolve(self, refs: list) -> tuple:
+        coords = []
+        missing = []
+        for ref in refs:
+            coord = self.coords.get(str(ref))
+            if coord is None:
+                missing.append(ref)
+            else:
+                coords.append(coord)
+        return coords, missing
+
+    def all_ways(self, ways=None) -> tuple:
+        """
+        :param ways: Ways, defaults to all ways added
+        :returns: ({way id: [(lat, lon)]}, {way id: [missing refs]}) with only incomplete ways in the second dict
+        """
+        geometries = {}
+        missing = {}
+        for way in self.ways.values() if ways is None else ways:
+            geometries[str(way.id)], lost = self.way(way)
+            if lost:
+                missing[str(way.id)] = lost
+        return geometries, missing
+
+    def way_arrays(self, ways=None) -> dict:
+        """
+        all way coordinates at once, requires numpy
+
+        :param ways: Ways, defaults to all ways added
+        :returns: {'ids', 'lat', 'lon', 'offsets', 'missing'} numpy arrays. Coordinates of way i are
+            lat[offsets[i]:offsets[i + 1]], NaN where missing[...] marks a ref of an unknown node.
+        """
+        import numpy as np
+        ways = list(self.ways.values() if ways is None else ways)
+        if self._sorted is None:
+            node_ids = np.fromiter(self.coords.keys(), dtype=np.int64, count=len(self.coords))
+            node_coords = np.array(list(self.coords.values()), dtype=np.float64).reshape(-1, 2)
+            order = np.argsort(node_ids)
+            self._sorted = node_ids[order], node_coords[order]
+        node_ids, node_coords = self._sorted
+        counts = np.fromiter((len(way.nodes) for way in ways), dtype=np.int64, count=len(ways))
+        offsets = np.zeros(len(ways) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        refs = np.array(list(chain.from_iterable(way.nodes for way in ways)), dtype=np.int64).reshape(-1)
+        if len(node_ids):
+            pos = np.minimum(np.searchsorted(node_ids, refs), len(node_ids) - 1)
+            missing = node_ids[pos] != refs
+            lat = node_coords[pos, 0]
+            lon = node_coords[pos, 1]
+        else:
+            missing = np.ones(len(refs), dtype=bool)
+            lat = np.empty(len(refs))
+            lon = np.empty(len(refs))
+        lat[missing] = np.nan
+        lon[missing] = np.nan
+        return {'ids': np.array([int(way.id) for way in ways], dtype=np.int64),
+                'lat': lat, 'lon': lon, 'offsets': offsets, 'missing': missing}
+
+    def way_lengths(self, ways=None):
+        """
+        great circle length of every way in meters, segments touching a missing node count 0, requires numpy
+
+        :returns: (way ids, lengths) numpy arrays
+        """
+        import numpy as np
+        arrays = self.way_arrays(ways)
+        lat = np.radians(arrays['lat'])
+        lon = np.radians(arrays['lon'])
+        offsets = arrays['offsets']
+        a = np.sin(np.diff(lat) / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lon) / 2) ** 2
+        segments = np.nan_to_num(2 * EARTH_RAD * np.arcsin(np.sqrt(np.minimum(a, 1.0))))
+        # drop the segments joining the last node of a way to the first node of the next one
+        cumulative = np.concatenate(([0.0], np.cumsum(segments)))
+        ends = np.maximum(offsets[1:] - 1, offsets[:-1])
+        return arrays['ids'], cumulative[ends] - cumulative[offsets[:-1]]
+
+    def multipolygon(self, relation: Relation) -> dict:
+        """
+        joins the outer and inner member ways of a multipolygon or boundary relation into rings
+
+        :returns: {'outer': [[(lat, lon)]], 'inner': [[(lat, lon)]], 'open': refs lists of rings that could not
+            be closed, 'missing_ways': [way ids], 'missing_nodes': [node refs]}
+        """
+        result = {'outer': [], 'inner': [], 'open': [], 'missing_ways': [], 'missing_nodes': []}
+        for role in ('outer', 'inner'):
+            segments = []
+            for member in relation.members:
+                if member['type'] != 'way' or (member.get('role') or 'outer') != role:
+                    continue
+                way = self.ways.get(str(member['ref']))
+                if way is None:
+                    result['missing_ways'].append(member['ref'])
+                elif len(way.nodes) > 1:
+                    segments.append([str(ref) for ref in way.nodes])
+            for ring in _join_rings(segments):
+                if ring[0] != ring[-1]:
+                    result['open'].append(ring)
+                    continue
+                coords, missing = self.__resolve(ring)
+                result['missing_nodes'] += missing
+                result[role].append(coords)
+        return result
+
+    def multipolygons(self, relations=None) -> dict:
+        """
+        :param relations: Relations, defaults to all multipolygon and boundary relations added
+        :returns: {relation id: multipolygon(relation)}
+        """
+        if relations is None:
+            relations = [relation for relation in self.relations.values()
+                         if relation.tags.get('type') in ('multipolygon', 'boundary')]
+        return {str(relation.id): self.multipolygon(relation) for relation in relations}
+
+
+def _join_rings(segments: list) -> list:
+    """
+    joins node ref lists sharing end points
+
+    :returns: node ref lists, closed rings start and end with the same ref
+    """
+    ends = {}
+    for index, segment in enumerate(segments):
+        ends.setdefault(segment[0], []).append(index)
+        ends.setdefault(segment[-1], []).append(index)
+    used = [False] * len(segments)
+    rings = []
+    for start, segment in enumerate(segments):
+        if used[start]:
+            continue
+        used[start] = True
+        ring = list(segment)
+        while ring[0] != ring[-1]:
+            candidates = [index for index in ends.get(ring[-1], ()) if not used[index]]
+            if not candidates:
+                break
+            index = candidates[0]
+            used[index] = True
+            following = segments[index]
+            ring += following[1:] if following[0] == ring[-1] else following[-2::-1]
+        rings.append(ring)
+    return rings
+
@@ -0,0 +1,254 @@
+# GPS trackpoints in compact arrays and concurrent paging of the trackpoints endpoint
+from array import array
+import bz2
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import logging
+import os
+import uuid
+import xml.etree.ElementTree as ElemTree
+import zlib
+from pyosmapi.osm_util import EPOCH, decode_timestamp
+
+logger = logging.getLogger(__name__)
+
+NAN = float('nan')
+
+CONTENT_TYPES = {'.gz': 'application/gzip', '.bz2': 'application/x-bzip2', '.zip': 'application/zip'}
+
+
+class TrackPoints:
+    """
+    trackpoints as stdlib arrays of doubles, time in epoch seconds and NaN where the trace has no timestamps.
+    Points of segment i are lat[segments[i]:segments[i + 1]], the last segment ends at len(self).
+    numpy.frombuffer(points.lat) gives a numpy view without copying.
+    """
+
+    def __init__(self):
+        self.lat = array('d')
+        self.lon = array('d')
+        self.time = array('d')
+        self.segments = array('q')
+
+    def __len__(self):
+        return len(self.lat)
+
+    def __getitem__(self, index: int) -> tuple:
+        """
+        :returns: (lat, lon, epoch seconds)
+        """
+        return self.lat[index], self.lon[index], self.time[index]
+
+    def __repr__(self):
+        return f'TrackPoints({len(self)} points, {len(self.segments)} segments)'
+
+    def extend(self, other: 'TrackPoints'):
+        """
+        appends the points and segments of other
+        """
+        offset = len(self)
+        self.segments.extend(start + offset for start in other.segments)
+        self.lat.extend(other.lat)
+        self.lon.extend(other.lon)
+        self.time.extend(other.time)
+
+    @classmethod
+    def from_xml(cls, source) -> 'TrackPoints':
+        """
+        incrementally parses a GPX document
+
+        :param source: file name or binary file object, e.g. the raw stream of a response
+        """
+        points = cls()
+        lat = points.lat
+        lon = points.lon
+        times = points.time
+        stamp = None
+        for event, elem in ElemTree.iterparse(source, events=('start', 'end')):
+            tag = elem.tag.rpartition('}')[2]
+            if event == 'start':
+                if tag == 'trkseg':
+                    points.segments.append(len(lat))
+                continue
+            if tag == 'time':
+                stamp = elem.text
+            elif tag == 'trkpt':
+                lat.append(float(elem.get('lat')))
+                lon.append(float(elem.get('lon')))
+                times.append(_epoch(stamp) if stamp else NAN)
+                stamp = None
+                elem.clear()
+            elif tag == 'trkseg':
+                elem.clear()
+        return points
+
+
+def _epoch(value: str) -> float:
+    # same decoding as element timestamps, fractional seconds are kept
+    return (decode_timestamp(value) - EPOCH).total_seconds()
+
+
+def harvest_pages(fetch, per_page: int, workers: int = 4, max_pages: int = None) -> TrackPoints:
+    """
+    fetches pages 0, 1, 2, ... with up to workers pages in flight until the first page
+    with less than per_page points. Pages requested beyond it are dropped.
+
+    :param fetch: callable(page) -> TrackPoints
+    :param per_page: points of a full page
+    :param workers: pages fetched at once
+    :param max_pages: stop after this many pages even if all are full
+    :returns: TrackPoints of all pages in page order
+    """
+    pages = {}
+    last = None if max_pages is None else max_pages - 1
+    following = 0
+    with ThreadPoolExecutor(workers) as pool:
+        pending = {}
+        while True:
+            while len(pending) < workers and (last is None or following <= last):
+                pending[pool.submit(fetch, following)] = following
+                following += 1
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                page = pending.pop(future)
+                if last is not None and page > last:
+                    continue
+                pages[page] = future.result()
+                if len(pages[page]) < per_page:
+                    last = page
+                    logger.debug(f'page {page} has {len(pages[page])} points, last page')
+            for future, page in list(pending.items()):
+                if last is not None and page > last and future.cancel():
+                    del pending[future]
+    points = TrackPoints()
+    for page in sorted(pages):
+        points.extend(pages[page])
+    return points
+
+
+class MultipartStream:
+    """
+    multipart/form-data body streamed in chunks, the trace is never read into memory as a whole.
+    Iterating again starts over, which needs a path, bytes or a seekable file object.
+    len() is 0 if the size is not known in advance (stream or compress), requests then sends it chunked.
+
+    :param fields: form fields sent before the file
+    :param trace: GPX document as str or bytes, path (str without '<' or os.PathLike) or binary file object.
+        Files ending with .gz, .bz2 or .zip are sent as they are.
+    :param name: file name on osm, the compression suffix of trace or compress is appended if missing
+    :param compress: 'gz' or 'bz2' compresses a trace not compressed yet while sending
+    :param chunk_size: bytes read from the trace at once
+    """
+
+    def __init__(self, fields: dict, trace, name: str = None, compress: str = None, chunk_size: int = 65536):
+        if compress not in (None, 'gz', 'bz2'):
+            raise ValueError(f'unknown compression {compress}')
+        self.boundary = uuid.uuid4().hex
+        self.compress = compress
+        self.chunk_size = chunk_size
+        self._data = None
+        self._path = None
+        self._file = None
+        self._start = None
+        self._read = False
+        if isinstance(trace, str) and '<' in trace:
+            trace = trace.encode('utf-8')
+        if isinstance(trace, (bytes, bytearray, memoryview)):
+            self._data = bytes(trace)
+            size = len(self._data)
+            source = None
+        elif isinstance(trace, (str, os.PathLike)):
+            self._path = os.fspath(trace)
+            size = os.path.getsize(self._path)
+            source = self._path
+        else:
+            self._file = trace
+            size = None
+            source = getattr(trace, 'name', None)
+            if _seekable(trace):
+                self._start = trace.tell()
+                size = trace.seek(0, os.SEEK_END) - self._start
+                trace.seek(self._start)
+        name = name or (os.path.basename(source) if isinstance(source, str) else 'trace.gpx')
+        suffix = os.path.splitext(source)[1].lower() if isinstance(source, str) else ''
+        if suffix in CONTENT_TYPES:
+            # already compressed
+            compress = self.compress = None
+        elif compress:
+            suffix = '.' + compress
+        if suffix in CONTENT_TYPES and not name.endswith(suffix):
+            name += suffix
+        self.name = name
+        content_type = CONTENT_TYPES.get(os.path.splitext(name)[1], 'application/gpx+xml')
+        head = b''.join(self.__field(key, value) for key, value in fields.items())
+        head += (f'--{self.boundary}\r\nContent-Disposition: form-data; name="file"; filename="{name}"\r\n'
+                 f'Content-Type: {content_type}\r\n\r\n').encode('utf-8')
+        self._head = head
+        self._tail = f'\r\n--{self.boundary}--\r\n'.encode('utf-8')
+        self.size = None if size is None or compress else len(head) + size + len(self._tail)
+
+    @property
+    def content_type(self) -> str:
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    @property
+    def replayable(self) -> bool:
+        """
+        :returns: False for a trace stream that can not be rewound, the body can then be sent only once
+        """
+        return self._file is None or self._start is not None
+
+    def __len__(self):
+        return self.size or 0
+
+    def __bool__(self):
+        # requests replaces a falsy body by an empty form
+        return True
+
+    def __iter__(self):
+        yield self._head
+        chunks = self.__chunks()
+        if self.compress == 'gz':
+            chunks = _compressed(chunks, zlib.compressobj(9, zlib.DEFLATED, 31))
+        elif self.compress == 'bz2':
+            chunks = _compressed(chunks, bz2.BZ2Compressor())
+        yield from chunks
+        yield self._tail
+
+    def __chunks(self):
+        if self._data is not None:
+            for start in range(0, len(self._data), self.chunk_size):
+                yield self._data[start:start + self.chunk_size]
+            return
+        if self._path is not None:
+            with open(self._path, 'rb') as file:
+                yield from iter(lambda: file.read(self.chunk_size), b'')
+            return
+        if self._start is not None:
+            self._file.seek(self._start)
+        elif self._read:
+            raise ValueError('trace stream was already sent and can not be rewound')
+        self._read = True
+        yield from iter(lambda: self._file.read(self.chunk_size), b'')
+
+    def __field(self, key: str, value) -> bytes:
+        if isinstance(value, bool):
+            value = str(value).lower()
+        return (f'--{self.boundary}\r\nContent-Disposition: form-data; name="{key}"\r\n\r\n'
+                f'{value}\r\n').encode('utf-8')
+
+
+def _seekable(file) -> bool:
+    try:
+        return file.seekable()
+    except (AttributeError, ValueError):
+        return False
+
+
+def _compressed(chunks, compressor):
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
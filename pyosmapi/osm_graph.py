@@ -0,0 +1,130 @@
+# Relation membership graph resolved level by level with batched fetches
+import logging
+from pyosmapi.osm_util import *
+from pyosmapi.exceptions import NoneFoundError
+
+logger = logging.getLogger(__name__)
+
+
+class RelationResolver:
+    """
+    Walks the members of relations (route masters, boundary hierarchies) breadth first.
+    A starting relation not cached yet is fetched with get_full_element, which brings its direct members along.
+    Every further level fetches the unknown members with one get_elements_bulk call per element type.
+    Elements fetched by any earlier resolve with the same cache are taken from it, missing and deleted ids
+    are cached as None and not asked for again.
+
+    :param api: OsmApi to fetch through
+    :param cache: {(e_type, id): Element or None} shared between resolvers, a new dict if omitted
+    :param way_nodes: fetch the nodes of member ways as well
+    """
+
+    def __init__(self, api, cache: dict = None, way_nodes: bool = False):
+        self.api = api
+        self.cache = {} if cache is None else cache
+        self.way_nodes = way_nodes
+        self.fetched = 0
+        self.requests = 0
+
+    def resolve(self, rid: int, depth: int = None) -> dict:
+        """
+        :param rid: relation id to start from
+        :param depth: member levels to resolve, 1 only direct members, None all
+        :returns: {'elements': {(e_type, id): Element}, 'missing': [(e_type, id)], 'cycles': [[relation ids]],
+            'depth': levels resolved}
+        """
+        root = ('relation', str(rid))
+        if root not in self.cache:
+            self.__fetch_full(root)
+        found = {}
+        missing = []
+        level = [root]
+        edges = {}
+        reached = 0
+        while level:
+            self.__fetch(level)
+            following = {}
+            for key in level:
+                elem = self.cache.get(key)
+                if elem is None:
+                    missing.append(key)
+                    continue
+                found[key] = elem
+                if depth is not None and reached >= depth:
+                    continue
+                for child in self.__children(elem):
+                    if key[0] == 'relation' and child[0] == 'relation':
+                        edges.setdefault(key[1], []).append(child[1])
+                    if child not in found:
+                        following[child] = None
+            if depth is not None and reached >= depth:
+                break
+            level = [key for key in following if key not in found]
+            if level:
+                reached += 1
+        return {'elements': found, 'missing': missing, 'cycles': _cycles(edges), 'depth': reached}
+
+    def __children(self, elem: Element) -> list:
+        if isinstance(elem, Relation):
+            return [(member['type'], str(member['ref'])) for member in elem.members]
+        if isinstance(elem, Way) and self.way_nodes:
+            return [('node', str(ref)) for ref in elem.nodes]
+        return []
+
+    def __fetch_full(self, key: tuple):
+        try:
+            elems = self.api.get_full_element(*key)
+        except NoneFoundError:
+            self.cache[key] = None
+            return
+        finally:
+            self.requests += 1
+        self.fetched += len(elems)
+        for elem in elems:
+            self.cache.setdefault((elem.e_type, str(elem.id)), elem)
+
+    def __fetch(self, keys: list):
+        wanted = {}
+        for e_type, eid in keys:
+            if (e_type, eid) not in self.cache:
+                wanted.setdefault(e_type, []).append(eid)
+        for e_type, ids in wanted.items():
+            elems, report = self.api.get_elements_bulk(e_type, ids)
+            self.requests += len(report)
+            self.fetched += len(elems)
+            for elem in elems:
+                self.cache[(e_type, str(elem.id))] = elem
+            for chunk in report:
+                for eid in chunk['missing'] + chunk['deleted']:
+                    self.cache[(e_type, eid)] = None
+            logger.debug(f'fetched {len(elems)} of {len(ids)} {e_type}s')
+
+
+def _cycles(edges: dict) -> list:
+    """
+    :param edges: {relation id: [member relation ids]}
+    :returns: every cycle once as list of relation ids, starting and ending with the same id
+    """
+    cycles = []
+    seen = set()
+    state = {}
+
+    def visit(rid: str, path: list):
+        state[rid] = 'open'
+        path.append(rid)
+        for child in edges.get(rid, ()):
+            if state.get(child) == 'open':
+                cycle = path[path.index(child):] + [child]
+                key = frozenset(cycle)
+                if key not in seen:
+                    seen.add(key)
+                    cycles.append(cycle)
+            elif child not in state:
+                visit(child, path)
+        path.pop()
+        state[rid] = 'done'
+
+    for rid in list(edges):
+        if rid not in state:
+            visit(rid, [])
+    return cycles
@@ -0,0 +1,197 @@
+# Grid index answering bbox, radius and nearest queries over fetched elements
+import math
+from pyosmapi.osm_util import *
+
+
+class SpatialIndex:
+    """
+    Uniform grid over Nodes, Ways and Relations, e.g. the result of get_element_bbox or get_full_element.
+    Nodes are indexed by position, ways and relations by the extent of their members found in the index.
+    Elements none of whose members are known have no extent and are listed in unplaced.
+    Extents spanning more than max_cells cells are kept in one list checked by every query instead of the grid.
+
+    :param elems: Elements to index
+    :param cell_size: grid cell edge in degrees
+    :param max_cells: cells an extent is entered in at most
+    """
+
+    def __init__(self, elems=(), cell_size: float = 0.01, max_cells: int = 1024):
+        self.cell_size = cell_size
+        self.max_cells = max_cells
+        self.coords = {}
+        self.extents = {}
+        self.unplaced = []
+        self._points = {}
+        self._boxes = {}
+        self._large = []
+        self._count = 0
+        self.add(elems)
+
+    def __len__(self):
+        return self._count
+
+    def add(self, elems):
+        """
+        indexes more elements, ways and relations are placed after all nodes given with them
+        """
+        elems = list(elems)
+        for elem in elems:
+            if isinstance(elem, Node) and elem.lat is not None:
+                lat, lon = float(elem.lat), float(elem.lon)
+                self.coords[str(elem.id)] = (lat, lon)
+                self._points.setdefault(self.__cell(lat, lon), []).append((lat, lon, elem))
+                self._count += 1
+        relations = {}
+        for elem in elems:
+            if isinstance(elem, Way):
+                self.__place(elem, self.__way_extent(elem))
+            elif isinstance(elem, Relation):
+                relations[str(elem.id)] = elem
+        for elem in relations.values():
+            self.__place(elem, self.__relation_extent(elem, relations, set()))
+
+    def extent(self, elem: Element) -> tuple:
+        """
+        :returns: (min_lon, min_lat, max_lon, max_lat) of an indexed element, None if unknown
+        """
+        if isinstance(elem, Node):
+            coord = self.coords.get(str(elem.id))
+            return None if coord is None else (coord[1], coord[0], coord[1], coord[0])
+        return self.extents.get((elem.e_type, str(elem.id)))
+
+    def bbox(self, bbox: tuple, e_type: str = None) -> list:
+        """
+        :param bbox: (min_lon, min_lat, max_lon, max_lat)
+        :param e_type: only elements of this type
+        :returns: nodes inside bbox, ways and relations whose extent intersects bbox
+        """
+        min_lon, min_lat, max_lon, max_lat = map(float, bbox)
+        found = []
+        if e_type in (None, 'node'):
+            for cell in self.__cells(self._points, min_lon, min_lat, max_lon, max_lat):
+                for lat, lon, node in self._points[cell]:
+                    if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon:
+                        found.append(node)
+        if e_type == 'node':
+            return found
+        seen = set()
+        cells = self.__cells(self._boxes, min_lon, min_lat, max_lon, max_lat)
+        for box, elem in [entry for cell in cells for entry in self._boxes[cell]] + self._large:
+            if id(elem) in seen or e_type not in (None, elem.e_type):
+                continue
+            if box[0] <= max_lon and box[2] >= min_lon and box[1] <= max_lat and box[3] >= min_lat:
+                seen.add(id(elem))
+                found.append(elem)
+        return found
+
+    def radius(self, lat: float, lon: float, rad: float, e_type: str = None) -> list:
+        """
+        :param rad: radius in meters
+        :param e_type: only elements of this type
+        :returns: [(distance in meters, element)] sorted by distance, for ways and relations
+            the distance to the nearest point of their extent
+        """
+        found = []
+        for elem in self.bbox(create_bbox(lat, lon, rad), e_type):
+            box = self.extent(elem)
+            distance = haversine(lat, lon, min(max(lat, box[1]), box[3]), min(max(lon, box[0]), box[2]))
+            if distance <= rad:
+                found.append((distance, elem))
+        found.sort(key=lambda item: item[0])
+        return found
+
+    def nearest(self, lat: float, lon: float, k: int = 1, max_rad: float = None) -> list:
+        """
+        :param k: number of nodes
+        :param max_rad: ignore nodes further away, in meters
+        :returns: [(distance in meters, Node)] of the k nearest nodes sorted by distance
+        """
+        if not self._points:
+            return []
+        cx, cy = self.__cell(lat, lon)
+        # every ring of cells searched adds at least ring_m meters to the covered distance
+        cos_lat = max(math.cos(math.radians(min(abs(lat) + self.cell_size, 90.0))), 1e-6)
+        ring_m = math.radians(self.cell_size) * EARTH_RAD * cos_lat
+        xs = [cell[0] for cell in self._points]
+        ys = [cell[1] for cell in self._points]
+        max_ring = max(abs(cx - min(xs)), abs(cx - max(xs)), abs(cy - min(ys)), abs(cy - max(ys)))
+        best = []
+        ring = 0
+        while ring <= max_ring:
+            for cell in self.__ring(cx, cy, ring):
+                for p_lat, p_lon, node in self._points.get(cell, ()):
+                    best.append((haversine(lat, lon, p_lat, p_lon), node))
+            best.sort(key=lambda item: item[0])
+            del best[k:]
+            reach = ring * ring_m
+            if (len(best) >= k and best[-1][0] <= reach) or (max_rad is not None and reach > max_rad):
+                break
+            ring += 1
+        return [item for item in best if max_rad is None or item[0] <= max_rad]
+
+    def __place(self, elem: Element, box: tuple):
+        if box is None:
+            self.unplaced.append(elem)
+            return
+        self.extents[(elem.e_type, str(elem.id))] = box
+        self._count += 1
+        x0, y0 = self.__cell(box[1], box[0])
+        x1, y1 = self.__cell(box[3], box[2])
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > self.max_cells:
+            self._large.append((box, elem))
+            return
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                self._boxes.setdefault((x, y), []).append((box, elem))
+
+    def __way_extent(self, way: Way) -> tuple:
+        points = [self.coords[str(ref)] for ref in way.nodes if str(ref) in self.coords]
+        if not points:
+            return None
+        lats = [point[0] for point in points]
+        lons = [point[1] for point in points]
+        return min(lons), min(lats), max(lons), max(lats)
+
+    def __relation_extent(self, relation: Relation, relations: dict, path: set) -> tuple:
+        path.add(str(relation.id))
+        boxes = []
+        for member in relation.members:
+            ref = str(member['ref'])
+            if member['type'] == 'node' and ref in self.coords:
+                lat, lon = self.coords[ref]
+                boxes.append((lon, lat, lon, lat))
+            elif member['type'] == 'relation' and ref in relations and ref not in path:
+                boxes.append(self.extents.get(('relation', ref)) or
+                             self.__relation_extent(relations[ref], relations, path))
+            else:
+                boxes.append(self.extents.get((member['type'], ref)))
+        boxes = [box for box in boxes if box is not None]
+        if not boxes:
+            return None
+        return (min(box[0] for box in boxes), min(box[1] for box in boxes),
+                max(box[2] for box in boxes), max(box[3] for box in boxes))
+
+    def __cell(self, lat: float, lon: float) -> tuple:
+        return math.floor(lon / self.cell_size), math.floor(lat / self.cell_size)
+
+    def __cells(self, grid: dict, min_lon: float, min_lat: float, max_lon: float, max_lat: float) -> list:
+        """
+        :returns: occupied cells of grid overlapping the bbox
+        """
+        x0, y0 = self.__cell(min_lat, min_lon)
+        x1, y1 = self.__cell(max_lat, max_lon)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(grid):
+            return [cell for cell in grid if x0 <= cell[0] <= x1 and y0 <= cell[1] <= y1]
+        return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1) if (x, y) in grid]
+
+    @staticmethod
+    def __ring(cx: int, cy: int, ring: int):
+        if ring == 0:
+            yield cx, cy
+            return
+        for x in range(cx - ring, cx + ring + 1):
+            yield x, cy - ring
+            yield x, cy + ring
+        for y in range(cy - ring + 1, cy + ring):
+            yield cx - ring, y
+            yield cx + ring, y
@@ -0,0 +1,328 @@
+# XML parsers and serializers shared by OsmApi and AsyncOsmApi
+import xml.etree.ElementTree as ElemTree
+from pyosmapi.osm_util import *
+
+
+def parse_capabilities(xml: str) -> dict:
+    tree = ElemTree.fromstring(xml)
+    capability = {}
+    for item in tree.find('api').iter():
+        capability[item.tag] = item.attrib
+    blacklist = []
+    for item in tree.findall('policy/imagery/blacklist'):
+        blacklist.append(item.get('regex'))
+    capability['image_blacklist'] = blacklist
+    return capability
+
+
+def parse_permissions(xml: str) -> set:
+    tree = ElemTree.fromstring(xml)
+    permissions = set()
+    for item in tree.findall('permissions/permission'):
+        permissions.add(item.get('name'))
+    return permissions if len(permissions) else None
+
+
+def serial_changeset(tags: dict) -> bytes:
+    root = ElemTree.Element('osm')
+    cs = ElemTree.SubElement(root, 'changeset')
+    try:
+        kv_serial(tags, cs)
+    except AttributeError:
+        pass
+    return ElemTree.tostring(root)
+
+
+def changeset_parser(tree: ElemTree.Element, timestamps: str = 'datetime') -> ChangeSet:
+    tags = kv_parser(tree.findall('tag'))
+    cs_prop = {}
+    for key in tree.keys():
+        cs_prop[key] = tree.get(key)
+
+    com_xml = tree.findall('discussion/comment')
+    comments = []
+    for com in com_xml:
+        comments.append(Comment(com.find('text').text, com.get('uid'), com.get('user'),
+                                convert_timestamp(com.get('date'), timestamps)))
+    try:
+        bbox = cs_prop['min_lon'], cs_prop['min_lat'], cs_prop['max_lon'], cs_prop['max_lat']
+    except KeyError:
+        bbox = (None, None, None, None)
+    created = convert_timestamp(cs_prop['created_at'], timestamps)
+    closed = convert_timestamp(cs_prop.get('closed_at'), timestamps)
+    ch_set = ChangeSet(cs_prop['id'], cs_prop['user'], cs_prop['uid'], created,
+                       cs_prop['open'], bbox, closed, tags, comments)
+    return ch_set
+
+
+def parse_diff_result(xml: str) -> list:
+    changes = []
+    tree = ElemTree.fromstring(xml)
+    for item in tree.iter():
+        item: ElemTree.Element
+        line = {'type': item.tag, 'old_id': item.get('old_id')}
+        if item.get('new_id'):
+            line['new_id'] = item.get('new_id')
+            line['new_version'] = item.get('new_version')
+        changes.append(line)
+    return changes
+
+
+def parse_elem(elem: ElemTree.Element, timestamps: str = 'datetime', lazy: bool = False):
+    if lazy:
+        if elem.tag == 'node':
+            return LazyNode(elem)
+        elif elem.tag == 'way':
+            return LazyWay(elem)
+        elif elem.tag == 'relation':
+            return LazyRelation(elem)
+        return elem
+    eid = elem.get('id')
+    version = int(elem.get('version'))
+    changeset = elem.get('changeset')
+    cr_date = convert_timestamp(elem.get('timestamp'), timestamps)
+    user = elem.get('user')
+    uid = elem.get('uid')
+    visible = elem.get('visible') != 'false'
+    lat = elem.get('lat')  # lan & lon only type node
+    lon = elem.get('lon')
+
+    nodes = []
+    for node in elem.findall('nd'):
+        nodes.append(node.get('ref'))
+
+    members = []
+    for member in elem.findall('member'):
+        mem = {}
+        for item in member.keys():
+            mem[item] = member.get(item)
+        members.append(mem)
+
+    if elem.tag == 'node':
+        return Node(eid, lat, lon, version, changeset, user, uid, cr_date, visible,
+                    kv_parser(elem.findall('tag')))
+    elif elem.tag == 'way':
+        return Way(eid, nodes, version, changeset, user, uid, cr_date, visible,
+                   kv_parser(elem.findall('tag')))
+    elif elem.tag == 'relation':
+        return Relation(eid, members, version, changeset, user, uid, cr_date, visible,
+                        kv_parser(elem.findall('tag')))
+    return elem
+
+
+def serial_elem(elem: Element, is_create: bool = False) -> str:
+    root = ElemTree.Element('osm')
+    doc = ElemTree.Element('None')
+    if not is_create:
+        params = {'id': elem.id, 'version': str(elem.version), 'changeset': str(elem.changeset),
+                  'user': elem.user, 'uid': str(elem.uid),
+                  'visible': str(elem.visible), 'timestamp': elem.created}
+    else:
+        params = {'changeset': str(elem.changeset)}
+    if isinstance(elem, Node):
+        params['lat'] = str(elem.lat)
+        params['lon'] = str(elem.lon)
+        doc = ElemTree.SubElement(root, "node", params)
+    elif isinstance(elem, Way):
+        doc = ElemTree.SubElement(root, "way", params)
+        for ref in elem.nodes:
+            ElemTree.SubElement(doc, 'nd', {'ref': ref})
+    elif isinstance(elem, Relation):
+        doc = ElemTree.SubElement(root, "relation", params)
+        for member in elem.members:
+            ElemTree.SubElement(doc, 'member', member)
+    kv_serial(elem.tags, doc)
+
+    return ElemTree.tostring(root).decode()
+
+
+def serial_change_elem(elem: Element, action: str, cid: int = None) -> bytes:
+    """
+    :param elem: Node, Way or Relation, new elements carry a negative placeholder id
+    :param action: 'create', 'modify' or 'delete'
+    :param cid: changeset id, defaults to elem.changeset
+    :returns: the element as it is placed in an osmChange block
+    """
+    params = {'id': str(elem.id), 'changeset': str(elem.changeset if cid is None else cid)}
+    if action != 'create':
+        params['version'] = str(elem.version)
+    if isinstance(elem, Node) and elem.lat is not None:
+        params['lat'] = str(elem.lat)
+        params['lon'] = str(elem.lon)
+    doc = ElemTree.Element(elem.e_type, params)
+    if action != 'delete':
+        if isinstance(elem, Way):
+            for ref in elem.nodes:
+                ElemTree.SubElement(doc, 'nd', {'ref': str(ref)})
+        elif isinstance(elem, Relation):
+            for member in elem.members:
+                ElemTree.SubElement(doc, 'member', {k: str(v) for k, v in member.items()})
+        kv_serial(elem.tags, doc)
+    return ElemTree.tostring(doc)
+
+
+class OsmChange:
+    """
+    osmChange document serialized while it is read, e.g. by OsmApi.diff_upload with chunked transfer encoding.
+    Blocks keep the iterables they are given, elements are turned into xml one chunk at a time,
+    so a generator of elements is never held in memory as a whole.
+    A block given a generator can only be read once.
+    check, if set, is called as check(elem, count) before each element is serialized, count starting at 1.
+    OsmApi.diff_upload sets it to enforce the server limits on blocks it can not count in advance.
+
+    :param cid: changeset id written into every element, defaults to the changeset of each element
+    :param generator: generator attribute of the document
+    :param chunk_size: elements serialized into one chunk of bytes
+    """
+
+    def __init__(self, cid: int = None, generator: str = 'pyosmapi', chunk_size: int = 500):
+        self.cid = cid
+        self.generator = generator
+        self.chunk_size = chunk_size
+        self.blocks = []
+        self.check = None
+        self._read = False
+
+    def create(self, elems) -> 'OsmChange':
+        """
+        :param elems: Element or iterable of Elements with negative placeholder ids
+        """
+        return self.__add('create', elems)
+
+    def modify(self, elems) -> 'OsmChange':
+        """
+        :param elems: Element or iterable of Elements carrying their current version
+        """
+        return self.__add('modify', elems)
+
+    def delete(self, elems, if_unused: bool = False) -> 'OsmChange':
+        """
+        :param elems: Element or iterable of Elements carrying their current version
+        :param if_unused: skip elements still used by others instead of failing the upload
+        """
+        return self.__add('delete', elems, if_unused)
+
+    def __add(self, action: str, elems, if_unused: bool = False) -> 'OsmChange':
+        if isinstance(elems, Element):
+            elems = [elems]
+        self.blocks.append((action, elems, if_unused))
+        return self
+
+    @property
+    def replayable(self) -> bool:
+        """
+        :returns: False if a block was given a generator, the document can then be read only once
+        """
+        return not any(iter(elems) is elems for _, elems, _ in self.blocks)
+
+    def __iter__(self):
+        if self._read and not self.replayable:
+            raise ValueError('OsmChange built from generators can only be read once')
+        self._read = True
+        yield '<osmChange version="0.6" generator="{}">'.format(self.generator).encode()
+        count = 0
+        for action, elems, if_unused in self.blocks:
+            chunk = [b'<delete if-unused="true">' if if_unused else '<{}>'.format(action).encode()]
+            for elem in elems:
+                count += 1
+                if self.check is not None:
+                    self.check(elem, count)
+                chunk.append(serial_change_elem(elem, action, self.cid))
+                if len(chunk) >= self.chunk_size:
+                    yield b''.join(chunk)
+                    chunk = []
+            chunk.append('</{}>'.format(action).encode())
+            yield b''.join(chunk)
+        yield b'</osmChange>'
+
+    def tobytes(self) -> bytes:
+        return b''.join(self)
+
+
+def parse_meta_gpx(xml: str, timestamps: str = 'datetime') -> dict:
+    tree = ElemTree.fromstring(xml)
+    ret = tree.find('gpx_file').attrib
+    ret['timestamp'] = convert_timestamp(ret['timestamp'], timestamps)
+    ret['description'] = tree.find('gpx_file/description').text
+    tags = []
+    for tag in tree.findall('gpx_file/tag'):
+        tags.append(tag.text)
+    ret['tags'] = tags
+    return ret
+
+
+def parse_gpx_info(xml: str, timestamps: str = 'datetime') -> list:
+    tree = ElemTree.fromstring(xml)
+    lst = []
+    for item in tree.findall('gpx_file'):
+        attrib = item.attrib
+        attrib['timestamp'] = convert_timestamp(attrib['timestamp'], timestamps)
+        for info in item:
+            attrib[info.tag] = info.text
+        lst.append(attrib)
+    return lst
+
+
+def parse_user(xml: str) -> list:
+    tree = ElemTree.fromstring(xml)
+    users = []
+    for user in tree.findall('user'):
+        users.append({'uid': user.get('id'),
+                      'name': user.get('display_name'),
+                      'cr_date': user.get('account_created'),
+                      'description': user.find('description').text,
+                      'terms': bool(user.find('contributor-terms').get('agreed')),
+                      'changeset_count': int(user.find('changesets').get('count')),
+                      'traces_count': int(user.find('traces').get('count'))})
+    return users
+
+
+def serial_preferences(pref: dict) -> str:
+    root = ElemTree.Element('osm')
+    prefs = ElemTree.SubElement(root, 'preferences')
+    for key, value in pref.items():
+        ElemTree.SubElement(prefs, 'preference', {'k': key, 'v': value})
+    return ElemTree.tostring(root).decode()
+
+
+def parse_notes(tree: ElemTree.Element, timestamps: str = 'datetime') -> list:
+    lst = []
+    for item in tree.findall('note'):
+        lon = item.get('lon')
+        lat = item.get('lat')
+        nid = item.find('id').text
+        main_created = convert_timestamp(item.find('date_created').text, timestamps)
+        is_open = item.find('status').text
+        closed = None
+        if not is_open == 'closed':
+            is_open = True
+        else:
+            is_open = False
+            closed = convert_timestamp(item.find('date_closed').text, timestamps)
+
+        comments = []
+        for comment in item.findall('comments/comment'):
+            created = convert_timestamp(comment.find('date').text, timestamps)
+            uid = comment.find('uid').text
+            user = comment.find('user').text
+            text = comment.find('text').text
+            action = comment.find('action').text
+            comments.append(Comment(text, uid, user, created, action))
+        lst.append(Note(nid, lat, lon, main_created, is_open, comments, closed))
+    return lst
+
+
+def kv_parser(lst: list) -> dict:
+    """
+    :param lst: list of tags form <tag k="some" v="value"/>
+    :return: dictionary of key value pairs
+    """
+    tags = {}
+    for item in lst:
+        tags[item.get('k')] = item.get('v')
+    return tags
+
+
+def kv_serial(tags: dict, parent: ElemTree.Element):
+    for key, value in tags.items():
+        ElemTree.SubElement(parent, 'tag', {'k': key, 'v': value})
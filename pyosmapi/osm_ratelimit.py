@@ -0,0 +1,167 @@
+# Client side request scheduling against the API rate limits
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from http import HTTPStatus
+import threading
+import time
+
+# 429 Too Many Requests (uploads) and 509 Bandwidth Limit Exceeded (downloads)
+THROTTLE_STATUS = (HTTPStatus.TOO_MANY_REQUESTS, 509)
+
+
+class _Bucket:
+    def __init__(self, rate: float, burst: int):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.stamp = time.monotonic()
+        self.blocked_until = 0.0
+        self.queue = deque()
+        self.sent = 0
+        self.throttled = 0
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+
+class RateLimiter:
+    """
+    Token bucket per host shared by all threads sending through one or more OsmApi instances.
+    Waiting requests are served first come first served per host.
+    The rate is cut by decrease on every 429 / 509 answer and grows back by increase * rate per
+    successful request (AIMD), a Retry-After header blocks the host for the given time.
+
+    :param rate: requests per second allowed per host
+    :param burst: requests that may be sent at once after an idle period
+    :param hosts: {host: (rate, burst)} overriding rate and burst for single hosts
+    :param min_rate: the adaptive rate never drops below this
+    :param decrease: factor applied to the rate on a throttling answer
+    :param increase: share of the configured rate regained per successful request
+    :param backoff: seconds a host is blocked after a throttling answer without Retry-After
+    :param max_throttled: throttling answers retried per request before RateLimitError is raised
+    """
+
+    def __init__(self, rate: float = 10.0, burst: int = 10, hosts: dict = None, min_rate: float = 0.2,
+                 decrease: float = 0.5, increase: float = 0.05, backoff: float = 5.0, max_throttled: int = 5):
+        self.default = (rate, burst)
+        self.hosts = dict(hosts or {})
+        self.min_rate = min_rate
+        self.decrease = decrease
+        self.increase = increase
+        self.backoff = backoff
+        self.max_throttled = max_throttled
+        self._buckets = {}
+        self._cond = threading.Condition()
+
+    def acquire(self, host: str):
+        """
+        blocks until a request to host may be sent
+        """
+        with self._cond:
+            bucket = self.__bucket(host)
+            ticket = object()
+            bucket.queue.append(ticket)
+            try:
+                while True:
+                    wait = None
+                    if bucket.queue[0] is ticket:
+                        now = time.monotonic()
+                        bucket.refill(now)
+                        wait = max(bucket.blocked_until - now, (1 - bucket.tokens) / bucket.rate)
+                        if wait <= 0:
+                            bucket.tokens -= 1
+                            bucket.sent += 1
+                            return
+                    self._cond.wait(wait)
+            finally:
+                bucket.queue.remove(ticket)
+                self._cond.notify_all()
+
+    def success(self, host: str):
+        with self._cond:
+            bucket = self.__bucket(host)
+            bucket.rate = min(bucket.max_rate, bucket.rate + bucket.max_rate * self.increase)
+
+    def throttled(self, host: str, retry_after: float = None):
+        """
+        slows host down after a 429 / 509 answer
+
+        :param retry_after: seconds from the Retry-After header
+        """
+        with self._cond:
+            bucket = self.__bucket(host)
+            bucket.throttled += 1
+            bucket.rate = max(self.min_rate, bucket.rate * self.decrease)
+            bucket.tokens = 0.0
+            wait = self.backoff if retry_after is None else retry_after
+            bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + wait)
+            self._cond.notify_all()
+
+    def rate(self, host: str) -> float:
+        """
+        :returns: requests per second currently allowed for host
+        """
+        with self._cond:
+            return self.__bucket(host).rate
+
+    def queue_depth(self, host: str = None) -> int:
+        """
+        :returns: requests waiting for host, for all hosts if None
+        """
+        with self._cond:
+            if host is not None:
+                return len(self.__bucket(host).queue)
+            return sum(len(bucket.queue) for bucket in self._buckets.values())
+
+    def stats(self) -> dict:
+        """
+        :returns: {host: {rate, queued, sent, throttled, blocked}} with blocked as seconds left
+        """
+        with self._cond:
+            now = time.monotonic()
+            return {host: {'rate': bucket.rate, 'queued': len(bucket.queue), 'sent': bucket.sent,
+                           'throttled': bucket.throttled, 'blocked': max(0.0, bucket.blocked_until - now)}
+                    for host, bucket in self._buckets.items()}
+
+    def __bucket(self, host: str) -> _Bucket:
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = self._buckets[host] = _Bucket(*self.hosts.get(host, self.default))
+        return bucket
+
+
+def parse_retry_after(value: str) -> float:
+    """
+    :param value: Retry-After header, either seconds or a http date
+    :returns: seconds to wait, None if missing or not readable
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def replayable(body) -> bool:
+    """
+    :returns: False for request bodies that can only be sent once: iterators, file objects and bodies
+        marking themselves with replayable = False (OsmChange of generators, MultipartStream of a pipe)
+    """
+    if body is None or isinstance(body, (str, bytes, bytearray, dict, list, tuple)):
+        return True
+    if hasattr(body, 'replayable'):
+        return body.replayable
+    if hasattr(body, 'read'):
+        return False
+    try:
+        return iter(body) is not body
+    except TypeError:
+        return True
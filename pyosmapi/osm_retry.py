@@ -0,0 +1,85 @@
+# Retry of transient failures, limited to requests that cannot be applied twice
+from http import HTTPStatus
+import random
+import re
+import threading
+import requests
+from urllib3.exceptions import NewConnectionError
+
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS'))
+TRANSIENT_STATUS = frozenset((HTTPStatus.INTERNAL_SERVER_ERROR, HTTPStatus.BAD_GATEWAY,
+                              HTTPStatus.SERVICE_UNAVAILABLE, HTTPStatus.GATEWAY_TIMEOUT))
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter.
+
+    - reads (GET, HEAD, OPTIONS) are retried on connection errors, timeouts and 500 / 502 / 503 / 504
+    - writes are only retried if the connection could not be opened, the request never reached the server.
+      A create_element or diff_upload that might have been applied is never sent twice.
+
+    :param retries: retries per call on top of the first attempt
+    :param backoff: base delay in seconds, attempt n waits up to backoff * 2 ** n
+    :param max_backoff: upper bound of a single delay
+    :param status: status codes retried for reads
+    """
+
+    def __init__(self, retries: int = 3, backoff: float = 0.5, max_backoff: float = 30.0,
+                 status: frozenset = TRANSIENT_STATUS):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.status = status
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def retry_error(self, method: str, attempt: int, error: requests.RequestException) -> bool:
+        if attempt >= self.retries:
+            return False
+        if method.upper() in IDEMPOTENT_METHODS:
+            return isinstance(error, (requests.ConnectionError, requests.Timeout))
+        return not_sent(error)
+
+    def retry_status(self, method: str, attempt: int, status_code: int) -> bool:
+        return attempt < self.retries and method.upper() in IDEMPOTENT_METHODS and status_code in self.status
+
+    def delay(self, attempt: int, retry_after: float = None) -> float:
+        """
+        :returns: seconds to wait before retry number attempt + 1, at least retry_after
+        """
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        return delay if retry_after is None else max(delay, retry_after)
+
+    def record(self, method: str, url: str, retries: int, failed: bool):
+        call = call_name(method, url)
+        with self._lock:
+            counts = self._counts.setdefault(call, {'calls': 0, 'retries': 0, 'failed': 0})
+            counts['calls'] += 1
+            counts['retries'] += retries
+            counts['failed'] += failed
+
+    def stats(self) -> dict:
+        """
+        :returns: {'GET /api/0.6/node/{id}': {calls, retries, failed}}, failed counts calls given up after retrying
+        """
+        with self._lock:
+            return {call: dict(counts) for call, counts in self._counts.items()}
+
+
+def call_name(method: str, url: str) -> str:
+    """
+    :returns: method and url path with ids replaced, e.g. 'GET /api/0.6/node/{id}/history'
+    """
+    path = requests.utils.urlparse(url).path
+    return method.upper() + ' ' + re.sub(r'/-?\d+(?=/|$)', '/{id}', path)
+
+
+def not_sent(error: requests.RequestException) -> bool:
+    """
+    :returns: True if the connection failed before any byte of the request was sent
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
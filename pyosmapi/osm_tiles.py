@@ -0,0 +1,152 @@
+# Concurrent quadtree sweep over bboxes the API refuses to answer in one request
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from http import HTTPStatus
+import logging
+import time
+import requests
+from pyosmapi.exceptions import RateLimitError, LimitExceededError
+
+logger = logging.getLogger(__name__)
+
+TRANSIENT_ERRORS = (requests.ConnectionError, requests.Timeout, RateLimitError)
+
+# parts of the 400 answers of the API for a bbox too large or holding too many nodes
+REFUSED_MESSAGES = ('too many nodes', 'maximum bbox size', 'smaller area')
+
+
+def check_bbox(bbox: tuple):
+    """
+    :raises ValueError: bbox out of range or minima not less than maxima
+    """
+    min_lon, min_lat, max_lon, max_lat = map(float, bbox)
+    if not (-180 <= min_lon < max_lon <= 180 and -90 <= min_lat < max_lat <= 90):
+        raise ValueError(f'invalid bbox {bbox}, expected (min_lon, min_lat, max_lon, max_lat) with minima '
+                         f'less than maxima')
+
+
+def bbox_refused(error: Exception) -> bool:
+    """
+    :returns: True if error is the refusal of a bbox too large or holding too many elements,
+        any other error (bad parameter, server error) must not be split into more requests
+    """
+    if isinstance(error, LimitExceededError):
+        return str(error.message).startswith('bbox area')
+    if isinstance(error, requests.HTTPError):
+        response = error.response
+        if response is None or response.status_code != HTTPStatus.BAD_REQUEST:
+            return False
+        text = response.text
+    elif isinstance(error, ValueError):
+        text = str(error)
+    else:
+        return False
+    return any(message in text.lower() for message in REFUSED_MESSAGES)
+
+
+def split_bbox(bbox: tuple) -> list:
+    """
+    :param bbox: (min_lon, min_lat, max_lon, max_lat)
+    :returns: the four quadrants of bbox
+    """
+    min_lon, min_lat, max_lon, max_lat = map(float, bbox)
+    mid_lon = (min_lon + max_lon) / 2
+    mid_lat = (min_lat + max_lat) / 2
+    return [(min_lon, min_lat, mid_lon, mid_lat), (mid_lon, min_lat, max_lon, mid_lat),
+            (min_lon, mid_lat, mid_lon, max_lat), (mid_lon, mid_lat, max_lon, max_lat)]
+
+
+class TileSweep:
+    """
+    Fetches tiles concurrently and splits every tile the server refuses into its quadrants.
+
+    :param fetch: callable(bbox) returning the result of one tile
+    :param refused: callable(exception) -> bool, True if the tile has to be split
+    :param full: callable(result) -> bool, True if the result was cut off at a limit. The result is yielded
+        and the tile split anyway.
+    :param workers: tiles fetched at once
+    :param max_depth: splits below the starting tiles, a tile still refused at that depth is reported as failed
+    :param retries: retries of a tile failing with a connection error, timeout or RateLimitError
+    :param backoff: seconds before the first retry of a tile, doubled for every further one
+    """
+
+    def __init__(self, fetch, refused=None, full=None, workers: int = 4, max_depth: int = 8, retries: int = 2,
+                 backoff: float = 1.0):
+        self.fetch = fetch
+        self.refused = refused or (lambda e: False)
+        self.full = full or (lambda result: False)
+        self.workers = workers
+        self.max_depth = max_depth
+        self.retries = retries
+        self.backoff = backoff
+        self.tiles = []
+
+    def run(self, tiles: list):
+        """
+        :param tiles: starting bboxes (min_lon, min_lat, max_lon, max_lat)
+        :returns: generator of (bbox, result) in order of completion. On an error or when the generator is closed
+            tiles not started yet are cancelled, only the ones in flight are waited for.
+        """
+        self.tiles = []
+        with ThreadPoolExecutor(self.workers) as pool:
+            pending = {pool.submit(self.__fetch, bbox): (bbox, 0) for bbox in tiles}
+            try:
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        bbox, depth = pending.pop(future)
+                        record, result, split = future.result()
+                        record['depth'] = depth
+                        if split and depth >= self.max_depth:
+                            record['status'] = 'failed'
+                            logger.warning(f'tile {bbox} still refused at depth {depth}')
+                        elif split:
+                            record['status'] = 'split'
+                            for quadrant in split_bbox(bbox):
+                                pending[pool.submit(self.__fetch, quadrant)] = (quadrant, depth + 1)
+                        self.tiles.append(record)
+                        if record['error'] is None and result is not None:
+                            yield bbox, result
+            finally:
+                # a failed tile or a consumer stopping early must not wait for the queued tiles
+                for future in pending:
+                    future.cancel()
+
+    def report(self) -> dict:
+        """
+        :returns: counts of fetched, split and failed tiles, retries, summed and slowest tile seconds
+            and the bboxes of failed tiles
+        """
+        seconds = [tile['seconds'] for tile in self.tiles]
+        return {'tiles': len(self.tiles),
+                'split': sum(tile['status'] == 'split' for tile in self.tiles),
+                'failed': [tile['bbox'] for tile in self.tiles if tile['status'] == 'failed'],
+                'retries': sum(tile['retries'] for tile in self.tiles),
+                'seconds': sum(seconds),
+                'max_seconds': max(seconds, default=0.0),
+                'max_depth': max((tile['depth'] for tile in self.tiles), default=0)}
+
+    def __fetch(self, bbox: tuple) -> tuple:
+        """
+        :returns: (tile record, result, split)
+        """
+        record = {'bbox': bbox, 'status': 'ok', 'retries': 0, 'error': None}
+        start = time.perf_counter()
+        result = None
+        split = False
+        while True:
+            try:
+                result = self.fetch(bbox)
+                split = self.full(result)
+                break
+            except Exception as e:
+                if self.refused(e):
+                    split = True
+                    record['error'] = e
+                    break
+                if not isinstance(e, TRANSIENT_ERRORS) or record['retries'] >= self.retries:
+                    record['seconds'] = time.perf_counter() - start
+                    raise
+                time.sleep(self.backoff * 2 ** record['retries'])
+                record['retries'] += 1
+        record['seconds'] = time.perf_counter() - start
+        return record, result, split
@@ -1,11 +1,71 @@
 import json
 import math
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 
 DEFAULT_OSM_DEV_URL = 'https://master.apis.dev.openstreetmap.org'
 DEFAULT_OSM_URL = 'https://api.openstreetmap.org'
 
+EPOCH = datetime(1970, 1, 1)
+
+
+def decode_timestamp(value) -> datetime:
+    """
+    fast decoding of the fixed OSM timestamp formats, returns naive UTC datetimes like strptime did.
+    Other ISO 8601 forms, e.g. GPX times with fractional seconds or an UTC offset, take the slower full parse.
+
+    :param value: '%Y-%m-%dT%H:%M:%SZ', '%Y-%m-%d %H:%M:%S UTC', other ISO 8601 string, epoch seconds or datetime
+    """
+    if value is None or isinstance(value, datetime):
+        return value
+    if isinstance(value, int):
+        return EPOCH + timedelta(seconds=value)
+    if len(value) == 20 and value[19] == 'Z' or value.endswith(' UTC'):
+        return datetime.fromisoformat(value[:19])
+    stamp = datetime.fromisoformat(value[:-1] + '+00:00' if value.endswith('Z') else value)
+    if stamp.tzinfo is not None:
+        stamp = stamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return stamp
+
+
+def convert_timestamp(value: str, timestamps: str = 'datetime'):
+    """
+    :param value: timestamp string as found in the xml
+    :param timestamps: 'datetime' decodes now, 'raw' keeps the string, 'epoch' keeps int seconds.
+        Models decode raw and epoch values to datetime on first access.
+    """
+    if value is None or timestamps == 'raw':
+        return value
+    if timestamps == 'epoch':
+        return (decode_timestamp(value) - EPOCH) // timedelta(seconds=1)
+    return decode_timestamp(value)
+
+
+class _Timestamp:
+    """
+    datetime attribute kept as it was parsed, raw strings and epoch ints are decoded on first access
+    """
+
+    def __init__(self, slot: str):
+        self.slot = slot
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        value = getattr(obj, self.slot)
+        if value is not None and not isinstance(value, datetime):
+            value = decode_timestamp(value)
+            setattr(obj, self.slot, value)
+        return value
+
+    def __set__(self, obj, value):
+        setattr(obj, self.slot, value)
+
+
 class Element:
+    __slots__ = ('_id', 'tags', 'version', 'changeset', 'user', 'uid', '_created', 'visible')
+    e_type = 'element'
+    created = _Timestamp('_created')
+
     def __init__(self, eid: int, version: int, changeset: int,
                  user: str, uid: int, created: datetime, visible: bool, tags: dict):
         self._id = eid
@@ -16,10 +76,9 @@ class Element:
         self.uid = uid
         self.created = created
         self.visible = visible
-        self.e_type = 'element'
 
     def __repr__(self):
-        return json.dumps(self.__dict__, default=lambda o: _default(o))
+        return json.dumps(dict(_slots_dict(self), e_type=self.e_type), default=lambda o: _default(o))
 
     def __str__(self):
 
@@ -41,40 +100,101 @@ class Element:
 
 
 class Node(Element):
+    __slots__ = ('lat', 'lon')
+    e_type = 'node'
+
     def __init__(self, eid: int, lat: float, lon: float, version: int, changeset: int,
                  user: str, uid: int, created: datetime, visible: bool, tags: dict):
         super().__init__(eid, version, changeset, user, uid, created, visible, tags)
         self.lat = lat
         self.lon = lon
-        self.e_type = 'node'
 
     def __str__(self):
         return super(Node, self).__str__() + f"location:\n\tlatitude: {self.lat}\n\tlongitude: {self.lon}"
 
 
 class Way(Element):
+    __slots__ = ('nodes',)
+    e_type = 'way'
+
     def __init__(self, eid: int, nodes: list, version: int, changeset: int,
                  user: str, uid: int, created: datetime, visible: bool, tags: dict):
         super().__init__(eid, version, changeset, user, uid, created, visible, tags)
         self.nodes = nodes
-        self.e_type = 'way'
 
     def __str__(self):
         return super(Way, self).__str__() + f"nodes: \n\t{self.nodes}"
 
 
 class Relation(Element):
+    __slots__ = ('members',)
+    e_type = 'relation'
+
     def __init__(self, eid: int, members: list, version: int, changeset: int,
                  user: str, uid: int, created: datetime, visible: bool, tags: dict):
         super().__init__(eid, version, changeset, user, uid, created, visible, tags)
         self.members = members
-        self.e_type = 'relation'
 
     def __str__(self):
         return super(Relation, self).__str__() + f"nodes: \n\t{self.members}"
 
 
+_LAZY_FIELDS = {
+    '_id': lambda raw: raw.get('id'),
+    'version': lambda raw: int(raw.get('version')),
+    'changeset': lambda raw: raw.get('changeset'),
+    'user': lambda raw: raw.get('user'),
+    'uid': lambda raw: raw.get('uid'),
+    '_created': lambda raw: raw.get('timestamp'),
+    'visible': lambda raw: raw.get('visible') != 'false',
+    'tags': lambda raw: {tag.get('k'): tag.get('v') for tag in raw.iterfind('tag')},
+    'lat': lambda raw: raw.get('lat'),
+    'lon': lambda raw: raw.get('lon'),
+    'nodes': lambda raw: [nd.get('ref') for nd in raw.iterfind('nd')],
+    'members': lambda raw: [dict(member.attrib) for member in raw.iterfind('member')],
+}
+
+
+class _LazyElement:
+    """
+    decodes each attribute from the parsed xml element on first access and keeps it
+    """
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        decoder = _LAZY_FIELDS.get(name)
+        if decoder is None:
+            raise AttributeError(name)
+        value = decoder(self._raw)
+        setattr(self, name, value)
+        return value
+
+
+class LazyNode(_LazyElement, Node):
+    __slots__ = ('_raw',)
+
+    def __init__(self, raw):
+        self._raw = raw
+
+
+class LazyWay(_LazyElement, Way):
+    __slots__ = ('_raw',)
+
+    def __init__(self, raw):
+        self._raw = raw
+
+
+class LazyRelation(_LazyElement, Relation):
+    __slots__ = ('_raw',)
+
+    def __init__(self, raw):
+        self._raw = raw
+
+
 class Comment:
+    __slots__ = ('text', '_id', 'user', '_created', 'action')
+    created = _Timestamp('_created')
+
     def __init__(self, text: str, uid: int, username: str, created: datetime, action: str = None):
         self.text = text
         self._id = uid
@@ -83,7 +203,7 @@ class Comment:
         self.action = action
 
     def __repr__(self):
-        return json.dumps(self.__dict__)
+        return json.dumps(_slots_dict(self), default=lambda o: _default(o))
 
     def __str__(self):
         return f"\n\tid: {self.id}\n\tusername: {self.user}\n\t" \
@@ -95,6 +215,10 @@ class Comment:
 
 
 class Note:
+    __slots__ = ('_id', 'lat', 'lon', 'open', 'comments', '_created', '_closed')
+    created = _Timestamp('_created')
+    closed = _Timestamp('_closed')
+
     def __init__(self, nid: int, lat: float, lon: float, created: datetime, is_open: bool,
                  comments: list, closed: datetime = None):
         self._id = nid
@@ -106,7 +230,7 @@ class Note:
         self.closed = closed
 
     def __repr__(self):
-        return json.dumps(self.__dict__, default=lambda o: _default(o))
+        return json.dumps(_slots_dict(self), default=lambda o: _default(o))
 
     def __str__(self):
         com_str = ''
@@ -125,6 +249,9 @@ class Note:
 
 
 class Trace:
+    __slots__ = ('_id', 'gpx', 'name', 'username', '_created', 'desc', 'tags', 'visibility')
+    created = _Timestamp('_created')
+
     def __init__(self, tid: int, gpx: str, filename: str, username: str, created: datetime,
                  desc: str = None, tags: set = None, visibility: str = 'trackable'):
         self._id = tid
@@ -137,7 +264,7 @@ class Trace:
         self.visibility = visibility
 
     def __repr__(self):
-        return json.dumps(self.__dict__)
+        return json.dumps(_slots_dict(self), default=lambda o: _default(o))
 
     def __str__(self):
         return f"id: {self.id}\nfilename: {self.name}\nDescription: {self.desc}\ntags: {self.tags}\n" \
@@ -149,6 +276,11 @@ class Trace:
 
 
 class ChangeSet:
+    __slots__ = ('_id', 'user', 'uid', '_created', 'open', 'min_lon', 'min_lat', 'max_lon', 'max_lat',
+                 '_closed', 'tags', 'comments')
+    created = _Timestamp('_created')
+    closed = _Timestamp('_closed')
+
     def __init__(self, cid: int, username: str, uid: int, created: datetime, is_open: bool, bbox: tuple,
                  closed: datetime = None, tags: dict = None, comments: list = None):
         """
@@ -168,7 +300,7 @@ class ChangeSet:
         self.comments = comments or []
 
     def __repr__(self):
-        return json.dumps(self.__dict__, default=lambda o: _default(o))
+        return json.dumps(_slots_dict(self), default=lambda o: _default(o))
 
     def __str__(self):
         com_str = ''
@@ -197,6 +329,48 @@ class ChangeSet:
         return self.min_lon, self.min_lat, self.max_lon, self.max_lat
 
 
+class ChangeSummary:
+    """
+    running totals of an osmChange document, updated per (action, Element) event
+
+    counts: {(action, e_type): number of elements}, bbox: (min_lon, min_lat, max_lon, max_lat)
+    of all nodes carrying coordinates, None while no such node was seen
+    """
+    __slots__ = ('counts', 'min_lon', 'min_lat', 'max_lon', 'max_lat')
+
+    def __init__(self):
+        self.counts = {}
+        self.min_lon = self.min_lat = math.inf
+        self.max_lon = self.max_lat = -math.inf
+
+    def __repr__(self):
+        return json.dumps({'counts': {f'{action} {e_type}': n for (action, e_type), n in self.counts.items()},
+                           'bbox': self.bbox})
+
+    def update(self, action: str, elem: Element):
+        key = (action, elem.e_type)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        if isinstance(elem, Node) and elem.lat is not None:
+            lat, lon = float(elem.lat), float(elem.lon)
+            self.min_lon = min(self.min_lon, lon)
+            self.min_lat = min(self.min_lat, lat)
+            self.max_lon = max(self.max_lon, lon)
+            self.max_lat = max(self.max_lat, lat)
+
+    def count(self, action: str = None, e_type: str = None) -> int:
+        """
+        :returns: number of elements, filtered by action and / or e_type if given
+        """
+        return sum(n for (act, typ), n in self.counts.items()
+                   if action in (None, act) and e_type in (None, typ))
+
+    @property
+    def bbox(self):
+        if self.min_lon > self.max_lon:
+            return None
+        return self.min_lon, self.min_lat, self.max_lon, self.max_lat
+
+
 EARTH_RAD = float(6378000)
 
 
@@ -209,8 +383,8 @@ def create_bbox(lat: float, lon: float, rad: int):
     :param rad: radius in meters
     """
 
-    lat_d = (math.asin(float(rad) / (EARTH_RAD * math.cos(math.pi * lat / 180)))) * 180 / math.pi
-    lon_d = (math.asin(float(rad) / EARTH_RAD)) * 180 / math.pi
+    lat_d = (math.asin(float(rad) / EARTH_RAD)) * 180 / math.pi
+    lon_d = (math.asin(float(rad) / (EARTH_RAD * math.cos(math.pi * lat / 180)))) * 180 / math.pi
 
     dec = 8
 
@@ -222,6 +396,155 @@ def create_bbox(lat: float, lon: float, rad: int):
     return min_lon, min_lat, max_lon, max_lat
 
 
+def create_bboxes(lat, lon, rad):
+    """
+    create_bbox for many points at once, requires numpy
+
+    :param lat: latitudes, array like
+    :param lon: longitudes, array like
+    :param rad: radius in meters, one for all or one per point
+    :returns: numpy array of shape (n, 4) with rows (min_lon, min_lat, max_lon, max_lat),
+        NaN longitudes where the radius reaches over a pole
+    """
+    import numpy as np
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    rad = np.asarray(rad, dtype=np.float64)
+    lat_d = np.degrees(np.arcsin(rad / EARTH_RAD))
+    with np.errstate(invalid='ignore'):
+        lon_d = np.degrees(np.arcsin(rad / (EARTH_RAD * np.cos(np.radians(lat)))))
+    lat_d, lon_d = np.broadcast_arrays(lat_d, lon_d)
+    return np.round(np.stack([lon - lon_d, lat - lat_d, lon + lon_d, lat + lat_d], axis=-1), 8)
+
+
+def merge_bboxes(bboxes, max_area: float = None, max_cells: int = 64) -> list:
+    """
+    merges overlapping or touching bboxes into their common bbox until none overlap anymore.
+    Candidates are looked up in grids of growing cell size starting at the median bbox, not by comparing all pairs.
+
+    :param bboxes: (min_lon, min_lat, max_lon, max_lat) tuples or a numpy array of shape (n, 4)
+    :param max_area: bboxes are not merged if the merged bbox would be larger, e.g. the area limit of the API
+    :param max_cells: grid cells a bbox is entered in at most per grid, larger ones go to the next coarser grid
+    :returns: list of (min_lon, min_lat, max_lon, max_lat)
+    """
+    boxes = [tuple(map(float, bbox)) for bbox in bboxes]
+    if not boxes:
+        return boxes
+    sides = sorted(max(box[2] - box[0], box[3] - box[1]) for box in boxes)
+    cell = sides[len(sides) // 2] or sides[-1] or 1.0
+    sizes = [cell * 16 ** level for level in range(4)]
+    # home[level] holds bboxes whose finest grid is level, within[level] those whose finest grid is level or finer
+    home = [{} for _ in sizes]
+    within = [{} for _ in sizes]
+    large = []
+    # merged bboxes, None where one was merged into a later one
+    merged = []
+    for box in boxes:
+        while True:
+            level, cells = _bbox_level(box, sizes, max_cells)
+            if level is None:
+                candidates = range(len(merged))
+            else:
+                candidates = set(large)
+                candidates.update(index for key in cells for index in within[level].get(key, ()))
+                for coarser in range(level + 1, len(sizes)):
+                    if home[coarser]:
+                        candidates.update(index for key in _bbox_cells(box, sizes[coarser], max_cells)
+                                          for index in home[coarser].get(key, ()))
+            for index in candidates:
+                other = merged[index]
+                if other is None or other[0] > box[2] or other[2] < box[0] or other[1] > box[3] or other[3] < box[1]:
+                    continue
+                union = (min(other[0], box[0]), min(other[1], box[1]), max(other[2], box[2]), max(other[3], box[3]))
+                if max_area is None or (union[2] - union[0]) * (union[3] - union[1]) <= max_area:
+                    # the union is checked again against all bboxes it reaches now
+                    merged[index] = None
+                    box = union
+                    break
+            else:
+                break
+        index = len(merged)
+        merged.append(box)
+        if level is None:
+            large.append(index)
+            continue
+        for key in cells:
+            home[level].setdefault(key, []).append(index)
+        for coarser in range(level, len(sizes)):
+            for key in cells if coarser == level else _bbox_cells(box, sizes[coarser], max_cells):
+                within[coarser].setdefault(key, []).append(index)
+    return [box for box in merged if box is not None]
+
+
+def _bbox_level(bbox: tuple, sizes: list, max_cells: int) -> tuple:
+    """
+    :returns: (finest grid the bbox touches at most max_cells cells of, those cells), (None, []) if there is none
+    """
+    for level, size in enumerate(sizes):
+        cells = _bbox_cells(bbox, size, max_cells)
+        if cells:
+            return level, cells
+    return None, []
+
+
+def _bbox_cells(bbox: tuple, size: float, max_cells: int) -> list:
+    """
+    :returns: grid cells of edge size the bbox touches, empty if more than max_cells
+    """
+    x0, y0 = math.floor(bbox[0] / size), math.floor(bbox[1] / size)
+    x1, y1 = math.floor(bbox[2] / size), math.floor(bbox[3] / size)
+    if (x1 - x0 + 1) * (y1 - y0 + 1) > max_cells:
+        return []
+    return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+
+def tile_bbox(bbox: tuple, max_area: float = 0.25) -> list:
+    """
+    splits a bbox into a grid of equal tiles with an area of at most max_area square degrees
+
+    :param bbox: (min_lon, min_lat, max_lon, max_lat)
+    :param max_area: tile area limit, e.g. area maximum of the capabilities
+    :returns: tiles (min_lon, min_lat, max_lon, max_lat) row by row from south west to north east
+    """
+    min_lon, min_lat, max_lon, max_lat = map(float, bbox)
+    width = max_lon - min_lon
+    height = max_lat - min_lat
+    columns = max(1, math.ceil(width / math.sqrt(max_area)))
+    rows = max(1, math.ceil(height * (width / columns) / max_area)) if width else 1
+    lons = [min_lon + width * i / columns for i in range(columns)] + [max_lon]
+    lats = [min_lat + height * i / rows for i in range(rows)] + [max_lat]
+    return [(lons[x], lats[y], lons[x + 1], lats[y + 1]) for y in range(rows) for x in range(columns)]
+
+
+def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    :returns: great circle distance in meters
+    """
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    a = math.sin((phi2 - phi1) / 2) ** 2 + \
+        math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RAD * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _slots_dict(obj) -> dict:
+    """
+    attributes of an object using __slots__, unset slots are left out
+    """
+    if hasattr(obj, '__dict__'):
+        return obj.__dict__
+    attrs = {}
+    for cls in reversed(type(obj).__mro__):
+        for slot in getattr(cls, '__slots__', ()):
+            if slot == '_raw':
+                continue
+            if isinstance(getattr(cls, slot[1:], None), _Timestamp):
+                attrs[slot[1:]] = getattr(obj, slot[1:])
+            elif hasattr(obj, slot):
+                attrs[slot] = getattr(obj, slot)
+    return attrs
+
+
 def _default(obj):
     """Default JSON serializer."""
     import calendar
@@ -235,5 +558,5 @@ def _default(obj):
         )
         return millis
     else:
-        return obj.__dict__
+        return _slots_dict(obj)
     # raise TypeError('Not sure how to serialize %s' % (obj,))
@@ -1,8 +1,17 @@
 import unittest
+import itertools
 import os
+import random
 from pyosmapi import exceptions
 import pyosmapi.osm_api as osmapi
 import pyosmapi.osm_util
+import pyosmapi.osm_parser
+import pyosmapi.osm_bulk
+import pyosmapi.osm_cache
+import pyosmapi.osm_ratelimit
+import pyosmapi.osm_retry
+import pyosmapi.osm_index
+import pyosmapi.osm_geometry
 
 
 class MyTestCase(unittest.TestCase):
@@ -24,6 +33,11 @@ class MyTestCase(unittest.TestCase):
         data = self.osmo.get_api_capabilities()
         print(data)
 
+    def test_preflight(self):
+        with self.assertRaises(exceptions.LimitExceededError):
+            self.osmo.get_element_bbox((13.0, 52.0, 14.0, 53.0))
+        print(self.osmo.get_api_capabilities())
+
     def test_permissions(self):
         data = self.osmo.get_permissions(self.auth())
         print(data)
@@ -53,6 +67,12 @@ class MyTestCase(unittest.TestCase):
         cs = self.osmo.download_changeset(177967)
         print(cs)
 
+    def test_cs_iter(self):
+        summary = pyosmapi.osm_util.ChangeSummary()
+        for action, elem in self.osmo.iter_changeset(177967, summary):
+            print(action, elem.__repr__())
+        print(summary)
+
     def test_cs_upload(self):
         diff = '<osmChange version="0.6" generator="pyosm"> ' \
                '<create> ' \
@@ -66,6 +86,71 @@ class MyTestCase(unittest.TestCase):
         cs = self.osmo.diff_upload(187558, diff, self.auth())
         print(cs)
 
+    def test_cs_upload_stream(self):
+        node = pyosmapi.osm_util.Node(-1, -33.9135123, 151.1173123, None, None, None, None, None, True, {})
+        change = pyosmapi.osm_parser.OsmChange(187558).create(node)
+        print(change.tobytes())
+        cs = self.osmo.diff_upload(187558, change, self.auth())
+        print(cs)
+
+    def test_bulk_upload(self):
+        nodes = [pyosmapi.osm_util.Node(-i, -33.91 - i / 1000, 151.11, None, None, None, None, None, True, {})
+                 for i in range(1, 6)]
+        way = pyosmapi.osm_util.Way(-10, [str(node.id) for node in nodes], None, None, None, None, None, True, {})
+        ids = self.osmo.bulk_upload({'comment': 'test', 'created_by': 'osmate'}, self.auth(),
+                                    create=nodes + [way], chunk_size=3)
+        print(ids)
+
+    def test_changeset_session(self):
+        with self.osmo.changeset_session({'comment': 'test', 'created_by': 'osmate'}, self.auth(),
+                                         max_pending=2) as session:
+            for i in range(3):
+                session.create(pyosmapi.osm_util.Node(None, -33.91 - i / 1000, 151.11, None, None, None, None, None,
+                                                      True, {}))
+        print(session.ids)
+        print(session.changesets)
+
+    def test_changeset_session_conflict(self):
+        class ConflictApi:
+            def __init__(self):
+                self.opened = []
+                self.closed = []
+                self.uploads = 0
+
+            def get_api_capabilities(self):
+                return {'changesets': {'maximum_elements': '10000'}}
+
+            def open_changeset(self, tags, auth):
+                self.opened.append(len(self.opened) + 1)
+                return self.opened[-1]
+
+            def close_changeset(self, cid, auth):
+                self.closed.append(cid)
+
+            def diff_upload(self, cid, xml, auth):
+                self.uploads += 1
+                raise exceptions.ConflictError('Version mismatch: Provided 1, server had: 2 of Node 5')
+
+        api = ConflictApi()
+        node = pyosmapi.osm_util.Node(5, 1, 1, 1, None, None, None, None, True, {})
+        session = pyosmapi.osm_bulk.ChangesetSession(api, {'comment': 'test'}, None)
+        session.edit(node)
+        with self.assertRaises(exceptions.ConflictError):
+            session.flush()
+        self.assertEqual(session.rejected, [('modify', node)])
+        session.flush()
+        session.close()
+        self.assertEqual(api.uploads, 1)
+        self.assertEqual(api.opened, [1])
+        self.assertEqual(api.closed, [1])
+
+        api = ConflictApi()
+        session = pyosmapi.osm_bulk.ChangesetSession(api, {'comment': 'test'}, None)
+        session.edit(node)
+        with self.assertRaises(exceptions.ConflictError):
+            session.close()
+        self.assertEqual(api.opened, api.closed)
+
     def test_cs_comment(self):
         cs = self.osmo.comm_changeset(177967, 'Hallo Welt', self.auth())
         print(cs)
@@ -82,15 +167,71 @@ class MyTestCase(unittest.TestCase):
         rel = self.osmo.get_element('relation', 4304875773)
         print(rel.__repr__())
 
+    def test_raw_timestamps(self):
+        api = osmapi.OsmApi('dev', session=self.osmo.session, timestamps='raw')
+        node = api.get_element('node', 4314858041)
+        print(node._created)
+        print(node.created)
+
+    def test_lazy_elements(self):
+        api = osmapi.OsmApi('dev', session=self.osmo.session, lazy=True)
+        way = api.get_element('way', 201774)
+        print(way.id)
+        print(way.nodes)
+        print(way.__repr__())
+
     def test_get_hist(self):
         node = self.osmo.history_version_element('node', 4314858041)
         print(node.__repr__())
 
+    def test_version_cache(self):
+        cache = pyosmapi.osm_cache.VersionCache(':memory:')
+        api = osmapi.OsmApi('dev', session=self.osmo.session, version_cache=cache)
+        print(api.history_element('node', 4314858041))
+        print(api.history_version_element('node', 4314858041, 1))
+        print(cache.stats())
+
+    def test_conditional_cache(self):
+        api = osmapi.OsmApi('dev', session=self.osmo.session, conditional_cache=pyosmapi.osm_cache.ConditionalCache())
+        print(api.get_element('node', 4314858041))
+        print(api.get_element('node', 4314858041))
+        print(api.conditional_cache.stats())
+
+    def test_rate_limiter(self):
+        limiter = pyosmapi.osm_ratelimit.RateLimiter(rate=2, burst=1)
+        api = osmapi.OsmApi('dev', session=self.osmo.session, rate_limiter=limiter)
+        for _ in range(3):
+            print(api.get_element('node', 4314858041))
+        print(limiter.stats())
+
+    def test_retry_policy(self):
+        policy = pyosmapi.osm_retry.RetryPolicy(retries=2)
+        api = osmapi.OsmApi('dev', session=self.osmo.session, retry_policy=policy)
+        print(api.history_element('node', 4314858041))
+        print(policy.stats())
+
+    def test_get_elements_bulk(self):
+        elems, report = self.osmo.get_elements_bulk('node', list(range(4314858000, 4314859500)))
+        print(len(elems))
+        for chunk in report:
+            print(len(chunk['ids']), chunk['missing'], chunk['deleted'])
+
     def test_get_full_elem(self):
         rel = self.osmo.get_full_element('way', 4305504687)
         for item in rel:
             print(item.__repr__)
 
+    def test_way_geometry(self):
+        resolver = pyosmapi.osm_geometry.GeometryResolver(self.osmo.get_full_element('way', 4305504687))
+        print(resolver.all_ways())
+        print(resolver.way_lengths())
+
+    def test_resolve_relation(self):
+        cache = {}
+        result = self.osmo.resolve_relation(4305504687, cache=cache)
+        print(len(result['elements']), result['missing'], result['cycles'], result['depth'])
+        print(len(self.osmo.resolve_relation(4305504687, cache=cache)['elements']))
+
     def test_get_elem_bbox_pos(self):
         # westlimit=9.3852744541; southlimit=49.1700528219; eastlimit=9.38678722; northlimit=49.1708595043
         print(pyosmapi.osm_util.create_bbox(52.5134, 13.4374, 1000))
@@ -98,6 +239,51 @@ class MyTestCase(unittest.TestCase):
         for item in elems:
             print(item.__repr__)
 
+    def test_bbox_utils(self):
+        bboxes = pyosmapi.osm_util.create_bboxes([52.5134, 52.5140, 48.1371], [13.4374, 13.4380, 11.5754], 1000)
+        print(bboxes)
+        print(pyosmapi.osm_util.merge_bboxes(bboxes, max_area=0.25))
+        print(len(pyosmapi.osm_util.tile_bbox((5.9, 47.3, 15.0, 55.1), 0.25)))
+
+    def test_merge_bboxes(self):
+        def overlap(a, b):
+            return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+        def union(a, b):
+            return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+
+        def brute(boxes):
+            boxes = list(boxes)
+            merged = True
+            while merged:
+                merged = False
+                for i, j in itertools.combinations(range(len(boxes)), 2):
+                    if overlap(boxes[i], boxes[j]):
+                        boxes[i] = union(boxes[i], boxes[j])
+                        del boxes[j]
+                        merged = True
+                        break
+            return sorted(boxes)
+
+        rnd = random.Random(7)
+        small = [(i, 0.0, i + 0.5, 0.5) for i in range(20)]
+        cover = (-1.0, -1.0, 21.0, 1.0)
+        self.assertEqual(pyosmapi.osm_util.merge_bboxes(small + [cover]), [cover])
+        self.assertEqual(pyosmapi.osm_util.merge_bboxes([cover] + small), [cover])
+        for _ in range(300):
+            boxes = []
+            for _ in range(rnd.randint(1, 40)):
+                lon, lat, size = rnd.uniform(0, 10), rnd.uniform(0, 10), rnd.choice((0.01, 0.1, 1, 5))
+                boxes.append((lon, lat, lon + rnd.uniform(0, size), lat + rnd.uniform(0, size)))
+            self.assertEqual(sorted(pyosmapi.osm_util.merge_bboxes(boxes)), brute(boxes))
+            limited = pyosmapi.osm_util.merge_bboxes(boxes, max_area=1.0)
+            for box in boxes:
+                self.assertTrue(any(b[0] <= box[0] and b[1] <= box[1] and b[2] >= box[2] and b[3] >= box[3]
+                                    for b in limited))
+            for a, b in itertools.combinations(limited, 2):
+                merged = union(a, b)
+                self.assertFalse(overlap(a, b) and (merged[2] - merged[0]) * (merged[3] - merged[1]) <= 1.0)
+
     def test_get_elem_bbox_neg(self):
         with self.assertRaises(exceptions.NoneFoundError):
             # westlimit=9.3852744541; southlimit=49.1700528219; eastlimit=9.38678722; northlimit=49.1708595043
@@ -106,17 +292,56 @@ class MyTestCase(unittest.TestCase):
             for item in elems:
                 print(item.__repr__)
 
+    def test_iter_elem_bbox(self):
+        count = 0
+        for item in self.osmo.iter_element_bbox((13.428416654163087, 52.49863874116848,
+                                                 13.446383345836914, 52.52816125883152)):
+            count += 1
+            print(item.__repr__)
+        print(count)
+
+    def test_get_elem_region(self):
+        elems, report = self.osmo.get_element_region((13.3, 52.45, 13.5, 52.55))
+        print(len(elems))
+        print(report)
+
+    def test_get_elem_bbox_columnar(self):
+        store = self.osmo.get_element_bbox_columnar((13.428416654163087, 52.49863874116848,
+                                                     13.446383345836914, 52.52816125883152))
+        print(store)
+        print(store.bbox_mask((13.43, 52.50, 13.44, 52.51)).sum())
+        print(store.way_coords())
+
+    def test_spatial_index(self):
+        elems = self.osmo.get_element_bbox((13.428416654163087, 52.49863874116848,
+                                            13.446383345836914, 52.52816125883152))
+        index = pyosmapi.osm_index.SpatialIndex(elems)
+        print(len(index))
+        print(index.radius(52.5134, 13.4374, 100))
+        print(index.nearest(52.5134, 13.4374, 3))
+
     def test_get_gpx_bbox(self):
         # 46.7723/12.1855
         print(pyosmapi.osm_util.create_bbox(51.4564, -0.214097, 750))
         gpx = self.osmo.get_gpx_bbox(pyosmapi.osm_util.create_bbox(51.4564, -0.214097, 750), 0)
         print(gpx)
 
+    def test_get_gpx_points(self):
+        points = self.osmo.get_gpx_points(pyosmapi.osm_util.create_bbox(51.4564, -0.214097, 750))
+        print(points)
+        print(points[0])
+
     def test_send_gpx(self):
         gpx = open('/home/marvin/Downloads/2020-05-31_15-23_Sun.gpx').read()
         tid = self.osmo.upload_gpx(gpx, 'test_trace.xml', 'test', {'test', 'osmate'}, self.auth())
         print(tid)
 
+    def test_send_gpx_stream(self):
+        with open('/home/marvin/Downloads/2020-05-31_15-23_Sun.gpx', 'rb') as trace:
+            tid = self.osmo.upload_gpx(trace, None, 'test', {'test', 'osmate'}, self.auth(), compress='gz')
+        print(tid)
+        print(self.osmo.upload_gpx_dir('/home/marvin/Downloads', 'test', {'test', 'osmate'}, self.auth()))
+
     def test_get_gpx(self):
         tid = self.osmo.get_gpx(1714, self.auth())
         print(tid)
@@ -137,6 +362,12 @@ class MyTestCase(unittest.TestCase):
         notes = self.osmo.get_notes_bbox((13.428416654163087, 52.49863874116848, 13.446383345836914, 52.52816125883152))
         print(notes[0])
 
+    def test_iter_notes_region(self):
+        report = {}
+        for note in self.osmo.iter_notes_region((13.0, 52.3, 13.8, 52.7), report=report):
+            print(note)
+        print(report)
+
     def test_get_notes_search(self):
         notes = self.osmo.search_note('abc')
         print(notes[0])
@@ -179,6 +410,13 @@ class MyTestCase(unittest.TestCase):
         users = self.osmo.get_users([7634, 7122])
         print(users)
 
+    def test_shared_session(self):
+        with osmapi.OsmApi('dev', session=self.osmo.session) as other:
+            node = other.get_element('node', 4314858041)
+            print(node)
+        self.assertIs(other.session, self.osmo.session)
+        print(self.osmo.get_element('node', 4314858041))
+
 
 if __name__ == '__main__':
     unittest.main()
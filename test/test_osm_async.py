@@ -0,0 +1,27 @@
+import asyncio
+import unittest
+import pyosmapi.osm_async as osmasync
+
+
+class MyTestCase(unittest.TestCase):
+
+    def test_get_node(self):
+        async def run():
+            async with osmasync.AsyncOsmApi('dev') as api:
+                return await api.get_element('node', 4314858041)
+        node = asyncio.run(run())
+        print(node)
+
+    def test_concurrent_notes(self):
+        async def run():
+            async with osmasync.AsyncOsmApi('dev', limit_per_host=4) as api:
+                return await asyncio.gather(api.get_note(22599), api.get_changeset(177967),
+                                            api.get_users([7634, 7122]))
+        note, cs, users = asyncio.run(run())
+        print(note)
+        print(cs)
+        print(users)
+
+
+if __name__ == '__main__':
+    unittest.main()